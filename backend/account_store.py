@@ -0,0 +1,312 @@
+"""Account repository backing the /accounts routes.
+
+Accounts used to live only in old-accounts.json and new-accounts.json, which were
+re-read, merged and rewritten in full on every signup / phone / password update. The
+store below keeps an email -> record hash index hot in memory and writes single rows
+to an embedded SQLite database (WAL mode). The two JSON files are imported once, the
+first time the database is created. They hold legacy plain-text passwords, so they
+live in backend/seed/, not in the statically served public/ directory.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import add_bytes, timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+SEED_DIR = BASE_DIR / "seed"
+OLD_ACCOUNTS_PATH = SEED_DIR / "old-accounts.json"
+NEW_ACCOUNTS_PATH = SEED_DIR / "new-accounts.json"
+ACCOUNTS_DB_PATH = Path(os.getenv("ACCOUNTS_DB_PATH") or (BASE_DIR / "accounts.db"))
+
+
+def _email_key(email: str | None) -> str:
+    return (email or "").strip().lower()
+
+
+def _merge(current: dict, fields: dict) -> dict:
+    """`current` with `fields` applied; a field set to None is removed."""
+    updated = {**current, **fields}
+    for k, v in fields.items():
+        if v is None:
+            updated.pop(k, None)
+    return updated
+
+
+def _matches(current: dict, expected: dict | None) -> bool:
+    return expected is None or all(current.get(k) == v for k, v in expected.items())
+
+
+def read_accounts_file(path: Path) -> list:
+    try:
+        if not path.exists():
+            return []
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+            if isinstance(data, list):
+                return data
+            return data.get("accounts", []) if isinstance(data, dict) else []
+    except Exception:
+        return []
+
+
+class AccountStore:
+    """In-memory account repository; also the base for persistent backends.
+
+    Records are kept in insertion order keyed by lowercased email, so lookups and
+    updates are O(1). `source` is "old" or "new" and mirrors which legacy file the
+    account came from (old overrides new, as in the original merge); accounts signed
+    up since are "new" too.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._index: dict[str, dict] = {}
+        self._sources: dict[str, str] = {}
+        self._version = 0  # bumped on every change; validates cached responses
+
+    # --- persistence hooks (no-ops for the in-memory store) ---
+    def _persist(self, key: str, account: dict, source: str) -> None:
+        pass
+
+    def _refresh(self) -> None:
+        """Pick up changes committed by other processes."""
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes; persistent backends commit them together."""
+        with self._lock:
+            yield self
+
+    # --- public API ---
+    def get(self, email: str) -> dict | None:
+        self._refresh()
+        acc = self._index.get(_email_key(email))
+        return dict(acc) if acc is not None else None
+
+    def exists(self, email: str) -> bool:
+        self._refresh()
+        return _email_key(email) in self._index
+
+    def all(self) -> list:
+        self._refresh()
+        with self._lock:
+            return [dict(acc) for acc in self._index.values()]
+
+    def all_with_sources(self) -> list[tuple[dict, str]]:
+        """(account, source) pairs, in the same order as all()."""
+        self._refresh()
+        with self._lock:
+            return [(dict(acc), self._sources.get(key, "new")) for key, acc in self._index.items()]
+
+    def source(self, email: str) -> str | None:
+        self._refresh()
+        return self._sources.get(_email_key(email))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def version(self) -> int:
+        """Changes whenever the contents may have (including writes by other workers)."""
+        self._refresh()
+        return self._version
+
+    def put(self, account: dict, source: str = "new") -> None:
+        """Insert or replace an account (keyed by its email)."""
+        key = _email_key(account.get("email"))
+        if not key:
+            raise ValueError("account email required")
+        with self._lock:
+            self._persist(key, account, source)
+            self._index[key] = dict(account)
+            self._sources[key] = source
+            self._version += 1
+
+    def add(self, account: dict) -> bool:
+        """Create a new account; returns False if the email is already taken."""
+        key = _email_key(account.get("email"))
+        if not key:
+            raise ValueError("account email required")
+        with self._lock:
+            if key in self._index:
+                return False
+            self.put(account, "new")
+            return True
+
+    def update(self, email: str, expected: dict | None = None, **fields) -> bool:
+        """Set fields on an existing account (None removes a field). Returns False if it
+        does not exist, or if `expected` is given and any of its fields differ."""
+        key = _email_key(email)
+        with self._lock:
+            current = self._index.get(key)
+            if current is None or not _matches(current, expected):
+                return False
+            updated = _merge(current, fields)
+            self.put(updated, self._sources.get(key, "new"))
+            return True
+
+
+class SQLiteAccountStore(AccountStore):
+    """Account store persisted to SQLite (WAL), with the full index cached in memory."""
+
+    def __init__(self, db_path: Path = ACCOUNTS_DB_PATH):
+        super().__init__()
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            " email TEXT PRIMARY KEY,"
+            " source TEXT NOT NULL DEFAULT 'new',"
+            " data TEXT NOT NULL,"
+            " seq INTEGER NOT NULL)"
+        )
+        # New rows take MAX(seq) + 1; without an index that is a full scan per insert
+        self._conn.execute("CREATE INDEX IF NOT EXISTS accounts_seq ON accounts (seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._load()
+
+    @timed("accounts", "load")
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT email, source, data FROM accounts ORDER BY seq").fetchall()
+        index, sources = {}, {}
+        for key, source, data in rows:
+            try:
+                index[key] = json.loads(data)
+                sources[key] = source
+            except ValueError:
+                continue
+        self._index, self._sources = index, sources
+        self._version += 1
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self) -> None:
+        # data_version only moves when *another* connection commits, so this is one
+        # cheap pragma per call and a full reload only after another worker wrote.
+        with self._lock:
+            if self._conn.in_transaction:
+                return
+            if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self._load()
+
+    @timed("accounts", "write")
+    def add(self, account: dict) -> bool:
+        key = _email_key(account.get("email"))
+        if not key:
+            raise ValueError("account email required")
+        data = json.dumps(account, ensure_ascii=False)
+        add_bytes("accounts", "write", len(data))
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO accounts (email, source, data, seq)"
+                    " VALUES (?, 'new', ?, COALESCE((SELECT MAX(seq) FROM accounts), 0) + 1)",
+                    (key, data),
+                )
+            except sqlite3.IntegrityError:
+                self._refresh()
+                return False
+            self._index[key] = dict(account)
+            self._sources[key] = "new"
+            self._version += 1
+            return True
+
+    @timed("accounts", "write")
+    def update(self, email: str, expected: dict | None = None, **fields) -> bool:
+        key = _email_key(email)
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent updates
+            # from other workers merge instead of overwriting each other's fields
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data, source FROM accounts WHERE email = ?", (key,)).fetchone()
+                current = json.loads(row[0]) if row is not None else None
+                if current is None or not _matches(current, expected):
+                    self._conn.execute("ROLLBACK")
+                    return False
+                updated = _merge(current, fields)
+                data = json.dumps(updated, ensure_ascii=False)
+                add_bytes("accounts", "write", len(data))
+                self._conn.execute("UPDATE accounts SET data = ? WHERE email = ?", (data, key))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._index[key] = updated
+            self._sources[key] = row[1]
+            self._version += 1
+            return True
+
+    def _persist(self, key: str, account: dict, source: str) -> None:
+        # Keep the original position when replacing so listing order stays stable
+        self._conn.execute(
+            "INSERT INTO accounts (email, source, data, seq)"
+            " VALUES (?, ?, ?, COALESCE((SELECT MAX(seq) FROM accounts), 0) + 1)"
+            " ON CONFLICT(email) DO UPDATE SET source = excluded.source, data = excluded.data",
+            (key, source, json.dumps(account, ensure_ascii=False)),
+        )
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._conn.in_transaction:
+                yield self
+                return
+            self._conn.execute("BEGIN")
+            try:
+                yield self
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def is_imported(self) -> bool:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+        return bool(row)
+
+    def mark_imported(self) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', '1')")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def import_json_accounts(store: AccountStore,
+                         old_path: Path = OLD_ACCOUNTS_PATH,
+                         new_path: Path = NEW_ACCOUNTS_PATH) -> int:
+    """Load the legacy JSON account files into `store`. Old accounts override new ones."""
+    count = 0
+    with store.transaction():
+        for source, path in (("new", new_path), ("old", old_path)):
+            for acc in read_accounts_file(path):
+                if isinstance(acc, dict) and _email_key(acc.get("email")):
+                    store.put(acc, source)
+                    count += 1
+    return count
+
+
+def _create_account_store(config) -> AccountStore:
+    backend = (config.get("ACCOUNT_STORE") or os.getenv("ACCOUNT_STORE") or "sqlite").lower()
+    if backend == "memory":
+        store = AccountStore()
+        import_json_accounts(store)
+        return store
+    store = SQLiteAccountStore(Path(config.get("ACCOUNTS_DB_PATH") or ACCOUNTS_DB_PATH))
+    if not store.is_imported():
+        with store.transaction():
+            import_json_accounts(store)
+            store.mark_imported()
+    return store
+
+
+def get_account_store() -> AccountStore:
+    """The app's account store (see persistence.app_store). ACCOUNT_STORE=memory skips
+    SQLite (tests/demos)."""
+    return app_store("accounts", _create_account_store, "ACCOUNT_STORE", "ACCOUNTS_DB_PATH")
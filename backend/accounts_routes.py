@@ -0,0 +1,111 @@
+"""Account routes: sign-up, listing, password login and password reset."""
+from flask import Blueprint, jsonify, request
+
+from account_store import get_account_store
+from http_cache import app_cache, cached_json
+from otp_service import check_otp, verify_otp
+from passwords import PasswordHasherBusy, get_password_hasher
+from rate_limit import Limit, client_ip, json_field, rate_limit
+
+bp = Blueprint("accounts", __name__)
+
+# Never sent to clients; passwords are checked server-side by POST /accounts/login
+_SECRET_ACCOUNT_FIELDS = ('password', 'passwordHash')
+
+def _public_account(account: dict, source: str | None) -> dict:
+    public = {k: v for k, v in account.items() if k not in _SECRET_ACCOUNT_FIELDS}
+    # Accounts from new-accounts.json, and every sign-up since, solve a captcha at login
+    public["requiresCaptcha"] = source != "old"
+    return public
+
+def _load_all_accounts():
+    return [_public_account(a, source) for a, source in get_account_store().all_with_sources()]
+
+
+def _busy_response():
+    response = jsonify({"error": "Server busy, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@bp.route("/accounts", methods=["GET", "POST"])
+def accounts():
+    if request.method == "GET":
+        store = get_account_store()
+        # Encoded GET /accounts bodies, keyed by store version
+        return cached_json(app_cache("accounts"), "accounts", store.version,
+                           lambda: {"accounts": _load_all_accounts()})
+
+    data = request.get_json(force=True, silent=True) or {}
+    required = ["email", "password", "name", "username"]
+    if not all(k in data and isinstance(data[k], str) and data[k].strip() for k in required):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    if get_account_store().exists(data["email"].strip()):
+        return jsonify({"error": "Account already exists"}), 409
+    try:
+        password_hash = get_password_hasher().hash(data["password"])
+    except PasswordHasherBusy:
+        return _busy_response()
+    account = {
+        "email": data["email"].strip(),
+        "passwordHash": password_hash,
+        "name": data["name"].strip(),
+        "username": data["username"].strip(),
+    }
+    if not get_account_store().add(account):
+        return jsonify({"error": "Account already exists"}), 409
+    return jsonify({"success": True, "account": _public_account(account, "new")}), 201
+
+
+@bp.route("/accounts/login", methods=["POST"])
+@rate_limit(Limit("20/minute", client_ip), Limit("10/10 minutes", json_field("email")))
+def account_login():
+    """Check an email / password pair. Legacy plain-text passwords (and hashes with
+    outdated cost settings) are re-hashed and stored on a successful check."""
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get("email") or "").strip()
+    password = body.get("password")
+    if not email or not isinstance(password, str) or not password:
+        return jsonify({"error": "Email and password required"}), 400
+    store = get_account_store()
+    account = store.get(email)
+    if account is None:
+        return jsonify({"error": "Invalid email or password"}), 401
+    stored = account.get("passwordHash") or account.get("password")
+    try:
+        ok, new_hash = get_password_hasher().verify(stored, password)
+    except PasswordHasherBusy:
+        return _busy_response()
+    if not ok:
+        return jsonify({"error": "Invalid email or password"}), 401
+    if new_hash:
+        # Only if nobody changed the password meanwhile (e.g. a concurrent reset)
+        field = "passwordHash" if account.get("passwordHash") else "password"
+        store.update(email, expected={field: stored}, passwordHash=new_hash, password=None)
+    return jsonify({"success": True, "account": _public_account(account, store.source(email))})
+
+
+# -----------------------------
+# Password reset (from main)
+# -----------------------------
+@bp.route('/accounts/reset-password', methods=['POST'])
+def reset_password():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    otp = (body.get('otp') or '').strip()
+    new_password = (body.get('newPassword') or '')
+    if not email or not otp or not new_password:
+        return jsonify({"error": "Email, OTP and newPassword are required"}), 400
+    if not check_otp(email, otp):
+        return jsonify({"error": "Invalid or expired OTP"}), 401
+    # Hash before consuming the OTP, so a busy (503) response leaves it usable for the retry
+    try:
+        password_hash = get_password_hasher().hash(new_password)
+    except PasswordHasherBusy:
+        return _busy_response()
+    if not verify_otp(email, otp):  # a concurrent reset used it meanwhile
+        return jsonify({"error": "Invalid or expired OTP"}), 401
+    if not get_account_store().update(email, passwordHash=password_hash, password=None):
+        return jsonify({"error": "Account not found"}), 404
+    return jsonify({"success": True})
@@ -0,0 +1,270 @@
+"""ASGI serving mode for the backend.
+
+    WEB_CONCURRENCY=4 uvicorn asgi:app --port 8000
+
+Connections are owned by the event loop, so idle and slow clients cost no thread.
+Routes dominated by upstream latency are served natively async. At the moment that
+is POST /typingdna/verify, which talks to TypingDNA over httpx. Every other route is
+the same Flask view as under `python app.py`, run on a pool of ASGI_THREADS
+threads. (asgiref's WsgiToAsgi would run them all on one shared thread, through
+thread-sensitive sync_to_async, serializing the whole app; _PooledWsgi hands each
+request to the pool instead.) Those views no longer block on the network: email
+goes through the background mailer, and the stores write single rows or append
+lines.
+
+Requires the optional package httpx and an ASGI server (uvicorn).
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from time import perf_counter
+
+from app import app as flask_app
+from metrics import REQUEST_DURATION, REQUESTS_IN_FLIGHT
+from rate_limit import check as rate_limit_check
+from security_routes import TYPINGDNA_LIMITS
+from serialization import dumps, loads
+from typingdna_client import (
+    ENROLL_PATTERNS,
+    AsyncTypingDNAClient,
+    CircuitOpenError,
+    apply_confidence_gate,
+    get_typingdna_client,
+)
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+async def _read_json(receive) -> dict | None:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+        if len(body) > MAX_BODY_BYTES:
+            return None
+    try:
+        data = loads(body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _client_ip(scope) -> str | None:
+    """Same rule as rate_limit.client_ip: first X-Forwarded-For hop, else the peer."""
+    for name, value in scope.get("headers") or []:
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").split(",")[0].strip() or None
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+async def _send_json(send, payload: dict, status: int = 200, headers: list | None = None) -> None:
+    body = dumps(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),  # same policy as flask_cors.CORS(app)
+            *(headers or []),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _wsgi_environ(scope, body) -> dict:
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers") or []:
+        name = name.decode("latin1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(wsgi_application, environ: dict, send) -> None:
+    """Run one request on the calling (pool) thread; `send` blocks until the loop sent the message."""
+    start: dict = {}
+
+    def flush_start():
+        if start and not start.get("sent"):
+            start["sent"] = True
+            send(start["message"])
+
+    def write(data: bytes) -> None:
+        flush_start()
+        send({"type": "http.response.body", "body": data, "more_body": True})
+
+    def start_response(status, headers, exc_info=None):
+        if start.get("sent") and exc_info:
+            raise exc_info[1].with_traceback(exc_info[2])
+        start["message"] = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers],
+        }
+        return write
+
+    result = wsgi_application(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                write(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    flush_start()
+    send({"type": "http.response.body"})
+
+
+class _PooledWsgi:
+    """WSGI-to-ASGI adapter that runs each request on `executor`, where asgiref's
+    WsgiToAsgi would run them all on one shared thread. Streamed responses go out
+    chunk by chunk as the view yields them."""
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise ValueError("WSGI adapter received a non-HTTP scope")
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body.write(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+            await loop.run_in_executor(self.executor, _run_wsgi, self.wsgi_application,
+                                       _wsgi_environ(scope, body), send_from_thread)
+
+
+class AsyncBackend:
+    def __init__(self, wsgi_app, threads: int = 32):
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+        self.wsgi = _PooledWsgi(wsgi_app, self.executor)
+        self.routes = {
+            ("POST", "/typingdna/verify"): self.typingdna_verify,
+        }
+        self._typingdna: AsyncTypingDNAClient | None = None
+
+    @property
+    def typingdna(self) -> AsyncTypingDNAClient:
+        if self._typingdna is None:
+            self._typingdna = AsyncTypingDNAClient(get_typingdna_client())
+        return self._typingdna
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http":
+            handler = self.routes.get((scope["method"], scope["path"]))
+            if handler is not None:
+                return await self._instrumented(handler, scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _instrumented(self, handler, scope, receive, send):
+        """Native routes bypass Flask, so record the same request metrics here."""
+        route, status = scope["path"], 500
+        started = perf_counter()
+
+        async def send_and_capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(route)
+        try:
+            return await handler(scope, receive, send_and_capture)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(route)
+            REQUEST_DURATION.observe(perf_counter() - started, scope["method"], route, str(status))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._typingdna is not None:
+                    await self._typingdna.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def typingdna_verify(self, scope, receive, send):
+        """Async twin of app.verify_typing; same request and response shapes."""
+        data = await _read_json(receive) or {}
+        user_id = data.get("userId")
+        tp = data.get("tp")
+        textid = data.get("textid")
+        if not user_id or not tp:
+            return await _send_json(send, {"error": "Missing userId or typing pattern"}, 400)
+        # same counters as the Flask view (scope = its function name)
+        keys = (_client_ip(scope), str(user_id).strip().lower())
+        retry_after = rate_limit_check("verify_typing", zip(TYPINGDNA_LIMITS, keys))
+        if retry_after is not None:
+            return await _send_json(send, {"error": "Too many requests", "retryAfter": retry_after}, 429,
+                                    [(b"retry-after", str(retry_after).encode())])
+
+        client = self.typingdna
+        try:
+            patterns_count = await client.enrollment_count(user_id)
+            payload = {"tp": tp}
+            if textid:
+                payload["textid"] = textid
+            if patterns_count < ENROLL_PATTERNS:
+                details = await client.save(user_id, payload)
+                return await _send_json(send, {"status": "enrolled", "details": details})
+            verify_data = apply_confidence_gate(await client.verify(user_id, payload))
+            return await _send_json(send, {"status": "verified", "details": verify_data})
+        except CircuitOpenError as e:
+            return await _send_json(send, {"error": str(e)}, 503)
+        except Exception as e:
+            if isinstance(e, client._httpx.TimeoutException):
+                return await _send_json(send, {"error": "TypingDNA request timed out"}, 504)
+            return await _send_json(send, {"error": str(e)}, 500)
+
+
+app = AsyncBackend(flask_app, threads=int(os.getenv("ASGI_THREADS", "32")))
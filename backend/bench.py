@@ -0,0 +1,441 @@
+"""Load test for the backend's hot routes.
+
+    python bench.py                          # 1k scale, 16 clients, 10s
+    python bench.py --scale 100k --concurrency 32 --duration 30 --json out.json
+    python bench.py --compare out.json       # exit 1 if p99/throughput regressed
+    python bench.py --startup                # exit 1 if a cold start is over budget
+
+Everything runs locally and in isolation:
+- data lives in a temporary directory (every *_DB_PATH / FINGERPRINT_LOG_DIR is
+  pointed there before the app is imported), seeded with synthetic accounts,
+  fingerprint logs and location fixes at 1k / 100k / 1M scale;
+- a fake SMTP server accepts and discards mail; a mock TypingDNA answers
+  /user, /save and /verify;
+- the Flask app is served by werkzeug's threaded server on a free port, and
+  client threads drive it over real HTTP with keep-alive connections.
+
+Rate limits are disabled so the numbers measure the code, not the throttle.
+Reports requests/s, p50 and p99 latency and error counts per scenario.
+
+--startup instead times `import app` (which runs create_app) in fresh interpreters
+and fails if the median exceeds STARTUP_BUDGET_MS, or if a dependency that should
+load on first use (LAZY_MODULES) was imported eagerly.
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+ACTIONS = ("login_attempt", "login_success", "login_failed", "signup", "otp_sent")
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "300"))
+LAZY_MODULES = ("fido2", "requests", "smtplib", "multiprocessing")
+
+
+# --- local stand-ins ---
+class _FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every message and drops it."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 bench ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb in (b"EHLO", b"HELO"):
+                self.reply("250 bench")
+            elif verb == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.delivered += 1
+                self.reply("250 queued")
+            elif verb == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply("250 ok")
+
+
+class _FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    delivered = 0
+
+
+class _MockTypingDNA(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._json({"count": 3, "success": 1})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.startswith("/verify"):
+            self._json({"success": 1, "result": 1, "score": 90, "net_score": 90})
+        else:
+            self._json({"success": 1, "message": "saved"})
+
+
+def _serve(server) -> str:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return f"{host}:{port}"
+
+
+def _configure_env(data_dir: Path, smtp_addr: str, typingdna_addr: str) -> None:
+    smtp_host, smtp_port = smtp_addr.split(":")
+    os.environ.update({
+        "ACCOUNTS_DB_PATH": str(data_dir / "accounts.db"),
+        "DEVICES_DB_PATH": str(data_dir / "devices.db"),
+        "LOCATIONS_DB_PATH": str(data_dir / "locations.db"),
+        "LOGIN_ATTEMPTS_DB_PATH": str(data_dir / "login_attempts.db"),
+        "RATE_LIMIT_DB_PATH": str(data_dir / "rate_limits.db"),
+        "FINGERPRINT_LOG_DIR": str(data_dir / "fingerprint_logs"),
+        "EVENTS_DB_PATH": str(data_dir / "events.db"),
+        "AUDIT_LOG_PATH": str(data_dir / "audit_log.jsonl"),
+        "MAIL_STATUS_DB_PATH": str(data_dir / "mail_status.db"),
+        "RISK_DB_PATH": str(data_dir / "risk.db"),
+        "OTP_DB_PATH": str(data_dir / "otp_store.db"),
+        "RATE_LIMITS_ENABLED": "0",
+        "SMTP_HOST": smtp_host,
+        "SMTP_PORT": smtp_port,
+        "SMTP_STARTTLS": "0",
+        "SMTP_AUTH": "0",
+        "SMTP_FROM": "bench@localhost",
+        "TYPINGDNA_BASE_URL": f"http://{typingdna_addr}",
+        "TYPINGDNA_API_KEY": "bench",
+        "TYPINGDNA_API_SECRET": "bench",
+    })
+
+
+# --- synthetic data ---
+def _email(i: int) -> str:
+    return f"user{i}@bench.test"
+
+
+def _fingerprint(rng: random.Random, user: int) -> dict:
+    return {
+        "visitorId": f"v{user}-{rng.randint(0, 2)}",
+        "browserDetails": {"browserName": rng.choice(["Chrome", "Firefox", "Safari"]),
+                           "browserVersion": str(rng.randint(100, 130)), "os": "Linux", "osVersion": ""},
+    }
+
+
+def seed(n: int, users: int, rng: random.Random) -> None:
+    """Populate the stores directly (not over HTTP) so seeding stays fast."""
+    from account_store import get_account_store
+    from fingerprint_log import get_fingerprint_log
+    from location_history import get_location_history
+
+    started = time.perf_counter()
+    store = get_account_store()
+    with store.transaction():
+        for i in range(n):
+            store.put({"email": _email(i), "password": "pw", "name": f"User {i}", "username": f"user{i}"})
+    log = get_fingerprint_log()
+    t0 = datetime.utcnow() - timedelta(days=1)
+    for i in range(n):
+        user = rng.randrange(users)
+        log.append({
+            "timestamp": (t0 + timedelta(seconds=i * 86400 / n)).isoformat(),
+            "action": rng.choice(ACTIONS),
+            "email": _email(user),
+            "fingerprint": _fingerprint(rng, user),
+            "ip": f"10.0.{user % 256}.{rng.randrange(256)}",
+        })
+    log.flush()
+    items = [{"email": _email(rng.randrange(users)),
+              "coords": {"lat": rng.uniform(-60, 60), "lon": rng.uniform(-180, 180), "accuracy": 50},
+              "timestamp": (t0 + timedelta(seconds=i * 86400 / n)).isoformat()}
+             for i in range(min(n, 100_000))]
+    get_location_history().check_many(items, persist=True)
+    print(f"seeded {n} accounts / fingerprint entries in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+# --- scenarios ---
+def scenarios(users: int) -> dict:
+    """name -> (weight, request builder). Builders return (method, path, body, ok statuses)."""
+    counter = iter(range(10**12))
+
+    def accounts_get(rng):
+        return "GET", "/accounts", None, (200,)
+
+    def accounts_post(rng):
+        i = next(counter)
+        return "POST", "/accounts", {"email": f"new{i}-{rng.random()}@bench.test", "password": "pw",
+                                     "name": "New", "username": f"new{i}"}, (201,)
+
+    def log_fingerprint(rng):
+        user = rng.randrange(users)
+        return "POST", "/security/log-fingerprint", {
+            "action": rng.choice(ACTIONS), "email": _email(user), "fingerprint": _fingerprint(rng, user)}, (200,)
+
+    def fingerprint_logs(rng):
+        if rng.random() < 0.5:
+            return "GET", f"/security/fingerprint-logs?email={_email(rng.randrange(users))}&limit=50", None, (200,)
+        return "GET", "/security/fingerprint-logs?limit=100", None, (200,)
+
+    def otp_send(rng):
+        return "POST", "/otp/send", {"email": _email(rng.randrange(users))}, (200,)
+
+    def otp_verify(rng):
+        # A wrong code exercises the same lookup path as a right one
+        return "POST", "/otp/verify", {"email": _email(rng.randrange(users)), "otp": "000000"}, (200, 401)
+
+    def location_check(rng):
+        return "POST", "/security/location-check", {
+            "email": _email(rng.randrange(users)),
+            "coords": {"lat": rng.uniform(-60, 60), "lon": rng.uniform(-180, 180), "accuracy": 50}}, (200,)
+
+    def typingdna_verify(rng):
+        return "POST", "/typingdna/verify", {"userId": f"user{rng.randrange(users)}", "tp": "0,1,2"}, (200,)
+
+    return {
+        "GET /accounts": (1, accounts_get),
+        "POST /accounts": (2, accounts_post),
+        "POST /security/log-fingerprint": (6, log_fingerprint),
+        "GET /security/fingerprint-logs": (4, fingerprint_logs),
+        "POST /otp/send": (2, otp_send),
+        "POST /otp/verify": (2, otp_verify),
+        "POST /security/location-check": (4, location_check),
+        "POST /typingdna/verify": (2, typingdna_verify),
+    }
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def warm_up(addr: str, plan: dict, seed_value: int) -> None:
+    """One request per scenario, so lazy store setup and backfills aren't measured."""
+    host, port = addr.split(":")
+    rng = random.Random(seed_value)
+    conn = http.client.HTTPConnection(host, int(port), timeout=600)
+    for _, build in plan.values():
+        method, path, body, _ = build(rng)
+        payload = json.dumps(body).encode() if body is not None else None
+        conn.request(method, path, body=payload, headers={"Content-Type": "application/json"} if payload else {})
+        conn.getresponse().read()
+    conn.close()
+
+
+def drive(addr: str, plan: dict, concurrency: int, duration: float, seed_value: int) -> dict:
+    host, port = addr.split(":")
+    names = list(plan)
+    weights = [plan[n][0] for n in names]
+    latencies = {n: [] for n in names}
+    errors = {n: 0 for n in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(k: int) -> None:
+        rng = random.Random(seed_value * 1000 + k)
+        conn = http.client.HTTPConnection(host, int(port), timeout=30)
+        mine = {n: [] for n in names}
+        failed = {n: 0 for n in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, body, ok = plan[name][1](rng)
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload else {}
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, int(port), timeout=30)
+                status = None
+            mine[name].append(time.perf_counter() - started)
+            if status not in ok:
+                failed[name] += 1
+        conn.close()
+        with lock:
+            for n in names:
+                latencies[n].extend(mine[n])
+                errors[n] += failed[n]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for n in names:
+        values = sorted(latencies[n])
+        results[n] = {
+            "requests": len(values),
+            "errors": errors[n],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+        }
+    total = sum(r["requests"] for r in results.values())
+    results["TOTAL"] = {"requests": total, "errors": sum(errors.values()), "rps": round(total / elapsed, 1)}
+    return results
+
+
+def report(results: dict) -> None:
+    print(f"{'scenario':34} {'req':>8} {'err':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:34} {r['requests']:>8} {r['errors']:>6} {r['rps']:>9} "
+              f"{r.get('p50_ms', ''):>9} {r.get('p99_ms', ''):>9}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Scenarios whose p99 grew or throughput fell by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = results.get(name)
+        if not cur:
+            continue
+        if base.get("p99_ms") and cur["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {base['p99_ms']}ms -> {cur['p99_ms']}ms")
+        if base.get("rps") and cur["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {base['rps']} -> {cur['rps']} req/s")
+    return regressions
+
+
+# --- cold start ---
+_STARTUP_PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import app\n"
+    "elapsed = time.perf_counter() - started\n"
+    f"print(elapsed, *[m for m in {LAZY_MODULES!r} if m in sys.modules])\n"
+)
+
+
+def startup(runs: int) -> tuple[list, set]:
+    """(sorted seconds per `import app`, eagerly imported LAZY_MODULES), one fresh
+    interpreter per run. Interpreter start-up itself is not counted."""
+    backend = Path(__file__).resolve().parent
+    times, eager = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=backend, check=True,
+                             capture_output=True, text=True).stdout.split()
+        times.append(float(out[0]))
+        eager.update(out[1:])
+    return sorted(times), eager
+
+
+def check_startup(runs: int, budget_ms: float) -> int:
+    startup(1)  # compile .pyc files so the timed runs see a deployed tree
+    times, eager = startup(runs)
+    median_ms = times[len(times) // 2] * 1000
+    print(f"import app: median {median_ms:.0f} ms, min {times[0] * 1000:.0f} ms, "
+          f"max {times[-1] * 1000:.0f} ms over {runs} runs (budget {budget_ms:.0f} ms)")
+    failed = False
+    if median_ms > budget_ms:
+        print(f"OVER BUDGET by {median_ms - budget_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    if eager:
+        print(f"EAGER IMPORTS {', '.join(sorted(eager))}: load these on first use", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="synthetic accounts and fingerprint entries")
+    parser.add_argument("--users", type=int, help="distinct users in the synthetic data (default scale/10)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", action="append", help="run only scenarios containing this text (repeatable)")
+    parser.add_argument("--json", type=Path, help="write results (and the run's parameters) here")
+    parser.add_argument("--compare", type=Path, help="baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression vs --compare")
+    parser.add_argument("--startup", action="store_true", help="check cold-start time instead of running load")
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters for --startup")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="median budget for --startup")
+    args = parser.parse_args(argv)
+    if args.startup:
+        return check_startup(args.runs, args.budget_ms)
+
+    n = SCALES[args.scale]
+    users = args.users or max(10, n // 10)
+    rng = random.Random(args.seed)
+
+    smtp = _FakeSMTPServer(("127.0.0.1", 0), _FakeSMTPHandler)
+    typingdna = ThreadingHTTPServer(("127.0.0.1", 0), _MockTypingDNA)
+    typingdna.daemon_threads = True
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        _configure_env(Path(tmp), _serve(smtp), _serve(typingdna))
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        from werkzeug.serving import make_server
+
+        from app import app
+
+        seed(n, users, rng)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        addr = _serve(server)
+
+        plan = scenarios(users)
+        if args.only:
+            plan = {k: v for k, v in plan.items() if any(s in k for s in args.only)}
+        print(f"driving {len(plan)} scenarios at {args.scale} scale, {args.concurrency} clients, "
+              f"{args.duration:g}s", file=sys.stderr)
+        with contextlib.redirect_stdout(io.StringIO()):  # the OTP routes print codes for local testing
+            warm_up(addr, plan, args.seed)
+            results = drive(addr, plan, args.concurrency, args.duration, args.seed)
+        server.shutdown()
+        from events import get_event_bus
+        from mailer import get_mailer
+        get_event_bus().stop()
+        get_mailer().stop()
+    smtp.shutdown()
+    typingdna.shutdown()
+
+    report(results)
+    params = {"scale": args.scale, "users": users, "concurrency": args.concurrency, "duration": args.duration,
+              "python": sys.version.split()[0], "host": socket.gethostname()}
+    if args.json:
+        args.json.write_text(json.dumps({"params": params, "results": results}, indent=2))
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
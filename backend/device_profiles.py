@@ -0,0 +1,187 @@
+"""Known-device table per user.
+
+Deciding whether a login comes from a new device used to mean scanning the
+fingerprint log for the user's earlier visitorIds, and the log was truncated, so
+old devices were forgotten. This module keeps one compact row per (email, visitorId)
+in SQLite (WAL): browser, OS, first seen, last seen and sighting count.
+log_fingerprint updates it with a single upsert. Recently active users' device
+lists are cached in an LRU, so "is this device known?" is normally a dict lookup.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from metrics import timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+DEVICES_DB_PATH = Path(os.getenv("DEVICES_DB_PATH") or (BASE_DIR / "devices.db"))
+CACHED_USERS = int(os.getenv("DEVICE_CACHED_USERS", "10000"))
+
+_COLUMNS = ("visitor_id", "browser", "os", "first_seen", "last_seen", "count")
+
+
+def _row_to_device(row) -> dict:
+    visitor_id, browser, os_name, first_seen, last_seen, count = row
+    return {
+        "visitorId": visitor_id,
+        "browser": browser,
+        "os": os_name,
+        "firstSeen": first_seen,
+        "lastSeen": last_seen,
+        "count": count,
+    }
+
+
+def _browser_os(fingerprint: dict) -> tuple[str | None, str | None]:
+    details = fingerprint.get("browserDetails")
+    if not isinstance(details, dict):  # client-supplied; anything else carries no browser/OS
+        return None, None
+    browser = " ".join(str(x) for x in (details.get("browserName"), details.get("browserVersion")) if x) or None
+    os_name = " ".join(str(x) for x in (details.get("os"), details.get("osVersion")) if x and x != "Unknown") or None
+    return browser, os_name
+
+
+class DeviceProfiles:
+    def __init__(self, db_path: Path = DEVICES_DB_PATH, cached_users: int = CACHED_USERS):
+        self.cached_users = cached_users
+        self._lock = threading.RLock()
+        self._cache: OrderedDict[str, dict[str, dict]] = OrderedDict()
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS devices ("
+            " email TEXT NOT NULL, visitor_id TEXT NOT NULL,"
+            " browser TEXT, os TEXT, first_seen TEXT, last_seen TEXT,"
+            " count INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (email, visitor_id))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self) -> None:
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()  # another worker wrote
+            self._data_version = version
+
+    def _user(self, email: str) -> dict[str, dict]:
+        devices = self._cache.get(email)
+        if devices is not None:
+            self._cache.move_to_end(email)
+            return devices
+        with timed("devices", "load"):
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM devices WHERE email = ?", (email,)).fetchall()
+        devices = {row[0]: _row_to_device(row) for row in rows}
+        self._cache[email] = devices
+        while len(self._cache) > self.cached_users:
+            self._cache.popitem(last=False)
+        return devices
+
+    # --- queries ---
+    def get(self, email: str, visitor_id: str) -> dict | None:
+        email = (email or "").strip().lower()
+        with self._lock:
+            self._refresh()
+            device = self._user(email).get(visitor_id)
+            return dict(device) if device else None
+
+    def is_known(self, email: str, visitor_id: str) -> bool:
+        return self.get(email, visitor_id) is not None
+
+    def list(self, email: str) -> list:
+        email = (email or "").strip().lower()
+        with self._lock:
+            self._refresh()
+            devices = [dict(d) for d in self._user(email).values()]
+        return sorted(devices, key=lambda d: d["lastSeen"] or "", reverse=True)
+
+    # --- writes ---
+    @timed("devices", "write")
+    def observe(self, email: str, fingerprint: dict, seen_at: str | None = None) -> tuple[bool, bool]:
+        """Record a sighting; returns (known, new_device). `known`: the device was already
+        known for this user. `new_device`: it was not, and the user already had other
+        devices; a user's first device is their baseline, so it is neither."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Under the write lock, so two workers cannot both see an empty device list
+                self._refresh()
+                result = self._observe(email, fingerprint, seen_at)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._cache.clear()
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _observe(self, email: str, fingerprint: dict, seen_at: str | None) -> tuple[bool, bool]:
+        email = email.strip().lower() if isinstance(email, str) else ""
+        visitor_id = fingerprint.get("visitorId") if isinstance(fingerprint, dict) else None
+        if not email or not visitor_id or not isinstance(visitor_id, str):
+            return False, False
+        browser, os_name = _browser_os(fingerprint)
+        seen_at = seen_at or datetime.utcnow().isoformat()
+        with self._lock:
+            devices = self._user(email)  # load before the upsert so the result reflects the prior state
+            had_devices = bool(devices)
+            self._conn.execute(
+                "INSERT INTO devices (email, visitor_id, browser, os, first_seen, last_seen, count)"
+                " VALUES (?, ?, ?, ?, ?, ?, 1)"
+                " ON CONFLICT(email, visitor_id) DO UPDATE SET"
+                " browser = COALESCE(excluded.browser, browser), os = COALESCE(excluded.os, os),"
+                " last_seen = excluded.last_seen, count = count + 1",
+                (email, visitor_id, browser, os_name, seen_at, seen_at))
+            device = devices.get(visitor_id)
+            known = device is not None
+            if device is None:
+                device = devices[visitor_id] = {
+                    "visitorId": visitor_id, "browser": browser, "os": os_name,
+                    "firstSeen": seen_at, "lastSeen": seen_at, "count": 1,
+                }
+            else:
+                device["browser"] = browser or device["browser"]
+                device["os"] = os_name or device["os"]
+                device["lastSeen"] = seen_at
+                device["count"] += 1
+            return known, not known and had_devices
+
+    def import_log(self, entries) -> int:
+        """One-shot backfill from fingerprint log entries (oldest first)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'log_imported'").fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                count = 0
+                for entry in entries:
+                    self._observe(entry.get("email"), entry.get("fingerprint"), entry.get("timestamp"))
+                    count += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('log_imported', '1')")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._cache.clear()
+                raise
+            self._conn.execute("COMMIT")
+            return count
+
+
+def _create_device_profiles(config) -> DeviceProfiles:
+    from fingerprint_log import get_fingerprint_log
+
+    profiles = DeviceProfiles(Path(config.get("DEVICES_DB_PATH") or DEVICES_DB_PATH))
+    log = get_fingerprint_log()
+    profiles.import_log(entry for _, _, _, entry in log.iter_forward() if isinstance(entry, dict))
+    return profiles
+
+
+def get_device_profiles() -> DeviceProfiles:
+    return app_store("devices", _create_device_profiles, "DEVICES_DB_PATH", "FINGERPRINT_LOG_DIR")
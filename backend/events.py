@@ -0,0 +1,395 @@
+"""Transactional outbox and in-process event bus for security side effects.
+
+Recording a login attempt or a location jump used to send the alert email inside
+the request. A slow or failing SMTP server then slowed or failed a request whose
+data was already saved. Now the request only records an event, and subscribers
+(alert emails, analytics, audit) run later on a dispatcher thread:
+
+- an event is a row in an `outbox` table in the same SQLite database as the change
+  it describes, written in the same transaction (enqueue). A login attempt and
+  its LoginAttemptRecorded event are committed together or not at all. Events
+  with no store of their own (FingerprintLogged: the fingerprint log is JSONL
+  files) go to EVENTS_DB_PATH through EventBus.publish;
+- the dispatcher claims a few due rows at a time (EVENT_BATCH_SIZE) with a lease
+  (EVENT_LEASE_SECONDS), so only one worker process delivers an event at a time.
+  It calls every subscriber of the event's type. Before each call it renews the
+  lease and saves which subscribers have already succeeded. If the lease has been
+  lost (it ran out and another worker claimed the event), it leaves the event
+  alone. Acks and retries likewise only apply while the lease is still held.
+  Failed subscribers are retried with exponential backoff, up to
+  EVENT_MAX_ATTEMPTS, and then the event is marked dead;
+- delivery is at least once. After a crash, events that were pending, or claimed
+  but never acknowledged, are picked up again once the lease runs out. A subscriber
+  can therefore see an event twice, so subscribers are idempotent on the event id
+  (see subscribers.py);
+- delivered events are kept for EVENT_RETENTION seconds, so they can be replayed
+  (e.g. to a new subscriber) with `python events.py replay`.
+
+The dispatcher starts with a worker's first request (init_app), after any pre-fork;
+subscribers.py is imported and registered then, not when the app is built. It runs
+in the app's context, so subscribers use that app's stores, and an app configured
+with its own EVENTS_DB_PATH (or store paths) has its own bus. It wakes as soon as
+this process commits an event, and polls every EVENT_POLL_SECONDS for events
+committed by other workers.
+
+    python events.py status
+    python events.py replay --type LoginAttemptRecorded --since 2024-05-01 --subscriber audit
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from pathlib import Path
+from time import time
+
+from metrics import timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+EVENTS_DB_PATH = Path(os.getenv("EVENTS_DB_PATH") or (BASE_DIR / "events.db"))
+LEASE_SECONDS = float(os.getenv("EVENT_LEASE_SECONDS", "60"))
+POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "1"))
+MAX_ATTEMPTS = int(os.getenv("EVENT_MAX_ATTEMPTS", "8"))
+RETRY_BASE_SECONDS = float(os.getenv("EVENT_RETRY_BASE", "2"))
+RETRY_MAX_SECONDS = float(os.getenv("EVENT_RETRY_MAX", "300"))
+RETENTION_SECONDS = int(os.getenv("EVENT_RETENTION", str(7 * 24 * 60 * 60)))
+BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "10"))
+PURGE_INTERVAL_SECONDS = 60
+
+LOGIN_ATTEMPT_RECORDED = "LoginAttemptRecorded"
+LOCATION_JUMP_DETECTED = "LocationJumpDetected"
+FINGERPRINT_LOGGED = "FingerprintLogged"
+
+
+def create_outbox(conn: sqlite3.Connection) -> None:
+    """Create the outbox table in a store's database (idempotent)."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, type TEXT NOT NULL,"
+        " payload TEXT NOT NULL, created REAL NOT NULL, status TEXT NOT NULL DEFAULT 'pending',"
+        " done TEXT NOT NULL DEFAULT '[]', attempts INTEGER NOT NULL DEFAULT 0,"
+        " next_attempt REAL NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, error TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)")
+    conn.execute("CREATE INDEX IF NOT EXISTS outbox_created ON outbox (created)")
+
+
+def enqueue(conn: sqlite3.Connection, event_type: str, payload: dict) -> str:
+    """Add an event to `conn`'s outbox and return its id. Call it inside the
+    transaction that makes the change the event describes, then wake() after COMMIT."""
+    event_id = uuid.uuid4().hex
+    conn.execute("INSERT INTO outbox (id, type, payload, created) VALUES (?, ?, ?, ?)",
+                 (event_id, event_type, json.dumps(payload, ensure_ascii=False), time()))
+    return event_id
+
+
+class Outbox:
+    """The dispatcher's connection to one database's outbox table."""
+
+    def __init__(self, db_path: Path, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        create_outbox(self._conn)
+
+    def add(self, event_type: str, payload: dict) -> str:
+        with self._lock:
+            return enqueue(self._conn, event_type, payload)
+
+    @timed("events", "claim")
+    def claim(self, limit: int = BATCH_SIZE, lease: float = LEASE_SECONDS) -> list:
+        """Lease up to `limit` due events, oldest first. The lease keeps other workers off
+        them until it expires, which is also how a crashed worker's events come back.
+        Each event carries its `lease_until`, which identifies this claim."""
+        now = time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE outbox SET lease_until = ?, attempts = attempts + 1 WHERE seq IN ("
+                " SELECT seq FROM outbox WHERE status = 'pending' AND next_attempt <= ? AND lease_until <= ?"
+                " ORDER BY seq LIMIT ?)"
+                " RETURNING seq, id, type, payload, created, done, attempts",
+                (now + lease, now, now, limit)).fetchall()
+        return [
+            {"seq": seq, "id": event_id, "type": event_type, "payload": json.loads(payload), "created": created,
+             "done": json.loads(done), "attempts": attempts, "lease_until": now + lease}
+            for seq, event_id, event_type, payload, created, done, attempts in sorted(rows)
+        ]
+
+    def renew(self, event: dict, lease: float = LEASE_SECONDS) -> bool:
+        """Extend this claim on `event` and save its progress (the subscribers done so
+        far). False if the claim was lost: another worker has claimed the event since."""
+        until = time() + lease
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE outbox SET lease_until = ?, done = ? WHERE seq = ? AND lease_until = ? AND status = 'pending'",
+                (until, json.dumps(sorted(event["done"])), event["seq"], event["lease_until"])).rowcount
+        if renewed:
+            event["lease_until"] = until
+        return bool(renewed)
+
+    def ack(self, event: dict) -> bool:
+        """Mark the event delivered, if this claim still holds it."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE outbox SET status = 'delivered', done = ?, lease_until = 0, error = NULL"
+                " WHERE seq = ? AND lease_until = ?",
+                (json.dumps(sorted(event["done"])), event["seq"], event["lease_until"])).rowcount > 0
+
+    def retry(self, event: dict, error: str) -> bool:
+        """Release a partly delivered event for another attempt after a backoff; dead
+        after max_attempts. Subscribers that already succeeded are not called again.
+        Does nothing if this claim no longer holds the event."""
+        dead = event["attempts"] >= self.max_attempts
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** (event["attempts"] - 1)))
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE outbox SET status = ?, done = ?, next_attempt = ?, lease_until = 0, error = ?"
+                " WHERE seq = ? AND lease_until = ?",
+                ("dead" if dead else "pending", json.dumps(sorted(event["done"])), time() + delay, error[:1000],
+                 event["seq"], event["lease_until"])).rowcount > 0
+
+    def replay(self, event_type: str | None = None, since: float | None = None,
+               subscriber: str | None = None, dead_only: bool = False) -> int:
+        """Make delivered (or dead) events pending again; returns how many. Delivered
+        events go to every subscriber again, dead ones to the subscribers that failed;
+        with `subscriber`, to that subscriber only."""
+        where, args = ["status != 'pending'"], []
+        if dead_only:
+            where = ["status = 'dead'"]
+        if event_type:
+            where.append("type = ?")
+            args.append(event_type)
+        if since is not None:
+            where.append("created >= ?")
+            args.append(since)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT seq, status, done FROM outbox WHERE {' AND '.join(where)}", args).fetchall()
+                updates = []
+                for seq, status, done in rows:
+                    done = json.loads(done)
+                    if subscriber:
+                        done = [d for d in done if d != subscriber]
+                    elif status != "dead":
+                        done = []
+                    updates.append((json.dumps(done), seq))
+                self._conn.executemany(
+                    "UPDATE outbox SET status = 'pending', done = ?, attempts = 0, next_attempt = 0,"
+                    " lease_until = 0, error = NULL WHERE seq = ?", updates)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+    def purge(self, now: float | None = None) -> int:
+        """Delete delivered events older than the retention window; returns how many."""
+        now = time() if now is None else now
+        with self._lock:
+            self._purged_at = now
+            return self._conn.execute("DELETE FROM outbox WHERE status = 'delivered' AND created < ?",
+                                      (now - RETENTION_SECONDS,)).rowcount
+
+    def maybe_purge(self) -> None:
+        if time() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self.purge()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class EventBus:
+    def __init__(self, db_path: Path = EVENTS_DB_PATH, poll_seconds: float = POLL_SECONDS):
+        self.db_path = Path(db_path)
+        self.poll_seconds = poll_seconds
+        self._subscribers: dict[str, dict] = {}  # event type -> {subscriber name: handler}
+        self._paths: list[Path] = []
+        self._outboxes: dict[Path, Outbox] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._app = None
+
+    # --- wiring ---
+    def subscribe(self, event_type: str, name: str, handler) -> None:
+        """Call handler(event) for every `event_type` event. `name` identifies the
+        subscriber in the outbox's delivery record, so keep it stable."""
+        with self._lock:
+            self._subscribers.setdefault(event_type, {})[name] = handler
+
+    def add_outbox(self, db_path: Path) -> None:
+        """Deliver events from this database's outbox. Opened on first dispatch."""
+        db_path = Path(db_path)
+        with self._lock:
+            if db_path not in self._paths:
+                self._paths.append(db_path)
+
+    def outbox(self, db_path: Path) -> Outbox:
+        db_path = Path(db_path)
+        outbox = self._outboxes.get(db_path)
+        if outbox is None:
+            with self._lock:
+                outbox = self._outboxes.get(db_path)
+                if outbox is None:
+                    outbox = self._outboxes[db_path] = Outbox(db_path)
+        return outbox
+
+    def outboxes(self) -> list:
+        with self._lock:
+            paths = [self.db_path] + [p for p in self._paths if p != self.db_path]
+        return [self.outbox(p) for p in paths]
+
+    # --- producing ---
+    def publish(self, event_type: str, payload: dict) -> str:
+        """Record an event in the bus's own database, for changes that are not in a SQLite store."""
+        event_id = self.outbox(self.db_path).add(event_type, payload)
+        self.wake()
+        return event_id
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    # --- delivering ---
+    def _deliver(self, outbox: Outbox, event: dict) -> None:
+        with self._lock:
+            handlers = dict(self._subscribers.get(event["type"], {}))
+        done = event["done"] = set(event["done"])
+        errors = []
+        for name, handler in handlers.items():
+            if name in done:
+                continue
+            if not outbox.renew(event):
+                return  # another worker claimed it after our lease ran out; it carries on from `done`
+            try:
+                with timed("events", name):
+                    handler(event)
+                done.add(name)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            outbox.retry(event, "; ".join(errors))
+        else:
+            outbox.ack(event)
+
+    def dispatch_pending(self) -> int:
+        """Deliver every due event from every outbox; returns how many were handled."""
+        handled = 0
+        for outbox in self.outboxes():
+            outbox.maybe_purge()
+            while True:
+                batch = outbox.claim()
+                for event in batch:
+                    self._deliver(outbox, event)
+                handled += len(batch)
+                if len(batch) < BATCH_SIZE:
+                    break
+        return handled
+
+    def _run(self, setup) -> None:
+        if setup is not None:
+            setup(self)
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                self.dispatch_pending()
+            except Exception as e:  # e.g. a locked database; try again on the next round
+                print(f"Event dispatch failed: {e}")
+            self._wake.wait(self.poll_seconds)
+
+    def _run_in(self, app, setup) -> None:
+        if app is None:
+            return self._run(setup)
+        with app.app_context():
+            self._run(setup)
+
+    def start(self, app=None, setup=None) -> None:
+        """Start the dispatcher thread (once). It calls setup(bus) first, and runs inside
+        `app`'s context when one is given."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run_in, args=(app, setup), name="event-dispatcher",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            thread.join(timeout)
+
+
+def get_event_bus() -> EventBus:
+    # The store paths too: their outboxes are delivered by this bus
+    return app_store("events", lambda config: EventBus(Path(config.get("EVENTS_DB_PATH") or EVENTS_DB_PATH)),
+                     "EVENTS_DB_PATH", "LOGIN_ATTEMPTS_DB_PATH", "LOCATIONS_DB_PATH")
+
+
+def wake() -> None:
+    """Tell this process's dispatcher that an event was just committed."""
+    get_event_bus().wake()
+
+
+def _register_subscribers(bus: EventBus) -> None:
+    # Imported here: subscribers pulls in the mailer and the stores, which no request
+    # needs just to build the app
+    import subscribers
+
+    subscribers.register(bus)
+
+
+def init_app(app) -> None:
+    """Start the app's dispatcher with the first request `app` handles."""
+
+    @app.before_request
+    def _start_dispatcher():
+        get_event_bus().start(app, setup=_register_subscribers)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or replay the security event outboxes")
+    parser.add_argument("command", choices=("status", "replay"))
+    parser.add_argument("--type", help="only events of this type")
+    parser.add_argument("--since", help="only events created at or after this ISO time (UTC)")
+    parser.add_argument("--subscriber", help="redeliver to this subscriber only")
+    parser.add_argument("--dead", action="store_true", help="only events that ran out of attempts")
+    parser.add_argument("--dispatch", action="store_true", help="deliver replayed events now, from this process")
+    args = parser.parse_args(argv)
+
+    from location_history import parse_epoch
+    import subscribers
+
+    bus = get_event_bus()
+    subscribers.register(bus)
+    since = parse_epoch(args.since) if args.since else None
+    for outbox in bus.outboxes():
+        if args.command == "replay":
+            count = outbox.replay(args.type, since, args.subscriber, dead_only=args.dead)
+            print(f"{outbox.db_path}: {count} events pending again")
+        else:
+            print(f"{outbox.db_path}: {outbox.stats() or 'empty'}")
+    if args.command == "replay" and args.dispatch:
+        print(f"delivered {bus.dispatch_pending()} events")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
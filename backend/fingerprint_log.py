@@ -0,0 +1,453 @@
+"""Append-only, segmented JSON-Lines log for fingerprint events.
+
+The old implementation re-read public/fingerprint-logs.json, appended one entry and
+re-serialized the whole (pretty-printed) list on every request. Here each entry is a
+single line appended to the active segment; segments are rotated by size or age and
+old ones are dropped by count. Readers walk segments newest-first and read each file
+backwards, so "last 100" only parses the tail of the history.
+"""
+import json
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from time import time
+
+from metrics import add_bytes, timed
+from persistence import app_store, file_lock
+from serialization import dumps, loads
+
+BASE_DIR = Path(__file__).resolve().parent
+PUBLIC_DIR = (BASE_DIR / ".." / "public").resolve()
+LEGACY_LOGS_PATH = PUBLIC_DIR / "fingerprint-logs.json"
+FINGERPRINT_LOG_DIR = Path(os.getenv("FINGERPRINT_LOG_DIR") or (BASE_DIR / "fingerprint_logs"))
+
+SEGMENT_MAX_BYTES = int(os.getenv("FINGERPRINT_SEGMENT_MAX_BYTES", str(4 * 1024 * 1024)))
+SEGMENT_MAX_AGE_SECONDS = int(os.getenv("FINGERPRINT_SEGMENT_MAX_AGE", str(24 * 60 * 60)))
+SEGMENT_RETENTION = int(os.getenv("FINGERPRINT_SEGMENT_RETENTION", "10"))
+# "always": fsync every append, "interval": at most once per FSYNC_INTERVAL, "never": leave it to the OS
+FSYNC_POLICY = (os.getenv("FINGERPRINT_LOG_FSYNC") or "interval").lower()
+FSYNC_INTERVAL_SECONDS = float(os.getenv("FINGERPRINT_LOG_FSYNC_INTERVAL", "1.0"))
+
+_SEGMENT_RE = re.compile(r"^segment-(\d{8})\.jsonl$")
+_READ_CHUNK = 64 * 1024
+
+
+def _segment_name(seg_id: int) -> str:
+    return f"segment-{seg_id:08d}.jsonl"
+
+
+def _read_lines_reverse(path: Path, end: int | None = None):
+    """Yield the raw lines of `path` (bytes, without newline) from last to first."""
+    with path.open("rb") as f:
+        pos = f.seek(0, os.SEEK_END) if end is None else end
+        tail = b""
+        while pos > 0:
+            step = min(_READ_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + tail
+            lines = chunk.split(b"\n")
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if tail:
+            yield tail
+
+
+class SegmentedLog:
+    def __init__(self, directory: Path = FINGERPRINT_LOG_DIR,
+                 max_bytes: int = SEGMENT_MAX_BYTES,
+                 max_age_seconds: int = SEGMENT_MAX_AGE_SECONDS,
+                 retention: int = SEGMENT_RETENTION,
+                 fsync_policy: str = FSYNC_POLICY,
+                 fsync_interval: float = FSYNC_INTERVAL_SECONDS):
+        if fsync_policy not in ("always", "interval", "never"):
+            raise ValueError(f"unknown fsync policy: {fsync_policy}")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.retention = max(1, retention)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._fh = None
+        self._active_id = 0
+        self._active_size = 0
+        self._active_opened = 0.0
+        self._last_fsync = 0.0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._open_active()
+
+    # --- segment management ---
+    def segment_ids(self) -> list[int]:
+        ids = []
+        for p in self.directory.iterdir():
+            m = _SEGMENT_RE.match(p.name)
+            if m:
+                ids.append(int(m.group(1)))
+        return sorted(ids)
+
+    def segment_path(self, seg_id: int) -> Path:
+        return self.directory / _segment_name(seg_id)
+
+    def _open_active(self) -> None:
+        ids = self.segment_ids()
+        self._active_id = ids[-1] if ids else 1
+        path = self.segment_path(self._active_id)
+        self._fh = path.open("ab")
+        self._active_size = self._fh.tell()
+        self._active_opened = path.stat().st_mtime if self._active_size else time()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self._active_size == 0:
+            return False
+        if self._active_size + incoming > self.max_bytes:
+            return True
+        return self.max_age_seconds > 0 and time() - self._active_opened >= self.max_age_seconds
+
+    def rotate(self) -> None:
+        with self._lock:
+            self._sync(force=True)
+            self._fh.close()
+            self._active_id += 1
+            self._fh = self.segment_path(self._active_id).open("ab")
+            self._active_size = 0
+            self._active_opened = time()
+            dropped = self._apply_retention()
+            if dropped:
+                self._on_segments_dropped(max(dropped))
+
+    def _apply_retention(self) -> list[int]:
+        dropped = []
+        ids = self.segment_ids()
+        for seg_id in ids[:-self.retention]:
+            try:
+                self.segment_path(seg_id).unlink()
+                dropped.append(seg_id)
+            except FileNotFoundError:
+                pass
+        return dropped
+
+    def _on_segments_dropped(self, upto_seg_id: int) -> None:
+        """Hook for subclasses keeping state about entries in dropped segments."""
+
+    def _sync(self, force: bool = False) -> None:
+        self._fh.flush()
+        if self.fsync_policy == "never" and not force:
+            return
+        now = time()
+        if force or self.fsync_policy == "always" or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._fh.fileno())
+            self._last_fsync = now
+
+    def _follow(self) -> None:
+        """Switch to the newest segment if another process rotated, and resync the size."""
+        ids = self.segment_ids()
+        if ids and ids[-1] > self._active_id:
+            self._fh.close()
+            self._open_active()
+        self._active_size = os.fstat(self._fh.fileno()).st_size
+
+    def _before_write(self) -> None:
+        """Hook run under the cross-process lock right before an entry is written."""
+
+    # --- writing ---
+    def append(self, entry: dict) -> tuple[int, int]:
+        """Append one entry; returns (segment id, byte offset) of the written line.
+
+        Writers in other worker processes are serialized with an flock on the log
+        directory, so lines never interleave and offsets stay exact.
+        """
+        line = dumps(entry, pretty=False) + b"\n"
+        add_bytes("fingerprint_log", "append", len(line))
+        with timed("fingerprint_log", "append"), self._lock, file_lock(self.directory / "segments"):
+            self._follow()
+            self._before_write()
+            if self._should_rotate(len(line)):
+                self.rotate()
+            offset = self._active_size
+            self._fh.write(line)
+            self._active_size += len(line)
+            self._sync()
+            return self._active_id, offset
+
+    def flush(self) -> None:
+        with self._lock:
+            self._sync(force=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh and not self._fh.closed:
+                self._sync(force=True)
+                self._fh.close()
+
+    # --- reading ---
+    def iter_reverse(self):
+        """Yield entries newest-first across all retained segments."""
+        with self._lock:
+            self._fh.flush()
+            ids = self.segment_ids()
+        for seg_id in reversed(ids):
+            path = self.segment_path(seg_id)
+            try:
+                for raw in _read_lines_reverse(path):
+                    try:
+                        yield loads(raw)
+                    except ValueError:
+                        continue  # torn write at the tail of a crashed segment
+            except FileNotFoundError:
+                continue  # dropped by retention while we were reading
+
+    def iter_forward(self, start: tuple[int, int] = (0, 0)):
+        """Yield (segment id, offset, end offset, entry) oldest-first from `start`.
+
+        `entry` is None for an unparsable line. Stops at a trailing line without
+        newline (a write still in progress in another process).
+        """
+        with self._lock:
+            self._fh.flush()
+            ids = self.segment_ids()
+        for seg_id in ids:
+            if seg_id < start[0]:
+                continue
+            offset = start[1] if seg_id == start[0] else 0
+            try:
+                with self.segment_path(seg_id).open("rb") as f:
+                    f.seek(offset)
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            return
+                        pos, offset = offset, offset + len(raw)
+                        try:
+                            entry = loads(raw)
+                        except ValueError:
+                            entry = None
+                        yield seg_id, pos, offset, entry
+            except FileNotFoundError:
+                continue
+
+    def read_at(self, seg_id: int, offset: int) -> dict | None:
+        """Read the single entry starting at `offset` in segment `seg_id`."""
+        try:
+            with self.segment_path(seg_id).open("rb") as f:
+                f.seek(offset)
+                return loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def tail(self, limit: int, predicate=None) -> list:
+        out = []
+        if limit <= 0:
+            return out
+        for entry in self.iter_reverse():
+            if predicate is None or predicate(entry):
+                out.append(entry)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def import_legacy(self, path: Path = LEGACY_LOGS_PATH) -> int:
+        """One-shot import of the old pretty-printed JSON array into the log."""
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if not isinstance(data, list):
+            return 0
+        count = 0
+        with self._lock:
+            for entry in data:
+                if isinstance(entry, dict):
+                    self.append(entry)
+                    count += 1
+            self.flush()
+        return count
+
+
+def _normalize_ts(value: str | None) -> str | None:
+    """ISO timestamps are stored as naive UTC (datetime.utcnow().isoformat())."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1]
+    if value.endswith("+00:00"):
+        value = value[:-6]
+    return value
+
+
+def encode_cursor(pos: tuple[int, int]) -> str:
+    return f"{pos[0]}.{pos[1]}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    seg, _, off = (cursor or "").partition(".")
+    try:
+        return int(seg), int(off)
+    except ValueError:
+        raise ValueError("invalid cursor") from None
+
+
+class IndexedFingerprintLog(SegmentedLog):
+    """Segmented log with in-memory secondary indexes for the SOC dashboard queries.
+
+    Every retained entry is identified by its (segment id, byte offset), which is
+    ordered and stable across restarts, so it doubles as the pagination cursor.
+    Posting lists per email / action / visitorId hold absolute entry numbers in
+    ascending order; a query walks the shortest applicable list backwards from the
+    cursor and checks the remaining filters against the in-memory columns, then
+    reads only the matching lines from disk. Time bounds use bisection on the
+    server timestamps, which are appended in order.
+    """
+
+    _INDEXED = ("email", "action", "visitorId")
+
+    def __init__(self, *args, **kwargs):
+        self._ilock = threading.RLock()
+        self._base = 0  # absolute number of the first retained entry
+        self._pos: list[tuple[int, int]] = []
+        self._ts: list[str] = []
+        self._cols: dict[str, list] = {name: [] for name in self._INDEXED}
+        self._postings: dict[str, dict[str, list[int]]] = {name: {} for name in self._INDEXED}
+        self._tail = (0, 0)  # next unread position
+        super().__init__(*args, **kwargs)
+        self._catch_up()
+
+    def _catch_up(self) -> None:
+        """Index entries appended by other worker processes since we last looked."""
+        # Same lock order as append() (writer lock, then index lock): iter_forward
+        # needs the writer lock, and append() calls back into here while holding it.
+        with self._lock, self._ilock:
+            ids = self.segment_ids()
+            if ids and self._pos and self._pos[0][0] < ids[0]:
+                self._on_segments_dropped(ids[0] - 1)
+            for seg_id, offset, end, entry in self.iter_forward(self._tail):
+                if isinstance(entry, dict):
+                    self._index(seg_id, offset, entry)
+                self._tail = (seg_id, end)
+
+    def _before_write(self) -> None:
+        self._catch_up()
+
+    @staticmethod
+    def _keys(entry: dict) -> dict:
+        """Index keys of an entry. Values that are not strings are left unindexed: a line
+        already on disk is re-indexed on every start, so it must never fail here."""
+        fp = entry.get("fingerprint")
+        email, action = entry.get("email"), entry.get("action")
+        visitor_id = fp.get("visitorId") if isinstance(fp, dict) else None
+        return {
+            "email": (email.lower() or None) if isinstance(email, str) else None,
+            "action": (action or None) if isinstance(action, str) else None,
+            "visitorId": (visitor_id or None) if isinstance(visitor_id, str) else None,
+        }
+
+    def _index(self, seg_id: int, offset: int, entry: dict) -> None:
+        with self._ilock:
+            n = self._base + len(self._pos)
+            self._pos.append((seg_id, offset))
+            self._ts.append(str(entry.get("timestamp") or ""))
+            for name, key in self._keys(entry).items():
+                self._cols[name].append(key)
+                if key is not None:
+                    self._postings[name].setdefault(key, []).append(n)
+
+    def append(self, entry: dict) -> tuple[int, int]:
+        with self._lock:
+            pos = super().append(entry)
+            with self._ilock:
+                self._index(pos[0], pos[1], entry)
+                self._tail = (pos[0], self._active_size)
+            return pos
+
+    def _on_segments_dropped(self, upto_seg_id: int) -> None:
+        with self._ilock:
+            cut = bisect_left(self._pos, (upto_seg_id + 1, 0))
+            if cut <= 0:
+                return
+            del self._pos[:cut]
+            del self._ts[:cut]
+            for col in self._cols.values():
+                del col[:cut]
+            self._base += cut
+            for postings in self._postings.values():
+                for key in list(postings):
+                    plist = postings[key]
+                    i = bisect_left(plist, self._base)
+                    if i >= len(plist):
+                        del postings[key]
+                    elif i:
+                        del plist[:i]
+
+    @property
+    def version(self) -> tuple:
+        """Changes whenever an entry is appended (by any worker) or retention drops some."""
+        self._catch_up()
+        with self._ilock:
+            return self._base, self._tail
+
+    @timed("fingerprint_log", "query")
+    def query(self, email: str | None = None, action: str | None = None,
+              visitor_id: str | None = None, since: str | None = None,
+              until: str | None = None, cursor: str | None = None,
+              limit: int = 100) -> tuple[list, str | None]:
+        """Newest-first page of matching entries and the cursor for the next page."""
+        filters = {
+            "email": (email or "").lower() or None,
+            "action": action or None,
+            "visitorId": visitor_id or None,
+        }
+        filters = {k: v for k, v in filters.items() if v is not None}
+        since, until = _normalize_ts(since), _normalize_ts(until)
+        self._catch_up()
+        with self._ilock:
+            base = self._base
+            hi = base + len(self._pos)  # exclusive
+            lo = base
+            if cursor:
+                hi = min(hi, base + bisect_left(self._pos, decode_cursor(cursor)))
+            if until:
+                hi = min(hi, base + bisect_right(self._ts, until))
+            if since:
+                lo = max(lo, base + bisect_left(self._ts, since))
+
+            if filters:
+                driver = min(filters, key=lambda k: len(self._postings[k].get(filters[k], ())))
+                plist = self._postings[driver].get(filters[driver], [])
+                candidates = (plist[i] for i in range(bisect_left(plist, hi) - 1, bisect_left(plist, lo) - 1, -1))
+            else:
+                candidates = iter(range(hi - 1, lo - 1, -1))
+
+            hits: list[tuple[int, int]] = []
+            for n in candidates:
+                i = n - base
+                if all(self._cols[k][i] == v for k, v in filters.items()):
+                    hits.append(self._pos[i])
+                    if len(hits) > limit:
+                        break
+
+        more = len(hits) > limit
+        hits = hits[:limit]
+        logs = [e for e in (self.read_at(seg, off) for seg, off in hits) if e is not None]
+        next_cursor = encode_cursor(hits[-1]) if more and hits else None
+        return logs, next_cursor
+
+
+def _create_fingerprint_log(config) -> IndexedFingerprintLog:
+    log = IndexedFingerprintLog(Path(config.get("FINGERPRINT_LOG_DIR") or FINGERPRINT_LOG_DIR))
+    # Only one worker imports the legacy file, and only into an empty log
+    marker = log.directory / ".legacy-imported"
+    with file_lock(log.directory / "segments"):
+        if not marker.exists():
+            if not log._pos:
+                log.import_legacy()
+            marker.touch()
+    return log
+
+
+def get_fingerprint_log() -> IndexedFingerprintLog:
+    return app_store("fingerprint_log", _create_fingerprint_log, "FINGERPRINT_LOG_DIR")
@@ -0,0 +1,76 @@
+"""Cached JSON responses with strong ETags for frequently polled GET routes.
+
+The login page polls GET /accounts after every signup and password reset, and
+the security dashboard re-fetches the same fingerprint-log pages. Both answers
+only change when their store does. So we keep the encoded body and its ETag per
+(request key, store version):
+
+- If the client sends a matching If-None-Match, the answer is a 304 with no body.
+- If the store has not changed, the cached bytes are served without re-encoding.
+- Otherwise the body is rebuilt once, and the cache moves to the new version.
+
+The ETag is a hash of the body, so every worker hands out the same tag for the
+same content, whichever one served the original request.
+
+Caches belong to the app (app_cache): an app created with its own store paths has
+its own stores, whose version counters say nothing about another app's data.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+from serialization import dumps
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[object, tuple[object, bytes, str]] = OrderedDict()
+
+    def get(self, key, version, build) -> tuple[bytes, str]:
+        """(body, etag) for `key` at `version`; `build()` returns the JSON payload on a miss."""
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] == version:
+                self._entries.move_to_end(key)
+                return hit[1], hit[2]
+        body = dumps(build())
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        with self._lock:
+            self._entries[key] = (version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_app_caches_lock = threading.Lock()
+
+
+def app_cache(name: str) -> ResponseCache:
+    """The current app's ResponseCache called `name`, kept in app.extensions."""
+    caches = current_app.extensions.setdefault("response_cache", {})
+    cache = caches.get(name)
+    if cache is None:
+        with _app_caches_lock:
+            cache = caches.setdefault(name, ResponseCache())
+    return cache
+
+
+def cached_json(cache: ResponseCache, key, version, build) -> Response:
+    """JSON response for the current request, honouring If-None-Match."""
+    body, etag = cache.get(key, version, build)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate; the 304 is the cheap path
+    return response
@@ -0,0 +1,484 @@
+"""Per-user location history and impossible-travel detection for /security/location-check.
+
+The route used to compare each login against a single last point in
+last_locations.json. This module keeps, for every user:
+
+- a ring buffer of the most recent fixes (LOCATION_RING_SIZE);
+- a grid index of every cell the user has been seen in, so "has this user been near
+  here before?" is a handful of dict lookups regardless of history length;
+
+and evaluates a new fix against the whole ring at once. Distances use a NumPy
+haversine when NumPy is installed and a math loop otherwise. A fix is impossible
+travel when reaching it from any recent fix would need more than
+LOCATION_MAX_SPEED_KMH. Both fix accuracies are subtracted from the distance first,
+so GPS jitter cannot trigger it. Fixes stamped at or after the new one (clock skew,
+replays) say nothing about speed and are left out of that check.
+
+Coordinates, accuracy and timestamp are validated (parse_coords, parse_timestamp);
+invalid input raises ValueError, which the routes turn into a 400.
+
+State lives in SQLite (WAL) next to the other backend stores, with a small
+in-memory cache of recently active users. last_locations.json is imported once.
+A single check that raises an alert (is_alert) commits a LocationJumpDetected
+event with the fix, in this database's outbox (see events.py).
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional; falls back to the scalar implementation
+    np = None
+
+import events
+from metrics import timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+LOCATIONS_DB_PATH = Path(os.getenv("LOCATIONS_DB_PATH") or (BASE_DIR / "locations.db"))
+LEGACY_LAST_LOCATIONS_PATH = BASE_DIR / "last_locations.json"
+
+EARTH_RADIUS_KM = 6371.0
+RING_SIZE = int(os.getenv("LOCATION_RING_SIZE", "50"))
+CELL_KM = float(os.getenv("LOCATION_NEAR_KM", "25"))
+MAX_SPEED_KMH = float(os.getenv("LOCATION_MAX_SPEED_KMH", "900"))  # roughly airliner cruise
+CACHED_USERS = int(os.getenv("LOCATION_CACHED_USERS", "10000"))
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points on Earth (km)."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_km_many(lat: float, lon: float, lats, lons):
+    """Distances (km) from one point to many; a NumPy array when NumPy is available."""
+    if np is None:
+        return [haversine_km(lat, lon, la, lo) for la, lo in zip(lats, lons)]
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    phi = math.radians(lat)
+    a = (np.sin((lats - phi) / 2) ** 2
+         + math.cos(phi) * np.cos(lats) * np.sin((lons - math.radians(lon)) / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def parse_epoch(ts: str | None) -> float | None:
+    """ISO-8601 (optionally with Z) to epoch seconds; naive timestamps are UTC."""
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(ts).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def parse_accuracy(value) -> float | None:
+    """coords.accuracy in metres: None when absent, else a finite number >= 0 (ValueError otherwise)."""
+    if value is None or value == "":
+        return None
+    try:
+        accuracy = float(value)
+    except (TypeError, ValueError):
+        accuracy = math.nan
+    if isinstance(value, bool) or not math.isfinite(accuracy) or accuracy < 0:
+        raise ValueError("coords.accuracy must be a non-negative number of metres")
+    return accuracy
+
+
+def parse_coords(coords) -> tuple[float, float, float | None]:
+    """(lat, lon, accuracy) from a request's coords object; ValueError if any is invalid."""
+    try:
+        lat, lon = float(coords.get("lat")), float(coords.get("lon"))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Valid coords.lat and coords.lon required") from None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):  # also rejects NaN
+        raise ValueError("Valid coords.lat and coords.lon required")
+    return lat, lon, parse_accuracy(coords.get("accuracy"))
+
+
+def parse_timestamp(value) -> tuple[str, float]:
+    """A request's ISO-8601 timestamp (now when absent) and its epoch; ValueError if unparseable."""
+    if value is None or value == "":
+        value = datetime.utcnow().isoformat()
+    epoch = parse_epoch(value) if isinstance(value, str) else None
+    if epoch is None:
+        raise ValueError("timestamp must be an ISO-8601 date-time")
+    return value, epoch
+
+
+def _accuracy_km(value) -> float:
+    """A stored fix's accuracy radius in km. Rows written before validation may hold anything."""
+    try:
+        return (parse_accuracy(value) or 0.0) / 1000.0
+    except ValueError:
+        return 0.0
+
+
+def _top_speed_kmh(distances, epochs, accs_km, epoch: float, acc_km: float) -> float | None:
+    """Highest speed (km/h) needed to reach the new fix from any earlier fix.
+
+    Distances are reduced by both fixes' accuracy radii. Fixes with no timestamp, or
+    not strictly earlier than the new one, cannot be evaluated and are skipped; None
+    when none are left.
+    """
+    if np is not None:
+        epochs = np.array([np.nan if e is None else e for e in epochs], dtype=float)
+        with np.errstate(invalid="ignore"):
+            hours = (epoch - epochs) / 3600.0
+            valid = hours > 0  # False for NaN
+        if not valid.any():
+            return None
+        slack = np.maximum(0.0, np.asarray(distances, dtype=float)[valid]
+                           - np.asarray(accs_km, dtype=float)[valid] - acc_km)
+        return float((slack / hours[valid]).max())
+    top = None
+    for d, e, a in zip(distances, epochs, accs_km):
+        if e is None or epoch - e <= 0:
+            continue
+        speed = max(0.0, float(d) - a - acc_km) / ((epoch - e) / 3600.0)
+        if top is None or speed > top:
+            top = speed
+    return top
+
+
+def cell_of(lat: float, lon: float, cell_km: float = CELL_KM) -> tuple[int, int]:
+    step = cell_km / KM_PER_DEG_LAT
+    return math.floor(lat / step), math.floor(lon / step)
+
+
+def neighbour_cells(lat: float, lon: float, cell_km: float = CELL_KM):
+    """Cells within roughly one cell size of (lat, lon); wider in longitude near the poles."""
+    ci, cj = cell_of(lat, lon, cell_km)
+    shrink = max(math.cos(math.radians(lat)), 0.01)
+    span = math.ceil(1 / shrink)
+    for di in (-1, 0, 1):
+        for dj in range(-span, span + 1):
+            yield ci + di, cj + dj
+
+
+def is_alert(result: dict, threshold_km: float | None = None) -> bool:
+    """Alert when the fix is physically unreachable from a recent one, or when it is
+    more than `threshold_km` (LOCATION_ALERT_KM) from the last login and somewhere
+    the user has not been before."""
+    if threshold_km is None:
+        threshold_km = float(os.getenv("LOCATION_ALERT_KM", "100"))  # configurable; default 100km
+    distance_km = result.get("distanceKm")
+    far_jump = distance_km is not None and distance_km > threshold_km and not result.get("knownLocation")
+    return bool(far_jump or result.get("impossibleTravel"))
+
+
+class _UserState:
+    __slots__ = ("fixes", "cells")
+
+    def __init__(self, ring_size: int):
+        self.fixes: deque = deque(maxlen=ring_size)  # oldest -> newest
+        self.cells: dict[tuple[int, int], int] = {}
+
+
+class LocationHistory:
+    def __init__(self, db_path: Path = LOCATIONS_DB_PATH, ring_size: int = RING_SIZE,
+                 cell_km: float = CELL_KM, max_speed_kmh: float = MAX_SPEED_KMH,
+                 cached_users: int = CACHED_USERS):
+        self.ring_size = ring_size
+        self.cell_km = cell_km
+        self.max_speed_kmh = max_speed_kmh
+        self.cached_users = cached_users
+        self._lock = threading.RLock()
+        self._users: OrderedDict[str, _UserState] = OrderedDict()
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fixes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " email TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL,"
+            " accuracy REAL, timestamp TEXT, epoch REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fixes_email ON fixes (email, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cells ("
+            " email TEXT NOT NULL, ci INTEGER NOT NULL, cj INTEGER NOT NULL,"
+            " count INTEGER NOT NULL, last_seen TEXT,"
+            " PRIMARY KEY (email, ci, cj))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        events.create_outbox(self._conn)
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # --- cache ---
+    def _refresh(self) -> None:
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._users.clear()  # another worker wrote; reload users lazily
+            self._data_version = version
+
+    def _state(self, email: str) -> _UserState:
+        state = self._users.get(email)
+        if state is not None:
+            self._users.move_to_end(email)
+            return state
+        with timed("locations", "load"):
+            state = self._load_state(email)
+        self._users[email] = state
+        while len(self._users) > self.cached_users:
+            self._users.popitem(last=False)
+        return state
+
+    def _load_state(self, email: str) -> _UserState:
+        state = _UserState(self.ring_size)
+        rows = self._conn.execute(
+            "SELECT lat, lon, accuracy, timestamp, epoch FROM fixes WHERE email = ?"
+            " ORDER BY id DESC LIMIT ?", (email, self.ring_size)).fetchall()
+        for lat, lon, accuracy, ts, epoch in reversed(rows):
+            state.fixes.append({"lat": lat, "lon": lon, "accuracy": accuracy, "timestamp": ts, "epoch": epoch})
+        for ci, cj, count in self._conn.execute(
+                "SELECT ci, cj, count FROM cells WHERE email = ?", (email,)):
+            state.cells[(ci, cj)] = count
+        return state
+
+    # --- queries ---
+    def history(self, email: str) -> list:
+        with self._lock:
+            self._refresh()
+            return [dict(f) for f in self._state(email).fixes]
+
+    def last(self, email: str) -> dict | None:
+        with self._lock:
+            self._refresh()
+            fixes = self._state(email).fixes
+            return dict(fixes[-1]) if fixes else None
+
+    def has_been_near(self, email: str, lat: float, lon: float) -> bool:
+        with self._lock:
+            self._refresh()
+            cells = self._state(email).cells
+            return any(c in cells for c in neighbour_cells(lat, lon, self.cell_km))
+
+    def _evaluate(self, state: _UserState, lat: float, lon: float, accuracy, epoch,
+                  max_speed_kmh: float | None = None) -> dict:
+        fixes = state.fixes
+        result = {
+            "prev": None,
+            "distanceKm": None,
+            "knownLocation": any(c in state.cells for c in neighbour_cells(lat, lon, self.cell_km)),
+            "speedKmh": None,
+            "impossibleTravel": False,
+        }
+        if not fixes:
+            return result
+        prev = fixes[-1]
+        result["prev"] = {k: prev[k] for k in ("lat", "lon", "accuracy", "timestamp")}
+        distances = haversine_km_many(lat, lon, [f["lat"] for f in fixes], [f["lon"] for f in fixes])
+        result["distanceKm"] = float(distances[-1])
+        if epoch is None:
+            return result
+        # Fastest speed needed to get here from any earlier fix, allowing for fix accuracy
+        top_speed = _top_speed_kmh(
+            distances,
+            [f["epoch"] for f in fixes],
+            [_accuracy_km(f["accuracy"]) for f in fixes],
+            epoch, _accuracy_km(accuracy),
+        )
+        if top_speed is not None:
+            result["speedKmh"] = round(top_speed, 1)
+            limit = self.max_speed_kmh if max_speed_kmh is None else max_speed_kmh
+            result["impossibleTravel"] = top_speed > limit
+        return result
+
+    def evaluate(self, email: str, lat: float, lon: float, accuracy=None, timestamp: str | None = None) -> dict:
+        """Assess a fix against the user's history without recording it."""
+        accuracy = parse_accuracy(accuracy)
+        epoch = parse_timestamp(timestamp)[1]
+        with self._lock:
+            self._refresh()
+            return self._evaluate(self._state(email), lat, lon, accuracy, epoch)
+
+    # --- writes ---
+    def _record(self, email: str, state: _UserState, fix: dict) -> None:
+        cell = cell_of(fix["lat"], fix["lon"], self.cell_km)
+        self._conn.execute(
+            "INSERT INTO fixes (email, lat, lon, accuracy, timestamp, epoch) VALUES (?, ?, ?, ?, ?, ?)",
+            (email, fix["lat"], fix["lon"], fix["accuracy"], fix["timestamp"], fix["epoch"]))
+        self._conn.execute(
+            "DELETE FROM fixes WHERE email = ? AND id NOT IN"
+            " (SELECT id FROM fixes WHERE email = ? ORDER BY id DESC LIMIT ?)",
+            (email, email, self.ring_size))
+        self._conn.execute(
+            "INSERT INTO cells (email, ci, cj, count, last_seen) VALUES (?, ?, ?, 1, ?)"
+            " ON CONFLICT(email, ci, cj) DO UPDATE SET count = count + 1, last_seen = excluded.last_seen",
+            (email, cell[0], cell[1], fix["timestamp"]))
+        state.fixes.append(fix)
+        state.cells[cell] = state.cells.get(cell, 0) + 1
+
+    @timed("locations", "check")
+    def check(self, email: str, lat: float, lon: float, accuracy=None, timestamp: str | None = None) -> dict:
+        """Evaluate a fix against the history, then record it. Returns the evaluation
+        plus `saved`, the stored fix, and `alert` (is_alert); an alert for a known
+        email is recorded as a LocationJumpDetected event. Raises ValueError for an
+        invalid accuracy or timestamp."""
+        accuracy = parse_accuracy(accuracy)
+        ts, epoch = parse_timestamp(timestamp)
+        fix = {"lat": lat, "lon": lon, "accuracy": accuracy, "timestamp": ts, "epoch": epoch}
+        with self._lock:
+            self._refresh()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Under the write lock: re-read in case another worker just wrote
+                self._refresh()
+                state = self._state(email)
+                result = self._evaluate(state, lat, lon, accuracy, fix["epoch"])
+                self._record(email, state, fix)
+                result["saved"] = {k: fix[k] for k in ("lat", "lon", "accuracy", "timestamp")}
+                result["alert"] = is_alert(result)
+                if result["alert"] and email:
+                    events.enqueue(self._conn, events.LOCATION_JUMP_DETECTED, {"email": email, **result})
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._users.pop(email, None)
+                raise
+            self._conn.execute("COMMIT")
+        if result["alert"] and email:
+            events.wake()
+        return result
+
+    @timed("locations", "check_batch")
+    def check_many(self, items, persist: bool = True, max_speed_kmh: float | None = None,
+                   threshold_km: float | None = None) -> list:
+        """Evaluate many fixes in input order, as if each had hit check() in turn.
+
+        `items` are dicts {email, coords: {lat, lon, accuracy?}, timestamp?}. Each
+        result carries `index` and either the evaluation (plus `alert`) or `error`:
+        an item with any invalid field is reported and skipped, the rest go ahead.
+        With persist=True every accepted fix is written in a single transaction at
+        the end; with persist=False (back-testing) the history is left untouched.
+        """
+        results = []
+        pending: list[tuple[str, dict, tuple[int, int]]] = []
+        with self._lock:
+            self._refresh()
+            if persist:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._refresh()
+            try:
+                scratch: dict[str, _UserState] = {}
+                for i, item in enumerate(items):
+                    if not isinstance(item, dict):
+                        results.append({"index": i, "error": "Each item must be an object"})
+                        continue
+                    try:
+                        email = str(item.get("email") or "").strip().lower()
+                        lat, lon, accuracy = parse_coords(item.get("coords") or {})
+                        ts, epoch = parse_timestamp(item.get("timestamp"))
+                    except ValueError as e:
+                        results.append({"index": i, "error": str(e)})
+                        continue
+                    fix = {"lat": lat, "lon": lon, "accuracy": accuracy, "timestamp": ts, "epoch": epoch}
+                    state = scratch.get(email)
+                    if state is None:
+                        # Work on a copy so a dry run (or a rollback) leaves the cache intact
+                        live = self._state(email)
+                        state = scratch[email] = _UserState(self.ring_size)
+                        state.fixes.extend(live.fixes)
+                        state.cells.update(live.cells)
+                    result = self._evaluate(state, lat, lon, accuracy, fix["epoch"], max_speed_kmh)
+                    result["alert"] = is_alert(result, threshold_km)
+                    result["saved"] = {k: fix[k] for k in ("lat", "lon", "accuracy", "timestamp")}
+                    result["index"] = i
+                    results.append(result)
+                    cell = cell_of(lat, lon, self.cell_km)
+                    state.fixes.append(fix)
+                    state.cells[cell] = state.cells.get(cell, 0) + 1
+                    pending.append((email, fix, cell))
+                if persist and pending:
+                    self._flush(pending)
+            except Exception:
+                if persist:
+                    self._conn.execute("ROLLBACK")
+                raise
+            if persist:
+                self._conn.execute("COMMIT")
+                for email, state in scratch.items():
+                    self._users[email] = state
+        return results
+
+    def _flush(self, pending: list) -> None:
+        """Write a batch of recorded fixes: bulk inserts, one prune per user."""
+        self._conn.executemany(
+            "INSERT INTO fixes (email, lat, lon, accuracy, timestamp, epoch) VALUES (?, ?, ?, ?, ?, ?)",
+            [(e, f["lat"], f["lon"], f["accuracy"], f["timestamp"], f["epoch"]) for e, f, _ in pending])
+        cells: dict[tuple, list] = {}
+        for email, fix, cell in pending:
+            agg = cells.setdefault((email, cell[0], cell[1]), [0, None])
+            agg[0] += 1
+            agg[1] = fix["timestamp"]
+        self._conn.executemany(
+            "INSERT INTO cells (email, ci, cj, count, last_seen) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(email, ci, cj) DO UPDATE SET count = count + excluded.count,"
+            " last_seen = excluded.last_seen",
+            [(k[0], k[1], k[2], v[0], v[1]) for k, v in cells.items()])
+        self._conn.executemany(
+            "DELETE FROM fixes WHERE email = ? AND id NOT IN"
+            " (SELECT id FROM fixes WHERE email = ? ORDER BY id DESC LIMIT ?)",
+            [(e, e, self.ring_size) for e in {e for e, _, _ in pending}])
+
+    def import_last_locations(self, path: Path = LEGACY_LAST_LOCATIONS_PATH) -> int:
+        """One-shot import of the legacy {email: last fix} file."""
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        with self._lock:
+            count = 0
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                for email, loc in (data.items() if isinstance(data, dict) else ()):
+                    try:
+                        lat, lon = float(loc["lat"]), float(loc["lon"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    try:
+                        accuracy = parse_accuracy(loc.get("accuracy"))
+                    except ValueError:
+                        accuracy = None
+                    ts = loc.get("timestamp")
+                    fix = {"lat": lat, "lon": lon, "accuracy": accuracy, "timestamp": ts, "epoch": parse_epoch(ts)}
+                    self._record(email, self._state(email), fix)
+                    count += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._users.clear()
+                raise
+            self._conn.execute("COMMIT")
+            return count
+
+
+def _create_location_history(config) -> LocationHistory:
+    history = LocationHistory(Path(config.get("LOCATIONS_DB_PATH") or LOCATIONS_DB_PATH))
+    history.import_last_locations()
+    return history
+
+
+def get_location_history() -> LocationHistory:
+    return app_store("locations", _create_location_history, "LOCATIONS_DB_PATH")
@@ -0,0 +1,82 @@
+"""Location routes: impossible-travel checks for single logins and in batches."""
+import os
+
+from flask import Blueprint, jsonify, request
+
+import serialization
+from location_history import get_location_history, parse_coords, parse_timestamp
+from risk_engine import get_risk_engine
+
+bp = Blueprint("location", __name__)
+
+
+@bp.route('/security/location-check', methods=['POST'])
+def security_location_check():
+    """Store user's last known location; the user is emailed (off the request) if the new login is far away.
+
+    Request JSON: { email: str, coords: { lat: number, lon: number, accuracy?: number }, timestamp?: str }
+    Response JSON: { success: true, alert: bool, distanceKm?: number, speedKmh?: number,
+                     impossibleTravel: bool, knownLocation: bool, prev?: {...}, saved: {...} }
+    """
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip().lower()
+    try:
+        lat, lon, accuracy = parse_coords(body.get('coords') or {})
+        ts = parse_timestamp(body.get('timestamp'))[0]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Evaluate against the user's location history, then record this fix. An alert is
+    # committed as a LocationJumpDetected event; subscribers.py emails the user.
+    result = get_location_history().check(email, lat, lon, accuracy, ts)
+    get_risk_engine().on_location_check(email, result)
+
+    return jsonify({
+        'success': True,
+        'alert': result['alert'],
+        'distanceKm': result['distanceKm'],
+        'speedKmh': result['speedKmh'],
+        'impossibleTravel': result['impossibleTravel'],
+        'knownLocation': result['knownLocation'],
+        'prev': result['prev'],
+        'saved': result['saved'],
+    })
+
+@bp.route('/security/location-check/batch', methods=['POST'])
+def security_location_check_batch():
+    """Evaluate many location checks in one pass (back-testing / replays).
+
+    Body: a JSON array (or {"items": [...]}) or NDJSON (Content-Type application/x-ndjson)
+    of { email, coords: { lat, lon, accuracy? }, timestamp? }.
+    Query: dryRun=1 evaluates without recording; thresholdKm / maxSpeedKmh override
+    the alert thresholds for this batch. No alert emails are sent.
+    Response JSON: { results: [ { index, alert, distanceKm, speedKmh, ... } | { index, error } ] }
+    """
+    raw = request.get_data(cache=False)
+    try:
+        if 'ndjson' in (request.content_type or '') or raw.lstrip()[:1] not in (b'[', b'{'):
+            items = [serialization.loads(line) for line in raw.splitlines() if line.strip()]
+        else:
+            data = serialization.loads(raw or b'[]')
+            items = data.get('items') if isinstance(data, dict) else data
+    except ValueError:
+        return jsonify({"error": "Body must be a JSON array or NDJSON"}), 400
+    if items is None:
+        # e.g. a one-line NDJSON body sent without the ndjson content type
+        return jsonify({"error": 'Body must be a JSON array, {"items": [...]} or NDJSON'}), 400
+    if not isinstance(items, list):
+        return jsonify({"error": "items must be a list"}), 400
+    max_items = int(os.getenv('LOCATION_BATCH_MAX', '100000'))
+    if len(items) > max_items:
+        return jsonify({"error": f"At most {max_items} items per batch"}), 413
+    try:
+        threshold_km = float(request.args['thresholdKm']) if 'thresholdKm' in request.args else None
+        max_speed = float(request.args['maxSpeedKmh']) if 'maxSpeedKmh' in request.args else None
+    except ValueError:
+        return jsonify({"error": "thresholdKm and maxSpeedKmh must be numbers"}), 400
+    dry_run = request.args.get('dryRun', '').lower() in ('1', 'true', 'yes')
+    results = get_location_history().check_many(
+        items, persist=not dry_run, max_speed_kmh=max_speed, threshold_km=threshold_km,
+    )
+    # Up to LOCATION_BATCH_MAX results; encode them as they are sent rather than as one string
+    return serialization.stream_response({}, "results", results)
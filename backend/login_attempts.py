@@ -0,0 +1,194 @@
+"""Login-attempt records behind the /security/login-attempt routes.
+
+Attempts used to live in login_attempts.json: every confirm/report click loaded the
+whole file and scanned it for the token, and every new attempt rewrote it and cut
+it back to 500 entries, so on a busy day a pending attempt could be evicted before
+its owner opened the email. Here each attempt is one SQLite row (WAL mode):
+
+- token and id are unique keys and email has a secondary (email, created) index, so
+  lookups, status updates and a user's recent attempts never scan other rows;
+- pending attempts expire after LOGIN_ATTEMPT_PENDING_TTL seconds (status becomes
+  "expired" and the links stop working); every attempt is deleted after
+  LOGIN_ATTEMPT_RETENTION seconds. Nothing is dropped because of volume.
+
+Each new attempt is committed together with its LoginAttemptRecorded event, in this
+database's outbox (see events.py); the alert email is sent from there.
+
+login_attempts.json is imported once, the first time the database is created.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import time
+
+import events
+from location_history import parse_epoch
+from metrics import add_bytes, timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+LOGIN_ATTEMPTS_PATH = BASE_DIR / "login_attempts.json"
+LOGIN_ATTEMPTS_DB_PATH = Path(os.getenv("LOGIN_ATTEMPTS_DB_PATH") or (BASE_DIR / "login_attempts.db"))
+PENDING_TTL_SECONDS = int(os.getenv("LOGIN_ATTEMPT_PENDING_TTL", str(24 * 60 * 60)))
+RETENTION_SECONDS = int(os.getenv("LOGIN_ATTEMPT_RETENTION", str(90 * 24 * 60 * 60)))
+PURGE_INTERVAL_SECONDS = 60
+
+
+class LoginAttemptStore:
+    def __init__(self, db_path: Path = LOGIN_ATTEMPTS_DB_PATH,
+                 pending_ttl: int = PENDING_TTL_SECONDS, retention: int = RETENTION_SECONDS):
+        self.pending_ttl = pending_ttl
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS attempts ("
+            " id TEXT PRIMARY KEY, token TEXT NOT NULL UNIQUE, email TEXT NOT NULL,"
+            " created REAL NOT NULL, status TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS attempts_email ON attempts (email, created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS attempts_pending ON attempts (status, created)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        events.create_outbox(self._conn)
+
+    @staticmethod
+    def _row(data: str, status: str) -> dict:
+        attempt = json.loads(data)
+        attempt["status"] = status
+        return attempt
+
+    def _insert(self, attempt: dict) -> bool:
+        created = parse_epoch(attempt.get("timestamp")) or time()
+        data = json.dumps(attempt, ensure_ascii=False)
+        add_bytes("login_attempts", "write", len(data))
+        return self._conn.execute(
+            "INSERT OR IGNORE INTO attempts (id, token, email, created, status, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (attempt["id"], attempt["token"], (attempt.get("email") or "").strip().lower(), created,
+             attempt.get("status") or "pending", data)).rowcount > 0
+
+    # --- expiry ---
+    def purge(self, now: float | None = None) -> tuple[int, int]:
+        """Expire stale pending attempts and delete ones past retention; returns (expired, deleted)."""
+        now = time() if now is None else now
+        with self._lock:
+            self._purged_at = now
+            expired = self._conn.execute(
+                "UPDATE attempts SET status = 'expired' WHERE status = 'pending' AND created < ?",
+                (now - self.pending_ttl,)).rowcount
+            deleted = self._conn.execute(
+                "DELETE FROM attempts WHERE created < ?", (now - self.retention,)).rowcount
+        return expired, deleted
+
+    def _maybe_purge(self) -> None:
+        if time() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self.purge()
+
+    # --- API ---
+    @timed("login_attempts", "write")
+    def add(self, attempt: dict) -> None:
+        """Store a new attempt and, in the same transaction, its LoginAttemptRecorded event."""
+        self._maybe_purge()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._insert(attempt):
+                    events.enqueue(self._conn, events.LOGIN_ATTEMPT_RECORDED, attempt)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        events.wake()
+
+    def get(self, attempt_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data, status FROM attempts WHERE id = ?", (attempt_id,)).fetchone()
+        return self._row(*row) if row else None
+
+    @timed("login_attempts", "read")
+    def get_by_token(self, token: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data, status FROM attempts WHERE token = ?", (token,)).fetchone()
+        return self._row(*row) if row else None
+
+    @timed("login_attempts", "write")
+    def set_status(self, token: str, status: str) -> dict | None:
+        """Record the user's response. Returns the updated attempt, or None if the token
+        is unknown or the attempt expired before they answered."""
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data, status, created FROM attempts WHERE token = ?", (token,)).fetchone()
+                if row is None or row[1] == "expired" or (row[1] == "pending" and row[2] < now - self.pending_ttl):
+                    self._conn.execute("ROLLBACK")
+                    return None
+                attempt = self._row(row[0], status)
+                attempt["responded_at"] = datetime.utcnow().isoformat()
+                self._conn.execute(
+                    "UPDATE attempts SET status = ?, data = ? WHERE token = ?",
+                    (status, json.dumps(attempt, ensure_ascii=False), token))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return attempt
+
+    @timed("login_attempts", "read")
+    def recent(self, email: str, limit: int = 20, before: float | None = None) -> tuple[list, float | None]:
+        """A user's attempts, newest first, and the `before` value for the next page (or None).
+        `before` (epoch seconds) pages further back."""
+        email = (email or "").strip().lower()
+        cutoff = time() - self.pending_ttl
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data, status, created FROM attempts WHERE email = ? AND created < ?"
+                " ORDER BY created DESC LIMIT ?",
+                (email, before if before is not None else float("inf"), limit)).fetchall()
+        # rows the periodic purge has not reached yet
+        attempts = [self._row(data, "expired" if status == "pending" and created < cutoff else status)
+                    for data, status, created in rows]
+        return attempts, (rows[-1][2] if len(rows) == limit else None)
+
+    def import_json(self, path: Path = LOGIN_ATTEMPTS_PATH) -> int:
+        """One-shot import of the legacy login_attempts.json."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                count = 0
+                try:
+                    with Path(path).open("r", encoding="utf-8") as f:
+                        legacy = json.load(f)
+                except (OSError, ValueError):
+                    legacy = []
+                for attempt in legacy if isinstance(legacy, list) else []:
+                    if isinstance(attempt, dict) and attempt.get("id") and attempt.get("token"):
+                        self._insert(attempt)
+                        count += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', '1')")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return count
+
+
+def _create_login_attempt_store(config) -> LoginAttemptStore:
+    store = LoginAttemptStore(Path(config.get("LOGIN_ATTEMPTS_DB_PATH") or LOGIN_ATTEMPTS_DB_PATH))
+    store.import_json()
+    return store
+
+
+def get_login_attempt_store() -> LoginAttemptStore:
+    return app_store("login_attempts", _create_login_attempt_store, "LOGIN_ATTEMPTS_DB_PATH")
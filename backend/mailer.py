@@ -0,0 +1,392 @@
+"""Background email delivery.
+
+_send_email (app.py) and send_email_otp (otp_service.py) used to open a fresh SMTP
+connection, STARTTLS and log in inside the request for every message. Messages are
+now put on a bounded queue and delivered by a small pool of worker threads, each
+holding a persistent authenticated connection that is re-established with
+exponential backoff when the server drops it. A worker drains up to
+MAIL_BATCH_SIZE queued messages per wake-up over the same connection.
+
+A failed message is not retried in place: it goes on a delay heap with a
+not-before time (exponential backoff, capped at 30 s) and the worker moves on.
+When the connection itself fails, the rest of the batch is held until the same
+time, so an outage neither stalls a worker nor burns every message's attempts.
+
+Delivery status (Mailer.status, GET /email/status/<id>) is written through to a
+small SQLite table at MAIL_STATUS_DB_PATH, so any worker can answer for a message
+queued by another; rows are kept for MAIL_STATUS_RETENTION seconds. The table also
+makes send() idempotent for callers that pass their own job id: the event
+subscribers key alerts on the event id, so a redelivered event is not emailed twice.
+The queue itself is in memory, so a message whose worker process died stays
+"queued" (or "retrying") for good. Such a row is queued again by the next send()
+with its id once it has not changed for MAIL_REQUEUE_AFTER seconds, far longer
+than any live retry waits.
+
+Configuration (environment):
+    SMTP_HOST / SMTP_PORT      default smtp.gmail.com:587
+    SMTP_STARTTLS              "1" (default) or "0" for a plain local server
+    SMTP_USER / SMTP_PASS      (GMAIL_USER / GMAIL_APP_PASSWORD also accepted)
+    SMTP_AUTH                  "0" to skip login, e.g. against `python -m aiosmtpd -n`
+    MAIL_WORKERS, MAIL_QUEUE_SIZE, MAIL_BATCH_SIZE, MAIL_MAX_ATTEMPTS
+    MAIL_STATUS_DB_PATH, MAIL_STATUS_RETENTION, MAIL_REQUEUE_AFTER
+    MAIL_ASYNC                 "0" delivers inline in the caller (scripts/debugging)
+"""
+import heapq
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from email.message import EmailMessage
+from pathlib import Path
+from time import time
+
+from metrics import add_bytes, timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+MAIL_STATUS_DB_PATH = Path(os.getenv("MAIL_STATUS_DB_PATH") or (BASE_DIR / "mail_status.db"))
+STATUS_RETENTION_SECONDS = int(os.getenv("MAIL_STATUS_RETENTION", str(7 * 24 * 60 * 60)))
+STATUS_CACHE_SIZE = 10000
+REQUEUE_AFTER_SECONDS = int(os.getenv("MAIL_REQUEUE_AFTER", "600"))
+PURGE_INTERVAL_SECONDS = 60
+IDLE_DISCONNECT_SECONDS = 60.0
+
+
+class MailQueueFull(RuntimeError):
+    pass
+
+
+def _smtp_settings() -> dict:
+    user = os.getenv("SMTP_USER") or os.getenv("GMAIL_USER")
+    password = os.getenv("SMTP_PASS") or os.getenv("GMAIL_APP_PASSWORD")
+    auth = os.getenv("SMTP_AUTH", "1") != "0"
+    if auth and (not user or not password):
+        raise RuntimeError("SMTP credentials not configured. Set SMTP_USER and SMTP_PASS.")
+    return {
+        "host": os.getenv("SMTP_HOST") or "smtp.gmail.com",
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "starttls": os.getenv("SMTP_STARTTLS", "1") != "0",
+        "user": user,
+        "password": password if auth else None,
+        "sender": os.getenv("SMTP_FROM") or user or "no-reply@localhost",
+        "timeout": float(os.getenv("SMTP_TIMEOUT", "10")),
+    }
+
+
+class _Connection:
+    """One persistent SMTP session, reopened on demand."""
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.smtp = None  # smtplib.SMTP once opened
+        self.last_used = 0.0
+
+    def open(self):
+        if self.smtp is None:
+            # smtplib and ssl cost a cold worker tens of ms; load them with the first connection
+            import smtplib
+            import ssl
+
+            s = self.settings
+            with timed("smtp", "connect"):
+                smtp = smtplib.SMTP(s["host"], s["port"], timeout=s["timeout"])
+                try:
+                    if s["starttls"]:
+                        smtp.starttls(context=ssl.create_default_context())
+                    if s["password"]:
+                        smtp.login(s["user"], s["password"])
+                except Exception:
+                    smtp.close()
+                    raise
+            self.smtp = smtp
+        return self.smtp
+
+    def close(self) -> None:
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                self.smtp.close()
+            self.smtp = None
+
+    def send(self, msg: EmailMessage) -> None:
+        smtp = self.open()
+        with timed("smtp", "send"):
+            smtp.send_message(msg)
+        add_bytes("smtp", "send", len(msg.as_bytes()))
+        self.last_used = time()
+
+
+class _StatusTable:
+    """Delivery status rows shared by every worker process."""
+
+    def __init__(self, db_path: Path, retention: int = STATUS_RETENTION_SECONDS):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mail_status (id TEXT PRIMARY KEY, updated REAL NOT NULL, data TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mail_status_updated ON mail_status (updated)")
+
+    def put(self, rec: dict) -> None:
+        now = time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO mail_status (id, updated, data) VALUES (?, ?, ?)",
+                               (rec["id"], now, json.dumps(rec)))
+            if now - self._purged_at >= PURGE_INTERVAL_SECONDS:
+                self._purged_at = now
+                self._conn.execute("DELETE FROM mail_status WHERE updated < ?", (now - self.retention,))
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM mail_status WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def reserve(self, rec: dict, stale_before: float) -> bool:
+        """Insert `rec` unless a message with its id is sent, or still in hand somewhere
+        (not failed, and updated at or after `stale_before`); False if so."""
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO mail_status (id, updated, data) VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE"
+                " SET updated = excluded.updated, data = excluded.data"
+                " WHERE json_extract(mail_status.data, '$.status') = 'failed'"
+                " OR (json_extract(mail_status.data, '$.status') != 'sent' AND mail_status.updated < ?)",
+                (rec["id"], time(), json.dumps(rec), stale_before)).rowcount > 0
+
+
+class Mailer:
+    def __init__(self, workers: int = 2, queue_size: int = 1000, batch_size: int = 20,
+                 max_attempts: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 settings: dict | None = None, status_path: Path = MAIL_STATUS_DB_PATH):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._settings = settings
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # Retries waiting for their not-before time: (not_before, tiebreak, (job_id, msg, attempts))
+        self._delayed: list = []
+        self._delayed_lock = threading.Lock()
+        self._tiebreak = itertools.count()
+        # Messages accepted but not yet sent or failed, queued or delayed (see join)
+        self._unfinished = 0
+        self._finished = threading.Condition()
+        # This process's messages; the status table is the copy every worker can read
+        self._status: OrderedDict[str, dict] = OrderedDict()
+        self._status_lock = threading.Lock()
+        self._status_table = _StatusTable(status_path)
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    @property
+    def settings(self) -> dict:
+        return self._settings if self._settings is not None else _smtp_settings()
+
+    # --- status tracking ---
+    def _set_status(self, job_id: str, **fields) -> None:
+        with self._status_lock:
+            rec = self._status.setdefault(job_id, {"id": job_id})
+            rec.update(fields)
+            rec["updatedAt"] = datetime.utcnow().isoformat()
+            self._status.move_to_end(job_id)
+            while len(self._status) > STATUS_CACHE_SIZE:
+                self._status.popitem(last=False)
+            rec = dict(rec)
+        self._status_table.put(rec)
+        if fields.get("status") in ("sent", "failed"):
+            with self._finished:
+                self._unfinished -= 1
+                self._finished.notify_all()
+
+    def status(self, job_id: str) -> dict | None:
+        """A message's delivery status, whichever worker process queued it."""
+        with self._status_lock:
+            rec = self._status.get(job_id)
+            if rec:
+                return dict(rec)
+        return self._status_table.get(job_id)
+
+    def stats(self) -> dict:
+        """This process's queue and the status of the messages it queued recently."""
+        with self._status_lock:
+            counts: dict[str, int] = {}
+            for rec in self._status.values():
+                counts[rec["status"]] = counts.get(rec["status"], 0) + 1
+        with self._delayed_lock:
+            delayed = len(self._delayed)
+        return {"queued": self._queue.qsize(), "delayed": delayed, "workers": len(self._threads), "byStatus": counts}
+
+    # --- producer side ---
+    def _build(self, to_email: str, subject: str, body: str, sender: str) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = sender
+        msg["To"] = to_email
+        msg["Subject"] = subject
+        msg.set_content(body)
+        return msg
+
+    def send(self, to_email: str, subject: str, body: str, job_id: str | None = None) -> str:
+        """Queue a message for delivery and return its job id. Callers that may repeat
+        themselves pass their own `job_id`: a message already queued or sent under it,
+        by any worker, is not queued again (unless it failed, or its worker looks dead;
+        see REQUEUE_AFTER_SECONDS). Raises MailQueueFull when the queue is full."""
+        settings = self.settings  # fail fast on missing configuration
+        msg = self._build(to_email, subject, body, settings["sender"])
+        queued = {"status": "queued", "to": to_email, "attempts": 0, "queuedAt": datetime.utcnow().isoformat()}
+        if job_id is None:
+            job_id = uuid.uuid4().hex
+        elif not self._status_table.reserve({"id": job_id, **queued}, time() - REQUEUE_AFTER_SECONDS):
+            return job_id
+        with self._finished:
+            self._unfinished += 1
+        self._set_status(job_id, **queued)
+        if os.getenv("MAIL_ASYNC", "1") == "0":
+            self._deliver_inline(job_id, msg, settings)
+            return job_id
+        self.start()
+        try:
+            self._queue.put_nowait((job_id, msg, 0))
+        except queue.Full:
+            self._set_status(job_id, status="failed", error="mail queue full")
+            raise MailQueueFull("mail queue full") from None
+        return job_id
+
+    def _deliver_inline(self, job_id: str, msg: EmailMessage, settings: dict) -> None:
+        conn = _Connection(settings)
+        try:
+            conn.send(msg)
+            self._set_status(job_id, status="sent", attempts=1)
+        except Exception as e:
+            self._set_status(job_id, status="failed", attempts=1, error=str(e))
+            raise
+        finally:
+            conn.close()
+
+    # --- worker side ---
+    def start(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"mailer-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _defer(self, not_before: float, job: tuple) -> None:
+        with self._delayed_lock:
+            heapq.heappush(self._delayed, (not_before, next(self._tiebreak), job))
+
+    def _take_batch(self) -> list:
+        """Up to batch_size messages: retries whose time has come first, then new ones."""
+        batch = []
+        now = time()
+        with self._delayed_lock:
+            while self._delayed and self._delayed[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._delayed)[2])
+            wait = min(1.0, self._delayed[0][0] - now) if self._delayed else 1.0
+        if not batch:
+            try:
+                batch.append(self._queue.get(timeout=max(0.01, wait)))
+            except queue.Empty:
+                return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _backoff(self, failures: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** max(0, failures - 1)))
+
+    def _worker(self) -> None:
+        import smtplib  # not at module level; see _Connection.open
+
+        conn: _Connection | None = None
+        failures = 0
+        reconnect_at = 0.0  # after a connection failure, don't try again before this
+        while not self._stopping.is_set() or self._unfinished > 0:
+            batch = self._take_batch()
+            if not batch:
+                if conn and time() - conn.last_used > IDLE_DISCONNECT_SECONDS:
+                    conn.close()
+                continue
+            if conn is None and time() < reconnect_at:
+                for job in batch:
+                    self._defer(reconnect_at, job)
+                continue
+            for i, (job_id, msg, attempts) in enumerate(batch):
+                attempts += 1
+                self._set_status(job_id, status="sending", attempts=attempts)
+                try:
+                    if conn is None:
+                        conn = _Connection(self.settings)
+                    conn.send(msg)
+                    failures = 0
+                    self._set_status(job_id, status="sent", sentAt=datetime.utcnow().isoformat(), error=None,
+                                     nextAttemptAt=None)
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Permanent for this message; the connection itself is fine
+                    self._set_status(job_id, status="failed", error=str(e))
+                except Exception as e:
+                    failures += 1
+                    if conn:
+                        conn.close()
+                        conn = None
+                    reconnect_at = time() + self._backoff(failures)
+                    if attempts >= self.max_attempts:
+                        self._set_status(job_id, status="failed", error=str(e))
+                    else:
+                        self._set_status(job_id, status="retrying", error=str(e),
+                                         nextAttemptAt=datetime.utcfromtimestamp(reconnect_at).isoformat())
+                        self._defer(reconnect_at, (job_id, msg, attempts))
+                    # The rest of the batch would hit the same dead connection; hold it, untried
+                    for job in batch[i + 1:]:
+                        self._defer(reconnect_at, job)
+                    break
+        if conn:
+            conn.close()
+
+    def join(self) -> None:
+        """Block until every queued message has been handled (sent or failed)."""
+        with self._finished:
+            self._finished.wait_for(lambda: self._unfinished <= 0)
+
+
+def _create_mailer(config) -> Mailer:
+    return Mailer(
+        workers=int(os.getenv("MAIL_WORKERS", "2")),
+        queue_size=int(os.getenv("MAIL_QUEUE_SIZE", "1000")),
+        batch_size=int(os.getenv("MAIL_BATCH_SIZE", "20")),
+        max_attempts=int(os.getenv("MAIL_MAX_ATTEMPTS", "5")),
+        status_path=Path(config.get("MAIL_STATUS_DB_PATH") or MAIL_STATUS_DB_PATH),
+    )
+
+
+def get_mailer() -> Mailer:
+    return app_store("mailer", _create_mailer, "MAIL_STATUS_DB_PATH")
+
+
+def send_email(to_email: str, subject: str, body: str, job_id: str | None = None) -> str:
+    """Queue an email; returns the delivery job id (see Mailer.send and Mailer.status)."""
+    return get_mailer().send(to_email, subject, body, job_id=job_id)
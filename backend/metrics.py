@@ -0,0 +1,208 @@
+"""In-process metrics with Prometheus text exposition.
+
+Answers "where did this slow login spend its time?":
+
+- http_request_duration_seconds{method,route,status}: a latency histogram per route.
+  The route is the URL rule (e.g. /email/status/<job_id>), so label cardinality stays
+  bounded.
+- http_requests_in_flight{route}: a gauge.
+- dependency_duration_seconds{dependency,operation}: histograms for SMTP, TypingDNA
+  and each store's reads and writes, plus dependency_errors_total and
+  dependency_bytes_total for the payload sizes those calls move.
+
+Recording takes one short lock and a bisect over the bucket bounds, so it can stay on
+in production. Set METRICS_ENABLED=0 to turn every recorder into a no-op. Values
+are per process. Under several workers, scrape each one, or add a worker label
+at the proxy.
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from time import perf_counter
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Seconds; spans a cache hit (~100us) to an SMTP handshake timing out
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per-bucket (non-cumulative) counts + one overflow slot, sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ("route",)))
+DEPENDENCY_DURATION = REGISTRY.register(Histogram(
+    "dependency_duration_seconds", "Time spent in SMTP, TypingDNA and store calls.", ("dependency", "operation")))
+DEPENDENCY_ERRORS = REGISTRY.register(Counter(
+    "dependency_errors_total", "Dependency calls that raised.", ("dependency", "operation")))
+DEPENDENCY_BYTES = REGISTRY.register(Counter(
+    "dependency_bytes_total", "Bytes read from or written to a dependency.", ("dependency", "operation")))
+
+
+class timed(ContextDecorator):
+    """Time a dependency call, as a context manager or a decorator:
+
+        with timed("smtp", "send"): ...
+
+        @timed("accounts", "write")
+        def add(...): ...
+    """
+
+    def __init__(self, dependency: str, operation: str):
+        self.labels = (dependency, operation)
+        self._local = threading.local()  # one instance may decorate a method used by many threads
+
+    def __enter__(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        started = self._local.stack.pop()
+        DEPENDENCY_DURATION.observe(perf_counter() - started, *self.labels)
+        if exc_type is not None:
+            DEPENDENCY_ERRORS.inc(*self.labels)
+        return False
+
+
+def add_bytes(dependency: str, operation: str, n: int) -> None:
+    DEPENDENCY_BYTES.inc(dependency, operation, amount=n)
+
+
+def init_app(app) -> None:
+    """Record latency and in-flight counts for every request `app` handles, and
+    serve them at GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g._metrics_started = perf_counter()
+        REQUESTS_IN_FLIGHT.inc(g._metrics_route)
+
+    @app.after_request
+    def _record(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish(exc):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return
+        route = g.pop("_metrics_route")
+        status = g.pop("_metrics_status", 500)
+        REQUESTS_IN_FLIGHT.dec(route)
+        REQUEST_DURATION.observe(perf_counter() - started, request.method, route, str(status))
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        """Prometheus text exposition of this worker's metrics."""
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
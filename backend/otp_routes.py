@@ -0,0 +1,117 @@
+"""One-time password routes: email OTP, phone OTP bound to an account, and the
+standalone /api phone OTP."""
+import random
+from time import time
+
+from flask import Blueprint, jsonify, request
+
+from account_store import get_account_store
+from otp_service import (
+    OTP_TTL_SECONDS,
+    create_and_send_otp,
+    verify_otp,
+    create_and_store_phone_otp,
+    verify_phone_otp,
+)
+from otp_store import check_backend, get_otp_store
+from rate_limit import Limit, client_ip, json_field, rate_limit
+
+bp = Blueprint("otp", __name__)
+# Fail at startup, not on the first OTP, if the store cannot be shared by the workers
+bp.record_once(lambda state: check_backend(state.app.config))
+
+
+def _update_account_phone(email: str, phone_e164: str) -> bool:
+    """Add or update the phone field for the account with this email."""
+    return get_account_store().update(email, phone=phone_e164)
+
+
+# -----------------------------
+# Email OTP with otp_service (from main)
+# -----------------------------
+@bp.route('/otp/send', methods=['POST'])
+@rate_limit(Limit("10/minute", client_ip), Limit("3/10 minutes", json_field("email")))
+def otp_send():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+    try:
+        email_id = create_and_send_otp(email)
+        return jsonify({"success": True, "emailId": email_id})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/otp/verify', methods=['POST'])
+def otp_verify():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    otp = (body.get('otp') or '').strip()
+    if not email or not otp:
+        return jsonify({"error": "Email and OTP are required"}), 400
+    ok = verify_otp(email, otp)
+    return jsonify({"valid": ok}), (200 if ok else 401)
+
+
+@bp.route('/phone/send-otp', methods=['POST'])
+@rate_limit(Limit("10/minute", client_ip), Limit("3/10 minutes", json_field("email")),
+            Limit("3/10 minutes", json_field("phone")))
+def phone_send_otp():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    phone = (body.get('phone') or '').strip()
+    if not email or not phone:
+        return jsonify({"error": "Email and phone are required"}), 400
+    # Basic E.164 validation: + followed by 8-15 digits
+    if not phone.startswith('+') or not phone[1:].isdigit() or not (8 <= len(phone[1:]) <= 15):
+        return jsonify({"error": "Invalid phone format"}), 400
+    try:
+        # Create phone OTP and print to backend console
+        create_and_store_phone_otp(email, phone)
+        return jsonify({"success": True})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/phone/verify-otp', methods=['POST'])
+def phone_verify_otp():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    otp = (body.get('otp') or '').strip()
+    if not email or not otp:
+        return jsonify({"error": "Email and OTP are required"}), 400
+    ok, phone_e164 = verify_phone_otp(email, otp)
+    if not ok or not phone_e164:
+        return jsonify({"valid": False}), 401
+    # Persist phone on the account
+    if not _update_account_phone(email, phone_e164):
+        return jsonify({"error": "Account not found"}), 404
+    return jsonify({"valid": True, "phone": phone_e164})
+
+
+# -----------------------------
+# Phone OTP (tisha-branch feature)
+# -----------------------------
+@bp.route("/api/send-otp", methods=["POST"])
+@rate_limit(Limit("10/minute", client_ip), Limit("3/10 minutes", json_field("phone")))
+def api_send_otp():
+    phone = (request.json or {}).get("phone")
+    if not phone:
+        return jsonify({"error": "Phone number required"}), 400
+    otp = str(random.randint(100000, 999999))
+    # In the shared OTP store (not this worker's memory), so any worker can verify it
+    get_otp_store().put(f"api-phone:{phone}", {"otp": otp, "expiresAt": int(time()) + OTP_TTL_SECONDS})
+    # NOTE: Replace this print with real SMS integration in production
+    print(f"DEBUG: OTP for {phone} is {otp}")
+    return jsonify({"message": "OTP sent"})
+
+@bp.route("/api/verify-otp", methods=["POST"])
+def api_verify_otp():
+    payload = request.json or {}
+    phone = payload.get("phone")
+    otp = payload.get("otp")
+    if not phone or not otp:
+        return jsonify({"error": "Phone and OTP required"}), 400
+    if get_otp_store().consume(f"api-phone:{phone}", str(otp)) is not None:
+        return jsonify({"message": "Verified"})
+    return jsonify({"error": "Invalid OTP"}), 400
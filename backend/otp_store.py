@@ -0,0 +1,305 @@
+"""Storage backends for one-time passwords.
+
+otp_service used to load and rewrite otp_store.json for every issue/verify and scan
+every key for expiry, which was slow and lost updates when two requests wrote at
+once. Backends here are safe for concurrent use:
+
+- SQLiteOTPStore (default): one row per OTP in a SQLite file (OTP_DB_PATH, WAL
+  mode) shared by every worker on the host. consume() is a single
+  DELETE ... RETURNING, so two workers cannot both accept the same OTP.
+- MemoryOTPStore: dict guarded by a lock, with a min-heap of expiry times so expired
+  entries are evicted in O(log n). Optionally durable (OTP_STORE_DURABLE, default
+  on): every change is appended to a write-ahead log and periodically compacted
+  into the JSON snapshot, which is replayed on start. State is per process, so an
+  OTP sent by one worker would not verify on another: get_otp_store() refuses this
+  backend when WEB_CONCURRENCY asks for more than one worker.
+- RedisOTPStore: entries live in Redis (or any server speaking its protocol) with
+  native TTLs, so workers on several hosts share state.
+
+Select with OTP_STORE_BACKEND=sqlite|memory|redis (default sqlite) and OTP_REDIS_URL.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from time import time
+
+from metrics import add_bytes, timed
+from persistence import app_store, atomic_write_json, configured_workers, file_lock
+
+BASE_DIR = Path(__file__).resolve().parent
+OTP_DB_PATH = Path(os.getenv("OTP_DB_PATH") or (BASE_DIR / "otp_store.db"))
+OTP_STORE_PATH = BASE_DIR / "otp_store.json"
+OTP_WAL_PATH = BASE_DIR / "otp_store.wal"
+
+WAL_COMPACT_RECORDS = int(os.getenv("OTP_WAL_COMPACT_RECORDS", "1000"))
+PURGE_INTERVAL_SECONDS = 60
+
+
+class OTPStore(ABC):
+    """Interface: entries are dicts carrying at least "otp" and "expiresAt" (epoch seconds)."""
+
+    @abstractmethod
+    def put(self, key: str, entry: dict) -> None: ...
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def consume(self, key: str, otp: str) -> dict | None:
+        """Atomically delete and return the entry if `otp` matches and it has not expired."""
+
+
+class MemoryOTPStore(OTPStore):
+    def __init__(self, snapshot_path: Path | None = None, wal_path: Path | None = None,
+                 compact_every: int = WAL_COMPACT_RECORDS):
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._expiry: list[tuple[int, str]] = []  # (expiresAt, key); stale items skipped lazily
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.wal_path = Path(wal_path) if wal_path else None
+        self.compact_every = compact_every
+        self._wal = None
+        self._wal_records = 0
+        if self.snapshot_path or self.wal_path:
+            self._recover()
+
+    # --- expiry ---
+    def _schedule(self, key: str, entry: dict) -> None:
+        heapq.heappush(self._expiry, (int(entry.get("expiresAt", 0)), key))
+
+    def _expire(self, now: int) -> None:
+        while self._expiry and self._expiry[0][0] < now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and int(entry.get("expiresAt", 0)) == expires_at:
+                del self._entries[key]
+                self._log({"op": "del", "key": key})
+
+    # --- durability ---
+    def _file_lock(self):
+        """Held while reading or rewriting the snapshot and WAL, so a worker starting
+        up cannot compact them away under one that is shutting down (or vice versa)."""
+        return file_lock(self.wal_path or self.snapshot_path)
+
+    def _recover(self) -> None:
+        with self._file_lock():
+            self._replay()
+            self._compact()
+
+    def _replay(self) -> None:
+        if self.snapshot_path and self.snapshot_path.exists():
+            try:
+                with self.snapshot_path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._entries.update({k: v for k, v in data.items() if isinstance(v, dict)})
+            except (OSError, ValueError):
+                pass
+        if self.wal_path and self.wal_path.exists():
+            with self.wal_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn final record
+                    if rec.get("op") == "put":
+                        self._entries[rec["key"]] = rec["entry"]
+                    elif rec.get("op") == "del":
+                        self._entries.pop(rec.get("key"), None)
+        now = int(time())
+        self._entries = {k: v for k, v in self._entries.items() if int(v.get("expiresAt", 0)) >= now}
+        for key, entry in self._entries.items():
+            self._schedule(key, entry)
+
+    def _log(self, record: dict) -> None:
+        if not self.wal_path:
+            return
+        if self._wal is None:
+            self.wal_path.parent.mkdir(parents=True, exist_ok=True)
+            self._wal = self.wal_path.open("a", encoding="utf-8")
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with timed("otp_store", "wal"):
+            self._wal.write(line)
+            self._wal.flush()
+        add_bytes("otp_store", "wal", len(line))
+        self._wal_records += 1
+        if self._wal_records >= self.compact_every:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Write the live entries to the snapshot and start a fresh WAL."""
+        with self._file_lock():
+            if self.snapshot_path:
+                atomic_write_json(self.snapshot_path, self._entries)
+            if self.wal_path:
+                if self._wal is not None:
+                    self._wal.close()
+                    self._wal = None
+                if self.snapshot_path:
+                    self.wal_path.unlink(missing_ok=True)
+        self._wal_records = 0
+
+    # --- OTPStore API ---
+    def put(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._expire(int(time()))
+            self._entries[key] = dict(entry)
+            self._schedule(key, entry)
+            self._log({"op": "put", "key": key, "entry": entry})
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            self._expire(int(time()))
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._log({"op": "del", "key": key})
+
+    def consume(self, key: str, otp: str) -> dict | None:
+        with self._lock:
+            self._expire(int(time()))
+            entry = self._entries.get(key)
+            if entry is None or str(entry.get("otp")) != str(otp):
+                return None
+            del self._entries[key]
+            self._log({"op": "del", "key": key})
+            return entry
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(int(time()))
+            return len(self._entries)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.snapshot_path or self.wal_path:
+                self._compact()
+
+
+class SQLiteOTPStore(OTPStore):
+    def __init__(self, db_path: Path = OTP_DB_PATH):
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS otps ("
+            " key TEXT PRIMARY KEY, otp TEXT NOT NULL, expires_at INTEGER NOT NULL, entry TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS otps_expires ON otps (expires_at)")
+
+    def _maybe_purge(self, now: int) -> None:
+        if now - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self._purged_at = now
+            self._conn.execute("DELETE FROM otps WHERE expires_at < ?", (now,))
+
+    @timed("otp_store", "write")
+    def put(self, key: str, entry: dict) -> None:
+        data = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._maybe_purge(int(time()))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO otps (key, otp, expires_at, entry) VALUES (?, ?, ?, ?)",
+                (key, str(entry.get("otp")), int(entry.get("expiresAt", 0)), data))
+        add_bytes("otp_store", "write", len(data))
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM otps WHERE key = ? AND expires_at >= ?",
+                                     (key, int(time()))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM otps WHERE key = ?", (key,))
+
+    @timed("otp_store", "consume")
+    def consume(self, key: str, otp: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "DELETE FROM otps WHERE key = ? AND otp = ? AND expires_at >= ? RETURNING entry",
+                (key, str(otp), int(time()))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM otps WHERE expires_at >= ?", (int(time()),)).fetchone()[0]
+
+
+# Compare-and-delete in one round trip so two workers cannot both accept the same OTP.
+_CONSUME_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return nil end
+local entry = cjson.decode(raw)
+if tostring(entry['otp']) ~= ARGV[1] then return nil end
+redis.call('DEL', KEYS[1])
+return raw
+"""
+
+
+class RedisOTPStore(OTPStore):
+    def __init__(self, url: str | None = None, prefix: str = "otp:", client=None):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url or os.getenv("OTP_REDIS_URL") or "redis://localhost:6379/0")
+        self._client = client
+        self._prefix = prefix
+        self._consume = client.register_script(_CONSUME_SCRIPT)
+
+    def _key(self, key: str) -> str:
+        return self._prefix + key
+
+    def put(self, key: str, entry: dict) -> None:
+        ttl = max(1, int(entry.get("expiresAt", 0)) - int(time()))
+        with timed("redis", "otp_put"):
+            self._client.set(self._key(key), json.dumps(entry, ensure_ascii=False), ex=ttl)
+
+    def get(self, key: str) -> dict | None:
+        with timed("redis", "otp_get"):
+            raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw else None
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._key(key))
+
+    def consume(self, key: str, otp: str) -> dict | None:
+        with timed("redis", "otp_consume"):
+            raw = self._consume(keys=[self._key(key)], args=[str(otp)])
+        return json.loads(raw) if raw else None
+
+
+def check_backend(config=None) -> None:
+    """Refuse a per-process OTP store when several worker processes will share the routes."""
+    backend = ((config or {}).get("OTP_STORE_BACKEND") or os.getenv("OTP_STORE_BACKEND") or "sqlite").lower()
+    if backend == "memory" and configured_workers() > 1:
+        raise RuntimeError("OTP_STORE_BACKEND=memory keeps OTPs in one process, but WEB_CONCURRENCY asks "
+                           "for several workers; use the sqlite or redis backend")
+
+
+def _create_otp_store(config) -> OTPStore:
+    check_backend(config)
+    backend = (config.get("OTP_STORE_BACKEND") or os.getenv("OTP_STORE_BACKEND") or "sqlite").lower()
+    if backend == "redis":
+        return RedisOTPStore()
+    if backend != "memory":
+        return SQLiteOTPStore(Path(config.get("OTP_DB_PATH") or OTP_DB_PATH))
+    if os.getenv("OTP_STORE_DURABLE", "1") == "0":
+        return MemoryOTPStore()
+    return MemoryOTPStore(OTP_STORE_PATH, OTP_WAL_PATH)
+
+
+def get_otp_store() -> OTPStore:
+    return app_store("otp", _create_otp_store, "OTP_STORE_BACKEND", "OTP_DB_PATH")
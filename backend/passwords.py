@@ -0,0 +1,264 @@
+"""Password hashing off the request threads.
+
+Accounts used to carry their password in plain text. They now store `passwordHash`,
+produced by a memory-hard KDF:
+
+- scrypt (hashlib, always available), encoded as
+  scrypt$<log2 n>$<r>$<p>$<salt b64>$<hash b64>;
+- argon2id when PASSWORD_KDF=argon2 and argon2-cffi is installed (standard
+  $argon2id$... strings).
+
+A KDF call takes tens of milliseconds of CPU and tens of MiB of memory. Both
+bindings release the GIL while they run, so threads would parallelize; the pool
+is there to bound the cost instead. Hashes run in a process pool of
+PASSWORD_HASH_WORKERS processes (default: one per core), so a login burst can
+use at most that many cores and that much KDF memory, and a hash that blows the
+memory limit kills a pool worker, not the web worker. At most PASSWORD_HASH_QUEUE
+calls may wait for the pool. Past that, callers get PasswordHasherBusy at once,
+so the burst is shed (503) instead of piling up request threads; so is a hash
+that takes longer than PASSWORD_HASH_TIMEOUT seconds.
+PASSWORD_HASH_WORKERS=0 hashes inline, for tests and tools.
+
+verify() also accepts legacy plain-text records and hashes made with older cost
+parameters. It returns a replacement hash for those, which the login route
+stores: the rehash-on-login migration. If the pool is busy at that point the
+login still succeeds and the record is migrated on a later one.
+
+    python passwords.py --seconds 5      # hashes/sec per core at the current cost
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+
+from metrics import timed
+
+KDF = (os.getenv("PASSWORD_KDF") or "scrypt").lower()
+SCRYPT_LOG2_N = int(os.getenv("PASSWORD_SCRYPT_LOG2_N", "15"))  # n = 32768: 32 MiB at r=8
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("PASSWORD_ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "1"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or os.cpu_count() or 1)
+HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE") or HASH_WORKERS * 4)
+HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+class PasswordHasherBusy(RuntimeError):
+    """The hashing pool's queue is full, or a hash timed out; retry later."""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _argon2_hasher(params: dict):
+    from argon2 import PasswordHasher  # optional dependency (argon2-cffi)
+
+    return PasswordHasher(time_cost=params["time_cost"], memory_cost=params["memory_kib"],
+                          parallelism=params["parallelism"])
+
+
+# --- run in the pool processes; module-level so they pickle by reference ---
+def _hash(params: dict, password: str) -> str:
+    if params["kdf"] == "argon2":
+        return _argon2_hasher(params).hash(password)
+    n, r, p = 1 << params["log2_n"], params["r"], params["p"]
+    salt = os.urandom(_SALT_BYTES)
+    key = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                         maxmem=256 * n * r + (1 << 20), dklen=_KEY_BYTES)
+    return f"scrypt${params['log2_n']}${r}${p}${_b64(salt)}${_b64(key)}"
+
+
+def _verify(params: dict, stored: str, password: str) -> tuple[bool, bool]:
+    """(matches, needs rehash with the current params)."""
+    if stored.startswith("$argon2"):
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        hasher = _argon2_hasher(params)
+        try:
+            hasher.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, params["kdf"] != "argon2" or hasher.check_needs_rehash(stored)
+    try:
+        _, log2_n, r, p, salt, key = stored.split("$")
+        log2_n, r, p = int(log2_n), int(r), int(p)
+        salt, key = _unb64(salt), _unb64(key)
+    except ValueError:
+        return False, False
+    n = 1 << log2_n
+    candidate = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                               maxmem=256 * n * r + (1 << 20), dklen=len(key))
+    if not hmac.compare_digest(candidate, key):
+        return False, False
+    current = params["kdf"] == "scrypt" and (log2_n, r, p) == (params["log2_n"], params["r"], params["p"])
+    return True, not current
+
+
+def is_hash(value) -> bool:
+    return isinstance(value, str) and (value.startswith("scrypt$") or value.startswith("$argon2"))
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, queue: int = HASH_QUEUE, kdf: str = KDF,
+                 timeout: float = HASH_TIMEOUT_SECONDS):
+        self.params = {
+            "kdf": kdf,
+            "log2_n": SCRYPT_LOG2_N, "r": SCRYPT_R, "p": SCRYPT_P,
+            "time_cost": ARGON2_TIME_COST, "memory_kib": ARGON2_MEMORY_KIB, "parallelism": ARGON2_PARALLELISM,
+        }
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # Imported here: multiprocessing is a noticeable share of a cold start
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    # Not fork: the Flask process is multi-threaded by the time this runs
+                    methods = multiprocessing.get_all_start_methods()
+                    ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(self.params, *args)
+        from concurrent.futures import TimeoutError as FutureTimeout
+        from concurrent.futures.process import BrokenProcessPool
+
+        # Don't wait for a slot: a full queue means shed this request now
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("password hashing queue is full")
+        try:
+            pool = self._executor()
+            try:
+                return pool.submit(fn, self.params, *args).result(timeout=self.timeout)
+            except BrokenProcessPool:
+                # A worker died (OOM kill, crash); start a fresh pool and retry once
+                self._discard_pool(pool)
+                return self._executor().submit(fn, self.params, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise PasswordHasherBusy("password hashing timed out") from None
+        finally:
+            self._slots.release()
+
+    def _discard_pool(self, pool) -> None:
+        with self._pool_lock:
+            if self._pool is pool:  # another thread may already have replaced it
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @timed("passwords", "hash")
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    @timed("passwords", "verify")
+    def verify(self, stored: str | None, password: str) -> tuple[bool, str | None]:
+        """(matches, replacement hash or None).
+
+        `stored` is a hash, or a legacy plain-text password. Plain text and hashes
+        with outdated parameters get a fresh hash when the password matches.
+        """
+        if not stored or not isinstance(password, str):
+            return False, None
+        if not is_hash(stored):
+            if not hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")):
+                return False, None
+            return True, self._rehash(password)
+        ok, stale = self._run(_verify, stored, password)
+        return ok, (self._rehash(password) if ok and stale else None)
+
+    def _rehash(self, password: str) -> str | None:
+        # The password already matched: a busy pool must not fail the login
+        try:
+            return self.hash(password)
+        except PasswordHasherBusy:
+            return None
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+_hasher: PasswordHasher | None = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def benchmark(workers: int, seconds: float, concurrency: int) -> float:
+    """Hashes per second with `workers` pool processes, driven by `concurrency` threads."""
+    hasher = PasswordHasher(workers=workers, queue=concurrency)
+    hasher.hash("warm-up")  # start the pool outside the measured window
+    done = 0
+    done_lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def drive():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            hasher.hash("correct horse battery staple")
+            with done_lock:
+                done += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=drive) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    hasher.close()
+    return done / elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Password KDF throughput at the configured cost")
+    parser.add_argument("--workers", type=int, nargs="+", help="pool sizes to try (default 1 and all cores)")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    cores = os.cpu_count() or 1
+    sizes = args.workers or sorted({1, cores})
+    cost = (f"argon2id t={ARGON2_TIME_COST} m={ARGON2_MEMORY_KIB}KiB p={ARGON2_PARALLELISM}" if KDF == "argon2"
+            else f"scrypt n=2^{SCRYPT_LOG2_N} r={SCRYPT_R} p={SCRYPT_P}")
+    print(f"{cost}, {cores} cores")
+    print(f"{'workers':>8} {'hashes/s':>10} {'per core':>10} {'ms/hash':>8}")
+    for workers in sizes:
+        rate = benchmark(workers, args.seconds, concurrency=max(1, workers) * 2)
+        per_core = rate / max(1, min(workers, cores))
+        print(f"{workers:>8} {rate:>10.1f} {per_core:>10.1f} {1000 / per_core:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Shared helpers for the JSON files the backend persists.
+
+Several gunicorn workers on one host may read and write the same files, so:
+
+- writes go to a temp file in the same directory, are fsync'd and renamed over the
+  target (readers see the old or the new document, never half of one);
+- read-modify-write cycles take an advisory fcntl lock on a sidecar ``.lock`` file;
+- JsonDocument tracks a version (inode, size, mtime) for optimistic concurrency:
+  writes carrying a stale version raise VersionConflict and `update` retries.
+
+fcntl is POSIX-only; elsewhere the locks degrade to in-process locks.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import add_bytes, timed
+from serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_thread_locks: dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()  # lock paths this thread already holds (flock is not re-entrant)
+_ANY_VERSION = object()
+
+
+class VersionConflict(RuntimeError):
+    pass
+
+
+def _thread_lock(path: Path) -> threading.RLock:
+    key = str(path)
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False):
+    """Advisory lock for `path` (held on `path`.lock), across threads and processes."""
+    path = Path(path)
+    lock_path = path.with_name(path.name + ".lock")
+    key = str(lock_path)
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = set()
+    if key in held:
+        yield  # nested use within the same thread
+        return
+    with _thread_lock(lock_path):
+        held.add(key)
+        try:
+            if fcntl is None:
+                yield
+                return
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        finally:
+            held.discard(key)
+
+
+def configured_workers() -> int:
+    """Worker processes the server was configured for. gunicorn and uvicorn both take
+    their default worker count from WEB_CONCURRENCY, so deployments set that rather
+    than -w/--workers, and stores that keep state per process can check it."""
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+    except ValueError:
+        return 1
+
+
+_stores: dict = {}
+_stores_lock = threading.RLock()  # re-entrant: some factories open other stores
+
+
+def app_store(name: str, factory, *config_keys: str):
+    """The `name` store for the current app, built by factory(config) on first use.
+
+    create_app(config) may point an app at its own files, with config keys named
+    like the environment settings (ACCOUNTS_DB_PATH, EVENTS_DB_PATH, ...). An app
+    whose config sets any of `config_keys` gets its own store, kept in
+    app.extensions["stores"], so two such apps never share state. Otherwise, and
+    outside an app context, callers share one process-wide store built from the
+    environment (factory gets an empty config).
+    """
+    from flask import current_app, has_app_context
+
+    stores, config = _stores, {}
+    if has_app_context() and any(current_app.config.get(key) for key in config_keys):
+        stores, config = current_app.extensions.setdefault("stores", {}), current_app.config
+    store = stores.get(name)
+    if store is None:
+        with _stores_lock:
+            store = stores.get(name)
+            if store is None:
+                store = stores[name] = factory(config)
+    return store
+
+
+def _fsync_dir(directory: Path) -> None:
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    path = Path(path)
+    with timed(path.name, "write"):
+        _atomic_write_bytes(path, data)
+    add_bytes(path.name, "write", len(data))
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def atomic_write_json(path: Path, data) -> None:
+    """Compact by default; JSON_PRETTY=1 indents (see serialization)."""
+    atomic_write_bytes(path, dumps(data))
+
+
+def read_or_create_secret(path: Path, nbytes: int = 32) -> bytes:
+    """Random secret stored at `path` (mode 0600), created once and shared by every worker."""
+    path = Path(path)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    with file_lock(path):
+        if not path.exists():
+            _atomic_write_bytes(path, os.urandom(nbytes))  # mkstemp creates it 0600
+        return path.read_bytes()
+
+
+def read_json(path: Path, default=None):
+    path = Path(path)
+    try:
+        with timed(path.name, "read"), path.open("rb") as f:
+            raw = f.read()
+        add_bytes(path.name, "read", len(raw))
+        return loads(raw)
+    except (OSError, ValueError):
+        return default
+
+
+def file_version(path: Path) -> tuple | None:
+    """Identity of the file's current contents; changes on every atomic write."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class JsonDocument:
+    """A JSON file shared between threads and worker processes.
+
+    `default` is a zero-argument factory for the empty document (e.g. dict or list).
+    Parsed contents are cached per version, so repeated reads of an unchanged file
+    cost one stat() rather than a parse.
+    """
+
+    def __init__(self, path: Path, default=dict, max_retries: int = 10):
+        self.path = Path(path)
+        self.default = default
+        self.max_retries = max_retries
+        self._cache: tuple[tuple | None, object] | None = None
+        self._cache_lock = threading.Lock()
+
+    def _coerce(self, data):
+        empty = self.default()
+        return data if isinstance(data, type(empty)) else empty
+
+    def read(self) -> tuple[object, tuple | None]:
+        """Return (data, version). Treat `data` as read-only; copy before mutating."""
+        version = file_version(self.path)
+        with self._cache_lock:
+            if self._cache is not None and self._cache[0] == version:
+                return self._cache[1], version
+        with file_lock(self.path, shared=True):
+            version = file_version(self.path)
+            data = self._coerce(read_json(self.path, None)) if version else self.default()
+        with self._cache_lock:
+            self._cache = (version, data)
+        return data, version
+
+    def load(self):
+        return self.read()[0]
+
+    def write(self, data, expected_version=_ANY_VERSION) -> tuple | None:
+        """Atomically replace the document. If `expected_version` is given and the file
+        changed since then, raise VersionConflict instead of overwriting."""
+        with file_lock(self.path):
+            if expected_version is not _ANY_VERSION and file_version(self.path) != expected_version:
+                raise VersionConflict(f"{self.path.name} changed concurrently")
+            atomic_write_json(self.path, data)
+            version = file_version(self.path)
+        with self._cache_lock:
+            self._cache = (version, data)
+        return version
+
+    def update(self, fn):
+        """Optimistic read-modify-write: `fn` receives a deep copy of the document and
+        returns (new_document, result), or (None, result) to leave it unchanged.
+        Retried on concurrent modification."""
+        for _ in range(self.max_retries):
+            data, version = self.read()
+            new_data, result = fn(loads(dumps(data, pretty=False)))
+            if new_data is None:
+                return result
+            try:
+                self.write(new_data, expected_version=version)
+                return result
+            except VersionConflict:
+                continue
+        # Heavy contention: fall back to doing the whole cycle under the exclusive lock
+        with file_lock(self.path):
+            data, version = self.read()
+            new_data, result = fn(loads(dumps(data, pretty=False)))
+            if new_data is not None:
+                self.write(new_data, expected_version=version)
+            return result
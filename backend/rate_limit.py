@@ -0,0 +1,217 @@
+"""Request throttling for the endpoints that cost us money or I/O.
+
+OTP sends (SMTP), TypingDNA checks (a paid API call) and phone OTPs had no limits,
+so one client could trigger them without bound. Routes declare their limits:
+
+    @app.route('/otp/send', methods=['POST'])
+    @rate_limit(Limit("5/minute", client_ip), Limit("3/10 minutes", json_field("email")))
+    def otp_send(): ...
+
+Each limit is a sliding-window counter: the previous window's count is weighted by
+how much of it still overlaps the sliding window, which approximates a true
+sliding log in O(1) space per key. A request over any of its limits gets a 429 with
+Retry-After.
+
+Backends (RATE_LIMIT_BACKEND):
+- memory (default): per-process dict. Under several workers, each one counts separately.
+- sqlite: counters in a shared SQLite file (RATE_LIMIT_DB_PATH), so every worker
+  on the host sees the same counts.
+Set RATE_LIMITS_ENABLED=0 to turn throttling off (e.g. for load tests).
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from functools import wraps
+from pathlib import Path
+from time import time
+
+from flask import jsonify, request
+
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+RATE_LIMIT_DB_PATH = Path(os.getenv("RATE_LIMIT_DB_PATH") or (BASE_DIR / "rate_limits.db"))
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "1") != "0"
+MAX_MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+_UNITS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+_SPEC = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+
+def parse_rate(spec: str) -> tuple[int, int]:
+    """"5/minute" or "3/10 minutes" -> (limit, window seconds)."""
+    m = _SPEC.match(spec)
+    if not m:
+        raise ValueError(f"bad rate limit spec: {spec!r}")
+    return int(m.group(1)), int(m.group(2) or 1) * _UNITS[m.group(3)]
+
+
+def _estimate(prev: float, curr: float, window_start: float, window: int, now: float) -> float:
+    overlap = 1.0 - (now - window_start) / window
+    return prev * max(0.0, overlap) + curr
+
+
+def _roll(window_start: float, prev: float, curr: float, window: int, now: float) -> tuple[float, float, float]:
+    """Advance a counter to the window containing `now`."""
+    current = now - now % window
+    if current == window_start:
+        return window_start, prev, curr
+    if current - window_start == window:
+        return current, curr, 0.0
+    return current, 0.0, 0.0  # idle for more than a full window
+
+
+def _retry_after(prev: float, curr: float, window_start: float, window: int, limit: int, now: float) -> int:
+    """Seconds until one more request would fit."""
+    if curr + 1 > limit:
+        return max(1, math.ceil(window_start + window - now))
+    # the previous window's weight has to shrink until prev * overlap + curr + 1 <= limit
+    overlap_needed = (limit - curr - 1) / prev if prev else 1.0
+    return max(1, math.ceil(window_start + window * (1.0 - overlap_needed) - now))
+
+
+class RateLimiter(ABC):
+    """Interface: `hit` counts one request and says whether it is allowed."""
+
+    @abstractmethod
+    def hit(self, key: str, limit: int, window: int) -> tuple[bool, int]:
+        """Returns (allowed, retry_after_seconds). Rejected requests are not counted."""
+
+
+class MemoryRateLimiter(RateLimiter):
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counters: dict[str, tuple[float, float, float]] = {}
+
+    def _evict(self, now: float) -> None:
+        # Counters idle for two windows carry no weight; windows vary per key, so drop
+        # anything older than a day and, failing that, the oldest half.
+        stale = [k for k, (start, _, _) in self._counters.items() if now - start > _UNITS["day"]]
+        for k in stale:
+            del self._counters[k]
+        if len(self._counters) >= self.max_keys:
+            for k in list(self._counters)[: len(self._counters) // 2]:
+                del self._counters[k]
+
+    def hit(self, key: str, limit: int, window: int) -> tuple[bool, int]:
+        now = time()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None and len(self._counters) >= self.max_keys:
+                self._evict(now)
+            start, prev, curr = _roll(*(counter or (now - now % window, 0.0, 0.0)), window, now)
+            if _estimate(prev, curr, start, window, now) + 1 > limit:
+                self._counters[key] = (start, prev, curr)
+                return False, _retry_after(prev, curr, start, window, limit, now)
+            self._counters[key] = (start, prev, curr + 1)
+            return True, 0
+
+
+class SQLiteRateLimiter(RateLimiter):
+    def __init__(self, db_path: Path = RATE_LIMIT_DB_PATH):
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # counters are disposable
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " key TEXT PRIMARY KEY, window_start REAL NOT NULL, prev REAL NOT NULL, curr REAL NOT NULL)"
+        )
+
+    def hit(self, key: str, limit: int, window: int) -> tuple[bool, int]:
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self._swept_at > _UNITS["hour"]:
+                    self._swept_at = now
+                    self._conn.execute("DELETE FROM counters WHERE window_start < ?", (now - _UNITS["day"],))
+                row = self._conn.execute(
+                    "SELECT window_start, prev, curr FROM counters WHERE key = ?", (key,)).fetchone()
+                start, prev, curr = _roll(*(row or (now - now % window, 0.0, 0.0)), window, now)
+                allowed = _estimate(prev, curr, start, window, now) + 1 <= limit
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO counters (key, window_start, prev, curr) VALUES (?, ?, ?, ?)",
+                    (key, start, prev, curr + 1 if allowed else curr))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return (True, 0) if allowed else (False, _retry_after(prev, curr, start, window, limit, now))
+
+
+def _create_rate_limiter(config) -> RateLimiter:
+    backend = (config.get("RATE_LIMIT_BACKEND") or os.getenv("RATE_LIMIT_BACKEND") or "memory").lower()
+    if backend == "sqlite":
+        return SQLiteRateLimiter(Path(config.get("RATE_LIMIT_DB_PATH") or RATE_LIMIT_DB_PATH))
+    return MemoryRateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return app_store("rate_limiter", _create_rate_limiter, "RATE_LIMIT_BACKEND", "RATE_LIMIT_DB_PATH")
+
+
+# --- request keys ---
+def client_ip() -> str | None:
+    """The originating client: first hop of X-Forwarded-For, else the socket peer."""
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0].strip() or None
+    return request.remote_addr
+
+
+def json_field(name: str):
+    """Key on a (normalised) field of the JSON body, e.g. json_field("email")."""
+    def key() -> str | None:
+        body = request.get_json(force=True, silent=True) or {}
+        value = body.get(name) if isinstance(body, dict) else None
+        if value is None:
+            return None
+        return str(value).strip().lower() or None
+    key.__name__ = name
+    return key
+
+
+class Limit:
+    def __init__(self, spec: str, key=client_ip):
+        self.limit, self.window = parse_rate(spec)
+        self.key = key
+        self.name = f"{getattr(key, '__name__', 'key')}:{self.limit}/{self.window}"
+
+
+def check(scope: str, hits) -> int | None:
+    """Count a request against each (Limit, key value) in `hits`; returns the
+    Retry-After seconds if one is exceeded, else None. Pairs with no key value (e.g.
+    no email in the body) are not counted. Framework-neutral, for non-Flask routes."""
+    if not RATE_LIMITS_ENABLED:
+        return None
+    limiter = get_rate_limiter()
+    for lim, value in hits:
+        if not value:
+            continue
+        allowed, retry_after = limiter.hit(f"{scope}:{lim.name}:{value}", lim.limit, lim.window)
+        if not allowed:
+            return retry_after
+    return None
+
+
+def rate_limit(*limits: Limit):
+    """Route decorator; place it below @app.route."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            retry_after = check(view.__name__, ((lim, lim.key()) for lim in limits))
+            if retry_after is not None:
+                response = jsonify({"error": "Too many requests", "retryAfter": retry_after})
+                response.headers["Retry-After"] = str(retry_after)
+                return response, 429
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,308 @@
+"""Server-side streaming risk scoring.
+
+The dashboard used to compute risk in the browser (useRiskData.tsx), and
+/security/login-attempt stored whatever `risk` the client sent. This engine consumes
+the backend's own events:
+
+- fingerprint logs (log_fingerprint),
+- login attempts and their confirm/report responses (record_login_attempt, ...),
+- location checks (security_location_check),
+
+and keeps a few incremental features per user. Each event updates them in O(1):
+- a bounded LRU of known devices, so a new visitorId flags a device change (the
+  persistent table in device_profiles takes precedence when the caller passes it);
+- the last IP address;
+- an exponentially decayed failure counter, so bursts count and old failures fade;
+- the latest location verdicts.
+Scoring reads only those features, so it never re-scans history and the client cannot
+influence it.
+
+Scores run 0-100, higher is riskier. The weights match the signals the frontend shows.
+
+Features live in SQLite (RISK_DB_PATH, WAL), one row per user, shared by every
+worker on the host, so a login scores the same whichever worker serves it. An event
+is applied as a read-modify-write of that row inside BEGIN IMMEDIATE, so events from
+different workers apply one after another. Recently used rows are cached in memory
+and dropped when another worker commits (PRAGMA data_version). A new database is
+bootstrapped once from the tail of the shared fingerprint log.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+
+from location_history import parse_epoch
+from metrics import timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+RISK_DB_PATH = Path(os.getenv("RISK_DB_PATH") or (BASE_DIR / "risk.db"))
+
+KNOWN_DEVICES = int(os.getenv("RISK_KNOWN_DEVICES", "20"))
+SIGNAL_TTL_SECONDS = float(os.getenv("RISK_SIGNAL_TTL", str(60 * 60)))
+FAILURE_HALF_LIFE_SECONDS = float(os.getenv("RISK_FAILURE_HALF_LIFE", str(10 * 60)))
+MAX_USERS = int(os.getenv("RISK_MAX_USERS", "100000"))  # cached in memory
+BOOTSTRAP_EVENTS = int(os.getenv("RISK_BOOTSTRAP_EVENTS", "10000"))
+
+WEIGHTS = {
+    "deviceChange": 20,
+    "ipChange": 10,
+    "locationMismatch": 15,
+    "impossibleTravel": 25,
+    "honeypot": 30,
+    "reportedAttempt": 30,
+}
+FAILURE_WEIGHT = 8  # per (decayed) failure, capped below
+FAILURE_CAP = 40
+
+
+def _is_failure(action: str) -> bool:
+    return "failed" in action or "invalid" in action
+
+
+class _UserFeatures:
+    __slots__ = ("devices", "last_ip", "signals", "failures", "failures_at", "updated_at")
+
+    def __init__(self):
+        self.devices: OrderedDict[str, float] = OrderedDict()  # visitorId -> last seen
+        self.last_ip: str | None = None
+        self.signals: dict[str, float] = {}  # signal -> time raised
+        self.failures = 0.0
+        self.failures_at = 0.0
+        self.updated_at = 0.0
+
+    def decayed_failures(self, now: float) -> float:
+        if not self.failures:
+            return 0.0
+        elapsed = max(0.0, now - self.failures_at)
+        return self.failures * math.pow(0.5, elapsed / FAILURE_HALF_LIFE_SECONDS)
+
+    def dumps(self) -> str:
+        return json.dumps({"devices": list(self.devices.items()), "lastIp": self.last_ip, "signals": self.signals,
+                           "failures": self.failures, "failuresAt": self.failures_at, "updatedAt": self.updated_at})
+
+    @classmethod
+    def loads(cls, data: str) -> "_UserFeatures":
+        d = json.loads(data)
+        feats = cls()
+        feats.devices.update((visitor_id, seen) for visitor_id, seen in d["devices"])
+        feats.last_ip = d["lastIp"]
+        feats.signals = d["signals"]
+        feats.failures, feats.failures_at, feats.updated_at = d["failures"], d["failuresAt"], d["updatedAt"]
+        return feats
+
+
+class RiskEngine:
+    def __init__(self, db_path: Path = RISK_DB_PATH, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: OrderedDict[str, _UserFeatures] = OrderedDict()
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS features (email TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # --- shared state ---
+    def _refresh(self) -> None:
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._users.clear()  # another worker wrote; reload users lazily
+            self._data_version = version
+
+    def _features(self, email: str, create: bool = True) -> _UserFeatures | None:
+        feats = self._users.get(email)
+        if feats is not None:
+            self._users.move_to_end(email)
+            return feats
+        row = self._conn.execute("SELECT data FROM features WHERE email = ?", (email,)).fetchone()
+        if row is None and not create:
+            return None
+        feats = self._users[email] = _UserFeatures.loads(row[0]) if row else _UserFeatures()
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return feats
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the database write lock; yields {email: features} to write back on commit."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            touched: dict[str, _UserFeatures] = {}
+            try:
+                # Under the write lock: re-read in case another worker just wrote
+                self._refresh()
+                yield touched
+                self._conn.executemany("INSERT OR REPLACE INTO features (email, data) VALUES (?, ?)",
+                                       [(email, feats.dumps()) for email, feats in touched.items()])
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                for email in touched:
+                    self._users.pop(email, None)
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextmanager
+    def _update(self, email: str):
+        """One user's features, written back when the block exits."""
+        with self._transaction() as touched:
+            feats = touched[email] = self._features(email)
+            yield feats
+
+    @staticmethod
+    def _when(ts) -> float:
+        return parse_epoch(ts) or time()
+
+    def _raise(self, feats: _UserFeatures, signal: str, now: float, on: bool = True) -> None:
+        if on:
+            feats.signals[signal] = now
+        else:
+            feats.signals.pop(signal, None)
+
+    def _observe_device(self, feats: _UserFeatures, visitor_id: str | None, ip: str | None, now: float,
+                        new_device: bool | None = None) -> None:
+        if visitor_id:
+            # The very first device we see for a user is their baseline, not a change.
+            # A raised signal stays until it ages out or the user confirms the login.
+            # `new_device` comes from the persistent device table when the caller has it.
+            if new_device is None:
+                new_device = visitor_id not in feats.devices and bool(feats.devices)
+            if new_device:
+                self._raise(feats, "deviceChange", now)
+            feats.devices[visitor_id] = now
+            feats.devices.move_to_end(visitor_id)
+            while len(feats.devices) > KNOWN_DEVICES:
+                feats.devices.popitem(last=False)
+        if ip:
+            if feats.last_ip is not None and ip != feats.last_ip:
+                self._raise(feats, "ipChange", now)
+            feats.last_ip = ip
+
+    def _add_failure(self, feats: _UserFeatures, now: float) -> None:
+        feats.failures = feats.decayed_failures(now) + 1.0
+        feats.failures_at = now
+
+    def _apply_fingerprint(self, feats: _UserFeatures, entry: dict, new_device: bool | None) -> None:
+        now = self._when(entry.get("timestamp"))
+        action = entry.get("action")
+        action = action if isinstance(action, str) else ""
+        fp = entry.get("fingerprint")
+        visitor_id = fp.get("visitorId") if isinstance(fp, dict) else None
+        self._observe_device(feats, visitor_id if isinstance(visitor_id, str) else None,
+                             entry.get("ip"), now, new_device)
+        if _is_failure(action):
+            self._add_failure(feats, now)
+        if "honeypot" in action:
+            self._raise(feats, "honeypot", now)
+        feats.updated_at = now
+
+    # --- event consumers ---
+    @timed("risk", "write")
+    def on_fingerprint(self, entry: dict, new_device: bool | None = None) -> None:
+        email = entry.get("email")
+        email = email.strip().lower() if isinstance(email, str) else ""
+        if not email:
+            return
+        with self._update(email) as feats:
+            self._apply_fingerprint(feats, entry, new_device)
+
+    def on_login_attempt(self, attempt: dict) -> None:
+        email = (attempt.get("email") or "").strip().lower()
+        if not email:
+            return
+        now = self._when(attempt.get("responded_at") or attempt.get("timestamp"))
+        with self._update(email) as feats:
+            status = attempt.get("status")
+            if status == "pending":
+                fp = attempt.get("fingerprint")
+                visitor_id = fp.get("visitorId") if isinstance(fp, dict) else fp
+                self._observe_device(feats, visitor_id if isinstance(visitor_id, str) else None,
+                                     attempt.get("ip"), now)
+            elif status == "reported":
+                self._raise(feats, "reportedAttempt", now)
+            elif status == "confirmed":
+                # The user vouched for this login; its device and location are fine
+                for signal in ("deviceChange", "ipChange", "locationMismatch", "impossibleTravel"):
+                    feats.signals.pop(signal, None)
+            feats.updated_at = now
+
+    def on_location_check(self, email: str, result: dict) -> None:
+        email = (email or "").strip().lower()
+        if not email:
+            return
+        now = time()  # the fix timestamp comes from the client; don't let it age signals
+        with self._update(email) as feats:
+            self._raise(feats, "locationMismatch", now, on=bool(result.get("alert")))
+            self._raise(feats, "impossibleTravel", now, on=bool(result.get("impossibleTravel")))
+            feats.updated_at = now
+
+    # --- scoring ---
+    def score(self, email: str, now: float | None = None) -> dict:
+        email = (email or "").strip().lower()
+        now = time() if now is None else now
+        with self._lock:
+            self._refresh()
+            feats = self._features(email, create=False)
+            if feats is None:
+                return {"score": 0, "signals": {}, "reasons": [], "failures": 0.0}
+            active = {k: t for k, t in feats.signals.items() if now - t <= SIGNAL_TTL_SECONDS}
+            failures = feats.decayed_failures(now)
+        total = sum(WEIGHTS[k] for k in active)
+        reasons = sorted(active, key=lambda k: -WEIGHTS[k])
+        failure_points = min(FAILURE_CAP, FAILURE_WEIGHT * failures)
+        if failure_points >= FAILURE_WEIGHT:
+            reasons.append("failureBurst")
+        total += failure_points
+        return {
+            "score": int(round(min(100, total))),
+            "signals": {k: True for k in active},
+            "reasons": reasons,
+            "failures": round(failures, 2),
+        }
+
+    def bootstrap(self, entries) -> int:
+        """Replay fingerprint entries, oldest first, in one transaction; once per database
+        (returns 0 if it was already bootstrapped, e.g. by another worker)."""
+        count = 0
+        with self._transaction() as touched:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'bootstrapped'").fetchone():
+                return 0
+            for entry in entries:
+                email = (entry.get("email") or "").strip().lower()
+                if email:
+                    feats = touched.get(email) or self._features(email)
+                    touched[email] = feats
+                    self._apply_fingerprint(feats, entry, None)
+                    count += 1
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bootstrapped', '1')")
+        return count
+
+    def bootstrapped(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'bootstrapped'").fetchone() is not None
+
+
+def _create_risk_engine(config) -> RiskEngine:
+    from fingerprint_log import get_fingerprint_log
+
+    engine = RiskEngine(Path(config.get("RISK_DB_PATH") or RISK_DB_PATH))
+    if not engine.bootstrapped():
+        recent = []
+        for entry in get_fingerprint_log().iter_reverse():
+            recent.append(entry)
+            if len(recent) >= BOOTSTRAP_EVENTS:
+                break
+        engine.bootstrap(reversed(recent))
+    return engine
+
+
+def get_risk_engine() -> RiskEngine:
+    return app_store("risk", _create_risk_engine, "RISK_DB_PATH", "FINGERPRINT_LOG_DIR")
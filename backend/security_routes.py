@@ -0,0 +1,286 @@
+"""Security routes: fingerprint logging, known devices, risk scores, login-attempt
+alerts, email delivery status and TypingDNA verification."""
+import secrets
+import uuid
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from device_profiles import get_device_profiles
+from events import FINGERPRINT_LOGGED, get_event_bus
+from fingerprint_log import get_fingerprint_log
+from http_cache import app_cache, cached_json
+from login_attempts import get_login_attempt_store
+from mailer import get_mailer
+from rate_limit import Limit, client_ip, json_field, rate_limit
+from risk_engine import get_risk_engine
+
+bp = Blueprint("security", __name__)
+
+# Shared with the native ASGI route (asgi.py), which applies the same limits
+TYPINGDNA_LIMITS = (Limit("30/minute", client_ip), Limit("10/minute", json_field("userId")))
+
+
+@bp.route("/typingdna/verify", methods=["POST"])
+@rate_limit(*TYPINGDNA_LIMITS)
+def verify_typing():
+    # requests is slow to import; only workers that get typing checks pay for it
+    import requests
+    from typingdna_client import ENROLL_PATTERNS, CircuitOpenError, apply_confidence_gate, get_typingdna_client
+
+    data = request.get_json() or {}
+    user_id = data.get("userId")
+    tp = data.get("tp")
+    textid = data.get("textid")
+
+    if not user_id or not tp:
+        return jsonify({"error": "Missing userId or typing pattern"}), 400
+    client = get_typingdna_client()
+    try:
+        # 1. Check user enrollments (cached briefly, invalidated on save)
+        patterns_count = client.enrollment_count(user_id)
+
+        # Build payload for save/verify
+        payload = {"tp": tp}
+        if textid:
+            payload["textid"] = textid
+
+        if patterns_count < ENROLL_PATTERNS:
+            # 2. Enroll pattern
+            return jsonify({"status": "enrolled", "details": client.save(user_id, payload)})
+        else:
+            # 3. Verify pattern
+            verify_data = apply_confidence_gate(client.verify(user_id, payload))
+            return jsonify({"status": "verified", "details": verify_data})
+
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503
+    except requests.Timeout:
+        return jsonify({"error": "TypingDNA request timed out"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# -----------------------------
+# Security: fingerprint logging (from main)
+# -----------------------------
+@bp.route('/security/log-fingerprint', methods=['POST'])
+def log_fingerprint():
+    """Log fingerprint data for security monitoring"""
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        if not isinstance(data, dict) or not data.get('action') or not data.get('fingerprint'):
+            return jsonify({"error": "Missing required fields"}), 400
+        fingerprint = data['fingerprint']
+        visitor_id = fingerprint.get('visitorId') if isinstance(fingerprint, dict) else None
+        # These are indexed and matched as text; anything else is rejected before it is logged
+        if not isinstance(data['action'], str) or not isinstance(data.get('email') or '', str) \
+                or not isinstance(visitor_id or '', str):
+            return jsonify({"error": "email, action and fingerprint.visitorId must be strings"}), 400
+
+        log_entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "action": data.get('action'),
+            "email": data.get('email'),
+            "fingerprint": data.get('fingerprint'),
+            "user_agent": data.get('userAgent'),
+            "client_timestamp": data.get('timestamp'),
+            # capture server-observed ip; prefer X-Forwarded-For if behind proxy
+            "ip": request.headers.get('X-Forwarded-For', request.remote_addr),
+            # optional client-provided coordinates
+            "coords": data.get('coords')
+        }
+
+        # Open the device table first: on first use it backfills from the log, which would
+        # then already hold this sighting and report the device as known
+        profiles = get_device_profiles()
+        get_fingerprint_log().append(log_entry)
+        email = (log_entry["email"] or "").strip().lower()
+        known = new_device = None
+        if email:
+            # Both decided before this sighting is recorded; a user's first device is not a change
+            known, new_device = profiles.observe(email, log_entry["fingerprint"], log_entry["timestamp"])
+        get_risk_engine().on_fingerprint(log_entry, new_device=new_device)
+        try:
+            get_event_bus().publish(FINGERPRINT_LOGGED, {**log_entry, "knownDevice": known, "newDevice": new_device})
+        except Exception as e:
+            # The sighting is logged already; failing now would make the client retry and log it twice
+            print(f"Error publishing fingerprint event: {e}")
+
+        return jsonify({"success": True, "knownDevice": known})
+
+    except Exception as e:
+        print(f"Error logging fingerprint: {e}")
+        return jsonify({"error": "Failed to log fingerprint"}), 500
+
+@bp.route('/whoami', methods=['GET'])
+def whoami():
+    """Return basic request info such as IP and user agent."""
+    try:
+        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+        return jsonify({
+            "ip": ip,
+            "user_agent": request.headers.get('User-Agent')
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/security/fingerprint-logs', methods=['GET'])
+def get_fingerprint_logs():
+    """Get fingerprint logs for security analysis.
+
+    Query params: email, action, visitorId, since/until (ISO timestamps, UTC),
+    cursor (from a previous response's nextCursor) and limit (default 100, max 1000).
+    """
+    try:
+        try:
+            limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        log = get_fingerprint_log()
+        params = {name: request.args.get(arg) for name, arg in (
+            ("email", "email"), ("action", "action"), ("visitor_id", "visitorId"),
+            ("since", "since"), ("until", "until"), ("cursor", "cursor"))}
+
+        def build():
+            logs, next_cursor = log.query(**params, limit=limit)
+            return {"logs": logs, "nextCursor": next_cursor}
+
+        key = ("fingerprint-logs", limit, *params.values())
+        try:
+            # Encoded pages, keyed by log version
+            return cached_json(app_cache("fingerprint-logs"), key, log.version, build)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        print(f"Error retrieving fingerprint logs: {e}")
+        return jsonify({"error": "Failed to retrieve logs"}), 500
+
+
+@bp.route('/security/devices', methods=['GET'])
+def security_devices():
+    """Known devices for a user: { email, devices: [{visitorId, browser, os, firstSeen, lastSeen, count}] }.
+    With visitorId, returns { email, visitorId, known, device } for that device only."""
+    email = (request.args.get('email') or '').strip().lower()
+    if not email:
+        return jsonify({"error": "email required"}), 400
+    profiles = get_device_profiles()
+    visitor_id = request.args.get('visitorId')
+    if visitor_id:
+        device = profiles.get(email, visitor_id)
+        return jsonify({"email": email, "visitorId": visitor_id, "known": device is not None, "device": device})
+    return jsonify({"email": email, "devices": profiles.list(email)})
+
+
+@bp.route('/risk/score', methods=['GET'])
+def risk_score():
+    """Current server-side risk for a user: { email, score (0-100), signals, reasons, failures }"""
+    email = (request.args.get('email') or '').strip().lower()
+    if not email:
+        return jsonify({"error": "email required"}), 400
+    return jsonify({"email": email, **get_risk_engine().score(email)})
+
+
+# -----------------------------
+# Security: login attempt alerts (from main; emails are sent by subscribers.py)
+# -----------------------------
+@bp.route('/email/status/<job_id>', methods=['GET'])
+def email_status(job_id):
+    status = get_mailer().status(job_id)
+    if not status:
+        return jsonify({'error': 'unknown email id'}), 404
+    return jsonify(status)
+
+def _create_login_attempt(payload: dict) -> dict:
+    attempt = {
+        "id": uuid.uuid4().hex,
+        "token": secrets.token_urlsafe(24),
+        "email": (payload.get('email') or '').strip().lower(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "ip": payload.get('ip') or request.remote_addr,
+        "user_agent": payload.get('userAgent') or request.headers.get('User-Agent'),
+        "fingerprint": payload.get('fingerprint'),
+        "device": payload.get('device') or {},  # {browser, os, platform, mobile}
+        "client_risk": payload.get('risk') or {},  # as reported by the browser; informational only
+        "location": payload.get('location'),
+        "status": "pending"
+    }
+    # Risk is computed server-side from our own event stream, never taken from the client
+    engine = get_risk_engine()
+    engine.on_login_attempt(attempt)
+    attempt["risk"] = engine.score(attempt["email"])  # {score, reasons: [], signals}
+
+    # Commits the LoginAttemptRecorded event with it; the alert email is sent from the outbox
+    get_login_attempt_store().add(attempt)
+    return attempt
+
+def _update_attempt_status(token: str, status: str) -> dict | None:
+    updated = get_login_attempt_store().set_status(token, status)
+    if updated:
+        get_risk_engine().on_login_attempt(updated)
+    return updated
+
+@bp.route('/security/login-attempt', methods=['POST'])
+@rate_limit(Limit("20/minute", client_ip), Limit("10/10 minutes", json_field("email")))
+def record_login_attempt():
+    body = request.get_json(force=True, silent=True) or {}
+    email = (body.get('email') or '').strip()
+    if not email:
+        return jsonify({'error': 'email required'}), 400
+    attempt = _create_login_attempt(body)
+    return jsonify({'attemptId': attempt['id'], 'status': attempt['status']}), 201
+
+@bp.route('/security/login-attempts', methods=['GET'])
+def list_login_attempts():
+    """A user's recent login attempts, newest first.
+
+    Query params: email, limit (default 20, max 200) and before (nextBefore from a
+    previous response, to page back). Tokens are never returned.
+    """
+    email = (request.args.get('email') or '').strip().lower()
+    if not email:
+        return jsonify({'error': 'email required'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 200))
+        before = float(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be numbers'}), 400
+    attempts, next_before = get_login_attempt_store().recent(email, limit=limit, before=before)
+    for a in attempts:
+        a.pop('token', None)
+    return jsonify({'attempts': attempts, 'nextBefore': next_before})
+
+@bp.route('/security/login-attempt/confirm', methods=['GET'])
+def confirm_login_attempt():
+    token = request.args.get('token')
+    if not token:
+        return jsonify({'error': 'token required'}), 400
+    updated = _update_attempt_status(token, 'confirmed')
+    if not updated:
+        return jsonify({'error': 'invalid token'}), 404
+    return jsonify({'success': True, 'attempt': updated})
+
+@bp.route('/security/login-attempt/report', methods=['GET'])
+def report_login_attempt():
+    token = request.args.get('token')
+    if not token:
+        return jsonify({'error': 'token required'}), 400
+    updated = _update_attempt_status(token, 'reported')
+    if not updated:
+        return jsonify({'error': 'invalid token'}), 404
+    # TODO: add automated responses (invalidate sessions, flag account, force password reset)
+    return jsonify({'success': True, 'attempt': updated})
+
+@bp.route('/security/login-attempt/respond', methods=['POST'])
+def respond_login_attempt():
+    body = request.get_json(force=True, silent=True) or {}
+    token = body.get('token')
+    decision = body.get('decision')  # 'confirm' | 'report'
+    if decision not in ('confirm', 'report'):
+        return jsonify({'error': 'decision must be confirm or report'}), 400
+    status = 'confirmed' if decision == 'confirm' else 'reported'
+    updated = _update_attempt_status(token, status)
+    if not updated:
+        return jsonify({'error': 'invalid token'}), 404
+    return jsonify({'success': True, 'attempt': updated})
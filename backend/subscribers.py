@@ -0,0 +1,176 @@
+"""Subscribers to the security events (see events.py).
+
+They run on the event dispatcher, after the request that recorded the event has
+returned. Delivery is at least once, so a subscriber may now and then see an event
+twice.
+
+- alerts: the login-attempt and location emails. The mail job id is derived from
+  the event id, so a redelivered event does not send a second email. The handler
+  queues the message and fails (AlertNotSent) until the mailer reports it sent,
+  so the outbox comes back after its retry backoff rather than the dispatcher
+  waiting on SMTP. The event is only acked once the email is out. A message lost
+  with a crashed worker, or one that failed, is queued again on the next
+  delivery (see mailer.send). A full queue (MailQueueFull) is retried the same way;
+- analytics: security_events_total on /metrics, per event type;
+- audit: one JSON line per event in AUDIT_LOG_PATH (login-attempt tokens left
+  out), carrying the event id so readers can drop the rare repeat. The file is
+  rotated at AUDIT_LOG_MAX_BYTES, keeping AUDIT_LOG_BACKUPS old files
+  (audit_log.jsonl.1 is the newest).
+"""
+import os
+from pathlib import Path
+
+from flask import current_app, has_app_context
+
+import events
+from location_history import LOCATIONS_DB_PATH
+from login_attempts import LOGIN_ATTEMPTS_DB_PATH
+from mailer import get_mailer
+from metrics import REGISTRY, Counter, add_bytes
+from persistence import file_lock
+from serialization import dumps
+
+BASE_DIR = Path(__file__).resolve().parent
+AUDIT_LOG_PATH = Path(os.getenv("AUDIT_LOG_PATH") or (BASE_DIR / "audit_log.jsonl"))
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+AUDIT_LOG_BACKUPS = int(os.getenv("AUDIT_LOG_BACKUPS", "5"))
+
+SECURITY_EVENTS = REGISTRY.register(Counter(
+    "security_events_total", "Security events delivered to the analytics subscriber.", ("type",)))
+
+_AUDIT_REDACTED = ("token",)
+
+
+class AlertNotSent(RuntimeError):
+    """The alert email is queued but not sent yet; the outbox checks again later."""
+
+
+def _app_path(key: str, default: Path) -> Path:
+    """`key` from the dispatching app's config (create_app(config)), else the environment's."""
+    if has_app_context() and current_app.config.get(key):
+        return Path(current_app.config[key])
+    return default
+
+
+# --- alerts ---
+def _compose_login_alert_email(attempt: dict) -> tuple[str, str]:
+    base_url = os.getenv('APP_EXTERNAL_BASE_URL') or 'http://localhost:5000'
+    token = attempt['token']
+    confirm_url = f"{base_url}/security/login-attempt/confirm?token={token}"
+    report_url = f"{base_url}/security/login-attempt/report?token={token}"
+
+    subject = f"New login to your account from {attempt.get('device', {}).get('browser') or 'an unknown device'}"
+    lines = [
+        f"Hi {attempt.get('email')},",
+        "",
+        "We detected a sign-in to your account:",
+        f"Time (UTC): {attempt.get('timestamp')}",
+        f"IP Address: {attempt.get('ip') or 'N/A'}",
+        f"Location (approx): {attempt.get('location') or 'N/A'}",
+        f"Browser: {attempt.get('device', {}).get('browser') or (attempt.get('user_agent') or '')[:40]}",
+        f"OS / Platform: {attempt.get('device', {}).get('os') or 'N/A'}",
+        f"Device Fingerprint: {attempt.get('fingerprint') or 'N/A'}",
+        f"Risk Score: {attempt.get('risk', {}).get('score', 'N/A')}",
+        f"Risk Flags: {', '.join(attempt.get('risk', {}).get('reasons', [])) or 'None'}",
+        "",
+        "If this was you, you can safely confirm below.",
+        "If this was NOT you, report it immediately so we can help secure your account.",
+        "",
+        f"YES, IT WAS ME: {confirm_url}",
+        f"NO, SECURE MY ACCOUNT: {report_url}",
+        "",
+        "If you did not initiate this and report it, we will invalidate active sessions and may require a password reset/OTP verification.",
+        "",
+        "Security Tip: Enable multi-factor authentication and review recent security logs in your profile.",
+        "",
+        "Thank you,",
+        "Security Team"
+    ]
+    body = "\n".join(lines)
+    return subject, body
+
+
+def _compose_location_alert_email(jump: dict) -> tuple[str, str]:
+    prev, saved = jump['prev'] or {}, jump['saved']
+    subject = "Security alert: New login location detected"
+    lines = [
+        "We noticed a login from a new location.",
+        "",
+        f"Previous location: lat={prev.get('lat')}, lon={prev.get('lon')} at {prev.get('timestamp')}",
+        f"New location: lat={saved['lat']}, lon={saved['lon']} at {saved['timestamp']}",
+    ]
+    if jump.get('distanceKm') is not None:
+        lines.append(f"Approx distance: {jump['distanceKm']:.1f} km")
+    if jump.get('impossibleTravel'):
+        lines.append(f"Implied travel speed: {jump['speedKmh']:.0f} km/h")
+    lines += [
+        "",
+        "If this was you, no action is needed.",
+        "If you don't recognize this, please secure your account by changing your password and enabling MFA.",
+    ]
+    return subject, "\n".join(lines)
+
+
+def _send_alert(event: dict, to_email: str, subject: str, body: str) -> None:
+    mailer = get_mailer()
+    job_id = mailer.send(to_email, subject, body, job_id=f"{event['id']}.alert")
+    status = (mailer.status(job_id) or {}).get("status")
+    if status != "sent":
+        raise AlertNotSent(f"email {job_id} is {status}")
+
+
+def send_login_alert(event: dict) -> None:
+    attempt = event["payload"]
+    if attempt.get("email"):
+        subject, body = _compose_login_alert_email(attempt)
+        _send_alert(event, attempt["email"], subject, body)
+
+
+def send_location_alert(event: dict) -> None:
+    jump = event["payload"]
+    subject, body = _compose_location_alert_email(jump)
+    _send_alert(event, jump["email"], subject, body)
+
+
+# --- analytics ---
+def count_event(event: dict) -> None:
+    SECURITY_EVENTS.inc(event["type"])
+
+
+# --- audit ---
+def _rotate_audit_log(path: Path) -> None:
+    """audit_log.jsonl -> .1 -> .2 ..., dropping the file past AUDIT_LOG_BACKUPS."""
+    if AUDIT_LOG_BACKUPS <= 0:
+        path.unlink()
+        return
+    for i in range(AUDIT_LOG_BACKUPS - 1, 0, -1):
+        older = path.with_name(f"{path.name}.{i}")
+        if older.exists():
+            older.replace(path.with_name(f"{path.name}.{i + 1}"))
+    path.replace(path.with_name(f"{path.name}.1"))
+
+
+def write_audit_record(event: dict) -> None:
+    payload = {k: v for k, v in event["payload"].items() if k not in _AUDIT_REDACTED}
+    line = dumps({"id": event["id"], "type": event["type"], "created": event["created"], "payload": payload},
+                 pretty=False) + b"\n"
+    path = _app_path("AUDIT_LOG_PATH", AUDIT_LOG_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Every worker's dispatcher appends here; the file lock keeps rotation out of their way
+    with file_lock(path):
+        if path.exists() and path.stat().st_size + len(line) > AUDIT_LOG_MAX_BYTES:
+            _rotate_audit_log(path)
+        with path.open("ab") as f:
+            f.write(line)
+    add_bytes("audit", "write", len(line))
+
+
+def register(bus: events.EventBus) -> None:
+    """Subscribe the alert, analytics and audit handlers and add the stores' outboxes."""
+    bus.add_outbox(_app_path("LOGIN_ATTEMPTS_DB_PATH", LOGIN_ATTEMPTS_DB_PATH))
+    bus.add_outbox(_app_path("LOCATIONS_DB_PATH", LOCATIONS_DB_PATH))
+    bus.subscribe(events.LOGIN_ATTEMPT_RECORDED, "alerts", send_login_alert)
+    bus.subscribe(events.LOCATION_JUMP_DETECTED, "alerts", send_location_alert)
+    for event_type in (events.LOGIN_ATTEMPT_RECORDED, events.LOCATION_JUMP_DETECTED, events.FINGERPRINT_LOGGED):
+        bus.subscribe(event_type, "analytics", count_event)
+        bus.subscribe(event_type, "audit", write_audit_record)
@@ -0,0 +1,30 @@
+"""Run from backend/ (or the repo root): python -m pytest -q
+
+Modules read their settings at import, so every store location is pointed at a
+temporary directory before any of them is imported, as bench.py does.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(tempfile.mkdtemp(prefix="backend-tests-"))
+
+os.environ.update({
+    "ACCOUNTS_DB_PATH": str(DATA_DIR / "accounts.db"),
+    "DEVICES_DB_PATH": str(DATA_DIR / "devices.db"),
+    "LOCATIONS_DB_PATH": str(DATA_DIR / "locations.db"),
+    "LOGIN_ATTEMPTS_DB_PATH": str(DATA_DIR / "login_attempts.db"),
+    "RATE_LIMIT_DB_PATH": str(DATA_DIR / "rate_limits.db"),
+    "WEBAUTHN_DB_PATH": str(DATA_DIR / "webauthn.db"),
+    "FINGERPRINT_LOG_DIR": str(DATA_DIR / "fingerprint_logs"),
+    "EVENTS_DB_PATH": str(DATA_DIR / "events.db"),
+    "AUDIT_LOG_PATH": str(DATA_DIR / "audit_log.jsonl"),
+    "MAIL_STATUS_DB_PATH": str(DATA_DIR / "mail_status.db"),
+    "RISK_DB_PATH": str(DATA_DIR / "risk.db"),
+    "OTP_DB_PATH": str(DATA_DIR / "otp_store.db"),
+    "RATE_LIMITS_ENABLED": "0",
+    "FLASK_SECRET_KEY": "tests",
+})
+sys.path.insert(0, str(BACKEND_DIR))
@@ -0,0 +1,21 @@
+def _client(tmp_path):
+    from app import create_app
+
+    return create_app({"TESTING": True, "ACCOUNTS_DB_PATH": str(tmp_path / "accounts.db")}).test_client()
+
+
+def test_new_and_signed_up_accounts_require_a_captcha(tmp_path):
+    client = _client(tmp_path)
+    response = client.post("/accounts", json={
+        "email": "signed-up@example.com", "password": "pw@12345", "name": "S", "username": "s"})
+    assert response.status_code == 201
+    assert response.get_json()["account"]["requiresCaptcha"] is True
+
+    flags = {a["email"]: a["requiresCaptcha"] for a in client.get("/accounts").get_json()["accounts"]}
+    assert flags["kong01@gmail.com"] is True  # imported from new-accounts.json
+    assert flags["asp61@gmail.com"] is False  # imported from old-accounts.json
+    assert flags["signed-up@example.com"] is True
+    assert not any("password" in a or "passwordHash" in a for a in client.get("/accounts").get_json()["accounts"])
+
+    login = client.post("/accounts/login", json={"email": "signed-up@example.com", "password": "pw@12345"})
+    assert login.status_code == 200 and login.get_json()["account"]["requiresCaptcha"] is True
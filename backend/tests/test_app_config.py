@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+import time
+
+from conftest import BACKEND_DIR
+
+
+def test_apps_with_their_own_paths_do_not_share_stores(tmp_path):
+    from account_store import get_account_store
+    from app import create_app
+
+    first = create_app({"TESTING": True, "ACCOUNTS_DB_PATH": str(tmp_path / "first.db")})
+    second = create_app({"TESTING": True, "ACCOUNTS_DB_PATH": str(tmp_path / "second.db")})
+    account = {"email": "only-first@example.com", "passwordHash": "x", "name": "F", "username": "f"}
+    with first.app_context():
+        assert get_account_store().add(account)
+    with second.app_context():
+        assert get_account_store().get(account["email"]) is None
+    with first.app_context():
+        assert get_account_store().get(account["email"])["name"] == "F"
+    assert get_account_store().get(account["email"]) is None  # the process-wide store
+
+
+def test_dispatcher_uses_the_apps_event_and_audit_paths(tmp_path):
+    from app import create_app
+    from events import get_event_bus
+
+    audit = tmp_path / "audit.jsonl"
+    app = create_app({"TESTING": True, "EVENTS_DB_PATH": str(tmp_path / "events.db"), "AUDIT_LOG_PATH": str(audit)})
+    response = app.test_client().post("/security/log-fingerprint", json={
+        "action": "login_success", "fingerprint": {"visitorId": "app-config"}})
+    assert response.status_code == 200
+    try:
+        deadline = time.monotonic() + 5
+        while not audit.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert json.loads(audit.read_text().splitlines()[0])["type"] == "FingerprintLogged"
+    finally:
+        with app.app_context():
+            get_event_bus().stop()
+
+
+def test_subscribers_are_not_imported_with_the_app():
+    code = "import sys, app; print('subscribers' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
@@ -0,0 +1,83 @@
+import asyncio
+from time import perf_counter, sleep
+
+from flask import Flask, Response
+
+from asgi import AsyncBackend
+
+
+def _slow_app() -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/slow")
+    def slow():
+        sleep(0.2)
+        return "ok"
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        from flask import request
+
+        return Response(request.get_data() + request.headers["X-Suffix"].encode(), status=201)
+
+    @app.route("/stream")
+    def stream():
+        return Response((f"{i}\n" for i in range(3)), mimetype="text/plain")
+
+    return app
+
+
+async def _call(backend: AsyncBackend, method: str, path: str, chunks=(b"",), headers=()) -> list:
+    scope = {"type": "http", "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "scheme": "http", "server": ("test", 80), "client": ("127.0.0.1", 1),
+             "headers": list(headers), "http_version": "1.1", "asgi": {"version": "3.0"}}
+    messages, pending = [], list(chunks)
+
+    async def receive():
+        body = pending.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    async def send(message):
+        messages.append(message)
+
+    await backend(scope, receive, send)
+    return messages
+
+
+async def _get(backend: AsyncBackend, path: str) -> int:
+    return (await _call(backend, "GET", path))[0]["status"]
+
+
+def test_wsgi_routes_run_concurrently():
+    backend = AsyncBackend(_slow_app(), threads=16)
+
+    async def burst():
+        return await asyncio.gather(*(_get(backend, "/slow") for _ in range(10)))
+
+    started = perf_counter()
+    statuses = asyncio.run(burst())
+    elapsed = perf_counter() - started
+    assert statuses == [200] * 10
+    # Ten 0.2 s views on one shared thread take 2 s; on the pool, about 0.2 s
+    assert elapsed < 1.0, f"10 concurrent requests took {elapsed:.2f}s"
+
+
+def test_flask_routes_served_through_pool():
+    from asgi import app as backend
+
+    assert asyncio.run(_get(backend, "/whoami")) == 200
+
+
+def test_request_body_and_headers_reach_the_view():
+    backend = AsyncBackend(_slow_app(), threads=2)
+    messages = asyncio.run(_call(backend, "POST", "/echo", [b"he", b"llo"], [(b"content-length", b"5"), (b"x-suffix", b"!")]))
+    assert messages[0]["status"] == 201
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == b"hello!"
+
+
+def test_streamed_responses_are_sent_chunk_by_chunk():
+    backend = AsyncBackend(_slow_app(), threads=2)
+    messages = asyncio.run(_call(backend, "GET", "/stream"))
+    assert messages[0]["status"] == 200
+    assert [m.get("body") for m in messages[1:-1]] == [b"0\n", b"1\n", b"2\n"]
+    assert messages[-1] == {"type": "http.response.body"}
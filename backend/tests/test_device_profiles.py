@@ -0,0 +1,43 @@
+import pytest
+
+from device_profiles import DeviceProfiles
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    return DeviceProfiles(tmp_path / "devices.db")
+
+
+def test_first_device_is_baseline_not_new(profiles):
+    assert profiles.observe("a@example.com", {"visitorId": "v1"}) == (False, False)
+    assert profiles.observe("a@example.com", {"visitorId": "v1"}) == (True, False)
+
+
+def test_second_device_is_new(profiles):
+    profiles.observe("a@example.com", {"visitorId": "v1"})
+    assert profiles.observe("a@example.com", {"visitorId": "v2"}) == (False, True)
+    assert profiles.observe("a@example.com", {"visitorId": "v2"}) == (True, False)
+
+
+@pytest.mark.parametrize("details", ["Chrome 120", ["Chrome"], 42, None])
+def test_browser_details_of_any_shape(profiles, details):
+    profiles.observe("a@example.com", {"visitorId": "v1", "browserDetails": details})
+    device = profiles.get("a@example.com", "v1")
+    assert device["browser"] is None and device["os"] is None
+
+
+def test_log_fingerprint_route(tmp_path):
+    from app import create_app
+
+    client = create_app({"TESTING": True}).test_client()
+
+    def log(visitor_id, details):
+        return client.post("/security/log-fingerprint", json={
+            "action": "login_success", "email": "route-device@example.com",
+            "fingerprint": {"visitorId": visitor_id, "browserDetails": details}})
+
+    first = log("v1", "not an object")
+    assert first.status_code == 200 and first.get_json()["knownDevice"] is False
+    assert log("v2", {"browserName": "Firefox"}).get_json()["knownDevice"] is False
+    risk = client.get("/risk/score?email=route-device@example.com").get_json()
+    assert risk["signals"] == {"deviceChange": True}
@@ -0,0 +1,133 @@
+import json
+
+import events
+import mailer
+import security_routes
+import subscribers
+from events import EventBus, Outbox
+from mailer import Mailer
+
+_SETTINGS = {"host": "127.0.0.1", "port": 9, "starttls": False, "user": None, "password": None,
+             "sender": "no-reply@localhost", "timeout": 0.5}
+
+
+def test_lost_lease_is_not_acked_or_delivered(tmp_path):
+    first, second = Outbox(tmp_path / "events.db"), Outbox(tmp_path / "events.db")
+    first.add("Test", {})
+    [stale] = first.claim(lease=0)  # expires at once, as if the handler had run too long
+    [event] = second.claim()
+    assert not first.renew(stale)
+    assert not first.ack(stale)
+
+    calls = []
+    bus = EventBus(tmp_path / "events.db")
+    bus.subscribe("Test", "audit", calls.append)
+    stale["done"] = []
+    bus._deliver(first, stale)
+    assert calls == []
+
+    bus._deliver(second, event)
+    assert len(calls) == 1
+    assert second.stats() == {"delivered": 1}
+
+
+def test_progress_is_saved_before_each_subscriber(tmp_path):
+    outbox = Outbox(tmp_path / "events.db")
+    outbox.add("Test", {})
+    bus = EventBus(tmp_path / "events.db")
+    bus.subscribe("Test", "first", lambda event: None)
+    saved = []
+    bus.subscribe("Test", "second", lambda event: saved.append(
+        json.loads(outbox._conn.execute("SELECT done FROM outbox").fetchone()[0])))
+    [event] = outbox.claim()
+    bus._deliver(outbox, event)
+    assert saved == [["first"]]
+
+
+def test_alert_is_queued_once_per_event(tmp_path):
+    first = Mailer(settings=_SETTINGS, status_path=tmp_path / "mail.db")
+    second = Mailer(settings=_SETTINGS, status_path=tmp_path / "mail.db")
+    try:
+        job_id = first.send("a@example.com", "Alert", "body", job_id="e1.alert")
+        assert first.send("a@example.com", "Alert", "body", job_id="e1.alert") == job_id
+        assert second.send("a@example.com", "Alert", "body", job_id="e1.alert") == job_id
+        assert first._unfinished == 1 and second._unfinished == 0
+    finally:
+        first.stop(timeout=1)
+        second.stop(timeout=1)
+
+
+def test_alert_lost_with_its_worker_is_sent_on_redelivery(tmp_path, monkeypatch):
+    sent = []
+
+    class FakeConnection:
+        last_used = 0.0
+
+        def __init__(self, settings):
+            pass
+
+        def send(self, msg):
+            if msg["To"] == "lost@example.com":  # not retries left over by other tests' mailers
+                sent.append(msg["To"])
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(mailer, "_Connection", FakeConnection)
+    crashed = Mailer(settings=_SETTINGS, status_path=tmp_path / "mail.db")
+    crashed.start = lambda: None  # its queue never drains: the process died with the message in it
+    current = [crashed]
+    monkeypatch.setattr(subscribers, "get_mailer", lambda: current[0])
+    bus = EventBus(tmp_path / "events.db")
+    bus.subscribe(events.LOCATION_JUMP_DETECTED, "alerts", subscribers.send_location_alert)
+    outbox = bus.outbox(tmp_path / "events.db")
+    outbox.add(events.LOCATION_JUMP_DETECTED, {
+        "email": "lost@example.com", "prev": None, "saved": {"lat": 1, "lon": 2, "timestamp": "t"}, "distanceKm": 900.0})
+
+    def redeliver():
+        outbox._conn.execute("UPDATE outbox SET next_attempt = 0")  # skip the retry backoff
+        bus.dispatch_pending()
+
+    redeliver()
+    assert sent == [] and outbox.stats() == {"pending": 1}  # not acked while only queued
+
+    current[0] = Mailer(settings=_SETTINGS, status_path=tmp_path / "mail.db")
+    monkeypatch.setattr(mailer, "REQUEUE_AFTER_SECONDS", 0)  # the crashed worker's row counts as stale
+    try:
+        redeliver()
+        current[0].join()
+        redeliver()
+        assert sent == ["lost@example.com"] and outbox.stats() == {"delivered": 1}
+
+        outbox.replay()
+        redeliver()
+        assert sent == ["lost@example.com"] and outbox.stats() == {"delivered": 1}
+    finally:
+        current[0].stop(timeout=1)
+
+
+def test_audit_log_rotates(tmp_path, monkeypatch):
+    path = tmp_path / "audit.jsonl"
+    monkeypatch.setattr(subscribers, "AUDIT_LOG_PATH", path)
+    monkeypatch.setattr(subscribers, "AUDIT_LOG_MAX_BYTES", 200)
+    monkeypatch.setattr(subscribers, "AUDIT_LOG_BACKUPS", 2)
+    for i in range(20):
+        subscribers.write_audit_record({"id": f"e{i}", "type": "Test", "created": 0, "payload": {"n": i}})
+    assert sorted(p.name for p in tmp_path.iterdir() if not p.name.endswith(".lock")) == [
+        "audit.jsonl", "audit.jsonl.1", "audit.jsonl.2"]
+    assert all(p.stat().st_size <= 200 for p in tmp_path.glob("audit.jsonl*"))
+    assert json.loads(path.read_text().splitlines()[-1])["id"] == "e19"
+
+
+def test_fingerprint_is_logged_when_publishing_fails(monkeypatch):
+    from app import create_app
+
+    class BrokenBus(events.EventBus):
+        def publish(self, event_type, payload):
+            raise RuntimeError("database is locked")
+
+    client = create_app({"TESTING": True}).test_client()
+    monkeypatch.setattr(security_routes, "get_event_bus", lambda: BrokenBus())
+    response = client.post("/security/log-fingerprint", json={
+        "action": "login_success", "fingerprint": {"visitorId": "publish-fails"}})
+    assert response.status_code == 200
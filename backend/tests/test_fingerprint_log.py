@@ -0,0 +1,66 @@
+from fingerprint_log import IndexedFingerprintLog
+
+
+def _entry(i: int, email: str, visitor_id: str, action: str = "login_success") -> dict:
+    return {"timestamp": f"2024-05-01T10:{i // 60:02d}:{i % 60:02d}", "action": action, "email": email,
+            "fingerprint": {"visitorId": visitor_id}}
+
+
+def test_query_by_email_and_visitor_pages_with_a_cursor(tmp_path):
+    log = IndexedFingerprintLog(tmp_path)
+    for i in range(25):
+        log.append(_entry(i, "A@example.com" if i % 2 else "b@example.com", f"v{i % 3}"))
+
+    logs, cursor = log.query(email="a@example.com", limit=5)
+    seen = [e["timestamp"] for e in logs]
+    while cursor:
+        logs, cursor = log.query(email="a@example.com", cursor=cursor, limit=5)
+        seen += [e["timestamp"] for e in logs]
+    assert seen == [_entry(i, "", "")["timestamp"] for i in range(23, 0, -2)]
+
+    logs, _ = log.query(email="b@example.com", visitor_id="v0", limit=100)
+    assert [e["timestamp"][-2:] for e in logs] == ["24", "18", "12", "06", "00"]
+
+
+def test_non_string_fields_do_not_break_the_index(tmp_path):
+    log = IndexedFingerprintLog(tmp_path)
+    log.append({"email": 123, "action": ["x"], "fingerprint": {"visitorId": ["v"]}, "timestamp": "2024-05-01"})
+    log.append(_entry(1, "a@example.com", "v1"))
+    assert len(log.query(limit=10)[0]) == 2
+    # A restart re-indexes the same lines from disk
+    reopened = IndexedFingerprintLog(tmp_path)
+    assert [e["email"] for e in reopened.query(email="a@example.com")[0]] == ["a@example.com"]
+
+
+def test_route_rejects_non_string_fields_and_keeps_serving():
+    from app import create_app
+
+    client = create_app({"TESTING": True}).test_client()
+    for body in ({"email": 123}, {"action": 5}, {"fingerprint": {"visitorId": ["v"]}}):
+        payload = {"action": "login_success", "email": "ok@example.com", "fingerprint": {"visitorId": "v1"}, **body}
+        assert client.post("/security/log-fingerprint", json=payload).status_code == 400
+    assert client.get("/security/fingerprint-logs").status_code == 200
+    response = client.post("/security/log-fingerprint", json={
+        "action": "login_success", "email": "ok@example.com", "fingerprint": {"visitorId": "v1"}})
+    assert response.status_code == 200
+    assert client.get("/security/fingerprint-logs?email=ok@example.com").get_json()["logs"]
+
+
+def test_appends_across_segment_boundaries_stay_queryable(tmp_path):
+    # ~110-byte lines: two per segment, and only the newest three segments are kept
+    writer = IndexedFingerprintLog(tmp_path, max_bytes=250, retention=3)
+    other = IndexedFingerprintLog(tmp_path, max_bytes=250, retention=3)  # a second worker
+    for i in range(10):
+        (writer if i % 3 else other).append(_entry(i, "a@example.com", f"v{i % 2}"))
+    assert len(writer.segment_ids()) == 3
+
+    kept = [e["timestamp"] for e in writer.iter_reverse()]
+    assert kept == [_entry(i, "", "")["timestamp"] for i in range(9, 3, -1)]
+    for log in (writer, other):
+        logs, cursor = log.query(email="a@example.com", limit=4)
+        seen = [e["timestamp"] for e in logs]
+        while cursor:
+            logs, cursor = log.query(email="a@example.com", cursor=cursor, limit=4)
+            seen += [e["timestamp"] for e in logs]
+        assert seen == kept
+        assert [e["timestamp"][-2:] for e in log.query(visitor_id="v1")[0]] == ["09", "07", "05"]
@@ -0,0 +1,41 @@
+from account_store import get_account_store
+
+
+def _app(tmp_path, name: str):
+    from app import create_app
+
+    return create_app({"TESTING": True, "ACCOUNTS_DB_PATH": str(tmp_path / f"{name}.db")})
+
+
+def _add(app, email: str) -> None:
+    with app.app_context():
+        assert get_account_store().add({"email": email, "passwordHash": "x", "name": email, "username": email})
+
+
+def _emails(response) -> set:
+    return {a["email"] for a in response.get_json()["accounts"]}
+
+
+def test_write_turns_the_old_etag_into_a_fresh_body(tmp_path):
+    app = _app(tmp_path, "accounts")
+    client = app.test_client()
+    first = client.get("/accounts")
+    etag = first.headers["ETag"]
+    assert client.get("/accounts", headers={"If-None-Match": etag}).status_code == 304
+
+    _add(app, "new@example.com")
+    after = client.get("/accounts", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+    assert "new@example.com" in _emails(after) - _emails(first)
+
+
+def test_two_apps_do_not_serve_each_others_bodies(tmp_path):
+    first, second = _app(tmp_path, "first"), _app(tmp_path, "second")
+    # Same number of writes, so both stores are at the same version
+    _add(first, "first@example.com")
+    _add(second, "second@example.com")
+    from_first = _emails(first.test_client().get("/accounts"))
+    from_second = _emails(second.test_client().get("/accounts"))
+    assert "first@example.com" in from_first and "first@example.com" not in from_second
+    assert "second@example.com" in from_second and "second@example.com" not in from_first
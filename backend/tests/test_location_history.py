@@ -0,0 +1,100 @@
+import pytest
+
+import serialization
+from location_history import LocationHistory
+
+PARIS = (48.8566, 2.3522)
+TOKYO = (35.6762, 139.6503)
+
+
+@pytest.fixture
+def history(tmp_path):
+    return LocationHistory(tmp_path / "locations.db")
+
+
+@pytest.fixture
+def client():
+    from app import create_app
+
+    return create_app({"TESTING": True}).test_client()
+
+
+@pytest.mark.parametrize("accuracy", ["high", -5, float("inf"), True, [10]])
+def test_invalid_accuracy_is_rejected(history, accuracy):
+    with pytest.raises(ValueError):
+        history.check("a@example.com", *PARIS, accuracy, "2024-05-01T10:00:00Z")
+    assert history.history("a@example.com") == []
+
+
+@pytest.mark.parametrize("coords", [{"lat": 48.8, "lon": 2.3, "accuracy": "high"},
+                                    {"lat": 48.8, "lon": 2.3, "accuracy": -1},
+                                    {"lat": "north", "lon": 2.3}])
+def test_location_check_route_returns_400_for_invalid_fields(client, coords):
+    res = client.post("/security/location-check", json={"email": "route@example.com", "coords": coords})
+    assert res.status_code == 400
+    assert "error" in res.get_json()
+
+
+def test_location_check_route_returns_400_for_invalid_timestamp(client):
+    res = client.post("/security/location-check", json={
+        "email": "route@example.com", "coords": {"lat": 48.8, "lon": 2.3}, "timestamp": "yesterday"})
+    assert res.status_code == 400
+
+
+def test_same_timestamp_is_not_impossible_travel(history):
+    history.check("a@example.com", *PARIS, 20, "2024-05-01T10:00:00Z")
+    result = history.check("a@example.com", *TOKYO, 20, "2024-05-01T10:00:00Z")
+    assert result["impossibleTravel"] is False
+    assert result["speedKmh"] is None
+    assert result["distanceKm"] > 9000
+
+
+def test_out_of_order_fix_is_not_impossible_travel(history):
+    history.check("a@example.com", *PARIS, None, "2024-05-01T10:00:00Z")
+    result = history.check("a@example.com", *TOKYO, None, "2024-05-01T09:00:00Z")
+    assert result["impossibleTravel"] is False
+
+
+def test_fast_jump_is_impossible_travel(history):
+    history.check("a@example.com", *PARIS, None, "2024-05-01T10:00:00Z")
+    result = history.check("a@example.com", *TOKYO, None, "2024-05-01T11:00:00Z")
+    assert result["impossibleTravel"] is True
+    assert result["speedKmh"] > 9000
+
+
+def test_check_many_reports_invalid_items_and_keeps_the_rest(history):
+    results = history.check_many([
+        {"email": "b@example.com", "coords": {"lat": PARIS[0], "lon": PARIS[1]}, "timestamp": "2024-05-01T10:00:00Z"},
+        {"email": "b@example.com", "coords": {"lat": 1, "lon": 2, "accuracy": "high"}},
+        {"email": "b@example.com", "coords": {"lat": 1, "lon": 2}, "timestamp": {"not": "a date"}},
+        {"email": "b@example.com", "coords": {"lon": 2}},
+        "not an object",
+        {"email": "b@example.com", "coords": {"lat": TOKYO[0], "lon": TOKYO[1], "accuracy": 30},
+         "timestamp": "2024-05-01T11:00:00Z"},
+    ])
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4, 5]
+    assert [("error" in r) for r in results] == [False, True, True, True, True, False]
+    assert "accuracy" in results[1]["error"] and "timestamp" in results[2]["error"]
+    assert results[5]["impossibleTravel"] is True
+    assert [f["lat"] for f in history.history("b@example.com")] == [PARIS[0], TOKYO[0]]
+
+
+def test_batch_route_returns_per_item_errors(client):
+    res = client.post("/security/location-check/batch?dryRun=1", json=[
+        {"email": "c@example.com", "coords": {"lat": 1, "lon": 2}},
+        {"email": "c@example.com", "coords": {"lat": 1, "lon": 2, "accuracy": "high"}},
+    ])
+    assert res.status_code == 200
+    results = res.get_json()["results"]
+    assert "error" not in results[0] and "error" in results[1]
+
+
+def test_batch_route_rejects_an_object_without_items(client):
+    item = {"email": "d@example.com", "coords": {"lat": 1, "lon": 2}}
+    res = client.post("/security/location-check/batch?dryRun=1", json=item)  # one-line NDJSON, JSON content type
+    assert res.status_code == 400
+    res = client.post("/security/location-check/batch?dryRun=1", json={"items": [item]})
+    assert res.status_code == 200 and len(res.get_json()["results"]) == 1
+    res = client.post("/security/location-check/batch?dryRun=1", data=serialization.dumps(item),
+                      content_type="application/x-ndjson")
+    assert res.status_code == 200 and len(res.get_json()["results"]) == 1
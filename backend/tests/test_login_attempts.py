@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timezone
+from time import time
+
+from events import Outbox
+from login_attempts import LoginAttemptStore
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _attempt(n: int, email: str = "a@example.com", age: float = 0) -> dict:
+    return {"id": f"id{n}", "token": f"token{n}", "email": email, "status": "pending",
+            "timestamp": _iso(time() - age)}
+
+
+def test_attempt_is_stored_with_its_event(tmp_path):
+    store = LoginAttemptStore(tmp_path / "attempts.db")
+    store.add(_attempt(1, email="A@Example.com"))
+    store.add(_attempt(1))  # same id: ignored, and no second event
+    assert store.get_by_token("token1")["id"] == "id1"
+    assert Outbox(tmp_path / "attempts.db").stats() == {"pending": 1}
+
+    assert store.set_status("token1", "confirmed")["status"] == "confirmed"
+    assert store.get("id1")["status"] == "confirmed"
+    assert store.set_status("unknown", "confirmed") is None
+
+
+def test_recent_pages_newest_first(tmp_path):
+    store = LoginAttemptStore(tmp_path / "attempts.db")
+    for n in range(5):
+        store.add(_attempt(n, age=100 - n))
+    store.add(_attempt(9, email="b@example.com"))
+    page, before = store.recent("a@example.com", limit=3)
+    assert [a["id"] for a in page] == ["id4", "id3", "id2"]
+    page, before = store.recent("a@example.com", limit=3, before=before)
+    assert [a["id"] for a in page] == ["id1", "id0"] and before is None
+
+
+def test_pending_attempts_expire_and_old_ones_are_deleted(tmp_path):
+    store = LoginAttemptStore(tmp_path / "attempts.db", pending_ttl=60, retention=3600)
+    store.add(_attempt(1, age=120))  # pending past its TTL
+    store.add(_attempt(2, age=7200))  # past retention
+    store.add(_attempt(3))
+    # Before the purge has run, the stale attempt already reads as expired and cannot be answered
+    assert store.set_status("token1", "confirmed") is None
+    assert {a["id"]: a["status"] for a in store.recent("a@example.com")[0]}["id1"] == "expired"
+
+    assert store.purge() == (2, 1)
+    assert store.get("id1")["status"] == "expired" and store.get("id2") is None
+    assert store.set_status("token3", "denied")["status"] == "denied"
+
+
+def test_legacy_file_is_imported_once(tmp_path):
+    legacy = tmp_path / "login_attempts.json"
+    legacy.write_text(json.dumps([_attempt(1), {"id": "no-token"}]))
+    store = LoginAttemptStore(tmp_path / "attempts.db")
+    assert store.import_json(legacy) == 1
+    assert store.import_json(legacy) == 0
+    assert LoginAttemptStore(tmp_path / "attempts.db").import_json(legacy) == 0
+    assert store.get_by_token("token1")["id"] == "id1"
@@ -0,0 +1,93 @@
+import smtplib
+
+import pytest
+
+import mailer
+from mailer import Mailer
+
+_SETTINGS = {"host": "127.0.0.1", "port": 9, "starttls": False, "user": None, "password": None,
+             "sender": "no-reply@localhost", "timeout": 0.5}
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    """Stands in for the SMTP server: `fail` lists outcomes for the next sends."""
+    server = {"connections": 0, "sent": [], "fail": []}
+
+    class FakeConnection:
+        last_used = 0.0
+
+        def __init__(self, settings):
+            server["connections"] += 1
+
+        def send(self, msg):
+            if server["fail"]:
+                raise server["fail"].pop(0)
+            server["sent"].append(msg["To"])
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(mailer, "_Connection", FakeConnection)
+    return server
+
+
+@pytest.fixture
+def make_mailer(tmp_path):
+    mailers = []
+
+    def make(**kwargs):
+        m = Mailer(settings=_SETTINGS, status_path=tmp_path / "mail.db", backoff_base=0.01, **kwargs)
+        mailers.append(m)
+        return m
+
+    yield make
+    for m in mailers:
+        m.stop(timeout=0)  # idle workers exit on their own within a second
+
+
+def test_batch_shares_one_connection(smtp, make_mailer):
+    m = make_mailer(workers=1)
+    ids = [m.send(f"batch{i}@example.com", "Hi", "body") for i in range(5)]
+    m.join()
+    assert sorted(smtp["sent"]) == sorted(f"batch{i}@example.com" for i in range(5))
+    assert smtp["connections"] == 1
+    assert all(m.status(job_id)["status"] == "sent" for job_id in ids)
+
+
+def test_dropped_connection_is_retried_after_a_backoff(smtp, make_mailer):
+    smtp["fail"] = [smtplib.SMTPServerDisconnected("gone")]
+    m = make_mailer(workers=1)
+    job_id = m.send("retry@example.com", "Hi", "body")
+    m.join()
+    assert smtp["sent"] == ["retry@example.com"]
+    assert smtp["connections"] == 2
+    assert m.status(job_id)["status"] == "sent" and m.status(job_id)["attempts"] == 2
+
+
+def test_message_fails_after_max_attempts(smtp, make_mailer):
+    smtp["fail"] = [smtplib.SMTPServerDisconnected("gone")] * 3
+    m = make_mailer(workers=1, max_attempts=3)
+    job_id = m.send("never@example.com", "Hi", "body")
+    m.join()
+    assert smtp["sent"] == []
+    assert m.status(job_id)["status"] == "failed" and m.status(job_id)["attempts"] == 3
+
+
+def test_refused_recipient_fails_without_a_retry(smtp, make_mailer):
+    smtp["fail"] = [smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"no such user")})]
+    m = make_mailer(workers=1)
+    refused = m.send("bad@example.com", "Hi", "body")
+    m.join()
+    assert m.status(refused)["status"] == "failed" and m.status(refused)["attempts"] == 1
+    ok = m.send("good@example.com", "Hi", "body")
+    m.join()
+    assert m.status(ok)["status"] == "sent" and smtp["connections"] == 1
+
+
+def test_status_is_visible_to_other_workers(smtp, make_mailer):
+    sender, other = make_mailer(workers=1), make_mailer(workers=1)
+    job_id = sender.send("shared@example.com", "Hi", "body")
+    sender.join()
+    assert other.status(job_id)["status"] == "sent"
+    assert other.status("unknown") is None
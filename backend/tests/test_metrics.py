@@ -0,0 +1,62 @@
+import pytest
+
+from metrics import Histogram, Registry, timed
+
+
+def _value(text: str, series: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not in output")
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.register(Histogram("op_seconds", "Op latency.", ("op",), buckets=(0.1, 1.0)))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, "read")
+    text = registry.render()
+    assert _value(text, 'op_seconds_bucket{op="read",le="0.1"}') == 1
+    assert _value(text, 'op_seconds_bucket{op="read",le="1"}') == 3
+    assert _value(text, 'op_seconds_bucket{op="read",le="+Inf"}') == 4
+    assert _value(text, 'op_seconds_count{op="read"}') == 4
+    assert _value(text, 'op_seconds_sum{op="read"}') == pytest.approx(4.05)
+
+
+def test_timed_counts_calls_and_errors(monkeypatch):
+    import metrics
+
+    registry = Registry()
+    duration = registry.register(Histogram("dep_seconds", "Dependency latency.", ("dependency", "operation")))
+    errors = registry.register(metrics.Counter("dep_errors_total", "Errors.", ("dependency", "operation")))
+    monkeypatch.setattr(metrics, "DEPENDENCY_DURATION", duration)
+    monkeypatch.setattr(metrics, "DEPENDENCY_ERRORS", errors)
+
+    @timed("store", "write")
+    def write(depth: int, fail: bool = False) -> None:
+        if fail:
+            raise OSError("disk full")
+        if depth:
+            write(depth - 1)  # nested calls through the same timed instance
+
+    write(1)
+    with pytest.raises(OSError):
+        write(0, fail=True)
+    text = registry.render()
+    assert _value(text, 'dep_seconds_count{dependency="store",operation="write"}') == 3
+    assert _value(text, 'dep_errors_total{dependency="store",operation="write"}') == 1
+
+
+def test_requests_are_labelled_by_url_rule():
+    from app import create_app
+
+    client = create_app({"TESTING": True}).test_client()
+    assert client.get("/email/status/metrics-test-1").status_code == 404
+    assert client.get("/email/status/metrics-test-2").status_code == 404
+    assert client.get("/no-such-route").status_code == 404
+    text = client.get("/metrics").get_data(as_text=True)
+    rule = 'method="GET",route="/email/status/<job_id>",status="404"'
+    assert _value(text, f"http_request_duration_seconds_count{{{rule}}}") >= 2
+    assert "metrics-test-1" not in text
+    assert 'route="unmatched"' in text
+    assert _value(text, 'http_requests_in_flight{route="/email/status/<job_id>"}') == 0
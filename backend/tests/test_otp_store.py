@@ -0,0 +1,57 @@
+from time import time
+
+import pytest
+
+import otp_store
+from otp_store import MemoryOTPStore, OTPStore, SQLiteOTPStore
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    # Two instances on one file stand in for two worker processes
+    issuer, verifier = SQLiteOTPStore(tmp_path / "otp.db"), SQLiteOTPStore(tmp_path / "otp.db")
+    issuer.put("a@example.com", {"otp": "012345", "expiresAt": int(time()) + 60})
+    assert verifier.get("a@example.com")["otp"] == "012345"
+    assert verifier.consume("a@example.com", "999999") is None
+    assert verifier.consume("a@example.com", "012345")["otp"] == "012345"
+    assert issuer.consume("a@example.com", "012345") is None
+
+
+def test_sqlite_store_expires_entries(tmp_path):
+    store = SQLiteOTPStore(tmp_path / "otp.db")
+    store.put("a@example.com", {"otp": "012345", "expiresAt": int(time()) - 1})
+    assert store.get("a@example.com") is None
+    assert store.consume("a@example.com", "012345") is None
+
+
+def test_memory_store_refused_with_several_workers(monkeypatch):
+    from app import create_app
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(RuntimeError):
+        create_app({"OTP_STORE_BACKEND": "memory"})
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    monkeypatch.setenv("OTP_STORE_DURABLE", "0")
+    with create_app({"OTP_STORE_BACKEND": "memory"}).app_context():
+        assert isinstance(otp_store.get_otp_store(), MemoryOTPStore)
+
+
+def test_memory_store_recovers_from_wal(tmp_path):
+    store = MemoryOTPStore(tmp_path / "otp.json", tmp_path / "otp.wal")
+    store.put("a@example.com", {"otp": "012345", "expiresAt": int(time()) + 60})
+    recovered = MemoryOTPStore(tmp_path / "otp.json", tmp_path / "otp.wal")
+    assert recovered.consume("a@example.com", "012345") is not None
+
+
+def test_store_without_consume_cannot_be_created():
+    class PartialStore(OTPStore):
+        def put(self, key, entry):
+            pass
+
+        def get(self, key):
+            return None
+
+        def delete(self, key):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialStore()
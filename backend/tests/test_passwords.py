@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import accounts_routes
+from account_store import get_account_store
+from otp_store import get_otp_store
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_full_queue_sheds_at_once():
+    hasher = PasswordHasher(workers=1, queue=0, timeout=10)
+    hasher._slots.acquire()  # the only slot is taken
+    started = time.perf_counter()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+    assert time.perf_counter() - started < 0.5
+
+
+def test_timed_out_hash_is_busy_and_frees_its_slot():
+    class _StuckPool:
+        def submit(self, *args):
+            return Future()  # never completes
+
+    hasher = PasswordHasher(workers=1, queue=0, timeout=0.05)
+    hasher._executor = lambda: _StuckPool()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+    assert hasher._slots.acquire(blocking=False)
+
+
+class _BusyHasher(PasswordHasher):
+    def hash(self, password: str) -> str:
+        raise PasswordHasherBusy("password hashing queue is full")
+
+
+def test_busy_reset_keeps_the_otp(monkeypatch):
+    from app import create_app
+
+    email = "reset@example.com"
+    get_account_store().add({"email": email, "password": "old", "name": "R", "username": "r"})
+    get_otp_store().put(email, {"otp": "123456", "expiresAt": int(time.time()) + 300})
+    client = create_app({"TESTING": True}).test_client()
+    body = {"email": email, "otp": "123456", "newPassword": "new-secret"}
+
+    monkeypatch.setattr(accounts_routes, "get_password_hasher", lambda: _BusyHasher(workers=0))
+    assert client.post("/accounts/reset-password", json=body).status_code == 503
+    assert get_otp_store().get(email) is not None
+
+    monkeypatch.setattr(accounts_routes, "get_password_hasher", lambda: PasswordHasher(workers=0))
+    assert client.post("/accounts/reset-password", json=body).status_code == 200
+    assert get_otp_store().get(email) is None
+    assert client.post("/accounts/reset-password", json=body).status_code == 401
+    assert get_account_store().get(email)["passwordHash"].startswith("scrypt$")
+
+
+def test_busy_rehash_does_not_fail_a_legacy_login(monkeypatch):
+    from app import create_app
+
+    email = "legacy@example.com"
+    get_account_store().add({"email": email, "password": "plain-secret", "name": "L", "username": "l"})
+    assert _BusyHasher(workers=0).verify("plain-secret", "plain-secret") == (True, None)
+
+    client = create_app({"TESTING": True}).test_client()
+    monkeypatch.setattr(accounts_routes, "get_password_hasher", lambda: _BusyHasher(workers=0))
+    body = {"email": email, "password": "plain-secret"}
+    assert client.post("/accounts/login", json=body).status_code == 200
+    assert get_account_store().get(email)["password"] == "plain-secret"  # migrated on a later login
+
+    monkeypatch.setattr(accounts_routes, "get_password_hasher", lambda: PasswordHasher(workers=0))
+    assert client.post("/accounts/login", json=body).status_code == 200
+    assert "password" not in get_account_store().get(email)
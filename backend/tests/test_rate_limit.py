@@ -0,0 +1,21 @@
+import pytest
+
+from rate_limit import MemoryRateLimiter, RateLimiter, SQLiteRateLimiter
+
+
+def test_limiter_without_hit_cannot_be_created():
+    class PartialLimiter(RateLimiter):
+        pass
+
+    with pytest.raises(TypeError):
+        PartialLimiter()
+
+
+@pytest.mark.parametrize("make", [lambda tmp_path: MemoryRateLimiter(),
+                                  lambda tmp_path: SQLiteRateLimiter(tmp_path / "rate_limits.db")])
+def test_requests_over_the_limit_are_rejected_and_not_counted(tmp_path, make):
+    limiter = make(tmp_path)
+    assert [limiter.hit("k", 3, 60)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.hit("k", 3, 60)
+    assert not allowed and 1 <= retry_after <= 60
+    assert limiter.hit("other", 3, 60) == (True, 0)
@@ -0,0 +1,24 @@
+from risk_engine import RiskEngine
+
+
+def _fingerprint(action: str, visitor_id: str, ip: str, ts: str) -> dict:
+    return {"email": "a@example.com", "action": action, "fingerprint": {"visitorId": visitor_id},
+            "ip": ip, "timestamp": ts}
+
+
+def test_workers_score_from_the_same_state(tmp_path):
+    # Two engines on one database stand in for two worker processes
+    first, second = RiskEngine(tmp_path / "risk.db"), RiskEngine(tmp_path / "risk.db")
+    assert first.score("a@example.com")["score"] == 0
+    first.on_fingerprint(_fingerprint("login_success", "v1", "10.0.0.1", "2024-05-01T10:00:00Z"))
+    second.on_fingerprint(_fingerprint("login_failed_wrong_password", "v2", "10.0.0.2", "2024-05-01T10:01:00Z"))
+    first.on_location_check("a@example.com", {"alert": True, "impossibleTravel": False})
+    now = 1714557700.0
+    assert first.score("a@example.com", now) == second.score("a@example.com", now)
+    assert set(second.score("a@example.com", now)["signals"]) == {"deviceChange", "ipChange", "locationMismatch"}
+
+
+def test_bootstrap_runs_once_per_database(tmp_path):
+    entries = [_fingerprint("login_failed_wrong_password", "v1", "10.0.0.1", "2024-05-01T10:00:00Z")]
+    assert RiskEngine(tmp_path / "risk.db").bootstrap(entries) == 1
+    assert RiskEngine(tmp_path / "risk.db").bootstrap(entries) == 0
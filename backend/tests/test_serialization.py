@@ -0,0 +1,65 @@
+import dataclasses
+import json
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+import serialization
+from serialization import dumps, iter_array, iter_object, loads
+
+
+@dataclasses.dataclass
+class _Point:
+    lat: float
+    lon: float
+
+
+def test_dumps_is_compact_utf8_unless_pretty():
+    assert dumps({"name": "Zoë", "n": [1, 2]}, pretty=False) == '{"name":"Zoë","n":[1,2]}'.encode()
+    assert dumps({"n": 1}, pretty=True) == b'{\n  "n": 1\n}'
+
+
+def test_extra_types_encode_the_same_on_every_backend():
+    value = {"day": date(2024, 5, 1), "id": UUID(int=1), "amount": Decimal("1.50"),
+             "tags": {"a"}, "point": _Point(1.0, 2.0), "big": 2 ** 70}
+    assert loads(dumps(value, pretty=False)) == {
+        "day": "2024-05-01", "id": "00000000-0000-0000-0000-000000000001", "amount": "1.50",
+        "tags": ["a"], "point": {"lat": 1.0, "lon": 2.0}, "big": 2 ** 70}
+    with pytest.raises(TypeError):
+        dumps(object())
+
+
+@pytest.mark.parametrize("bad", [b"{", b"", "nope"])
+def test_loads_raises_value_error(bad):
+    with pytest.raises(ValueError):
+        loads(bad)
+
+
+@pytest.mark.parametrize("items", [[], [{"i": i, "s": "x" * i} for i in range(50)]])
+def test_streamed_encoding_matches_dumps(items):
+    chunks = list(iter_array(items, chunk_bytes=64))
+    assert b"".join(chunks) == dumps(items, pretty=False)
+    if items:
+        assert len(chunks) > 1
+    body = b"".join(iter_object({"total": len(items)}, "logs", iter(items), chunk_bytes=64))
+    assert json.loads(body) == {"total": len(items), "logs": items}
+    assert json.loads(b"".join(iter_object({}, "logs", items))) == {"logs": items}
+
+
+def test_flask_responses_use_the_compact_encoder(monkeypatch):
+    from flask import Flask, jsonify
+
+    monkeypatch.setattr(serialization, "JSON_PRETTY", False)
+    app = Flask(__name__)
+    serialization.init_app(app)
+
+    @app.route("/payload", methods=["POST"])
+    def payload():
+        from flask import request
+
+        return jsonify({"echo": request.get_json(), "when": date(2024, 5, 1)})
+
+    response = app.test_client().post("/payload", json={"name": "Zoë"})
+    assert response.get_data() == '{"echo":{"name":"Zoë"},"when":"2024-05-01"}\n'.encode()
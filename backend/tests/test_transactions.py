@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+from transactions import Ledger
+
+
+def _ledger(tmp_path) -> Ledger:
+    path = tmp_path / "transactions.json"
+    path.write_text(json.dumps([
+        {"date": "2025-07-02", "description": "Rent - July", "amount": -25000},
+        {"date": "2025-07-12", "description": "Amazon Order #A12F3", "amount": -3499},
+        {"date": "2025-08-01", "description": "Salary", "amount": 85000},
+        {"date": "2025-08-03", "description": "Rent - August", "amount": -25000},
+    ]))
+    return Ledger(path)
+
+
+def _descriptions(ledger: Ledger, **filters) -> list:
+    rows, _ = ledger.query(**filters, newest_first=False)
+    return [r["description"] for r in rows]
+
+
+def test_search_matches_descriptions_dates_and_amounts(tmp_path):
+    ledger = _ledger(tmp_path)
+    assert _descriptions(ledger, text="rent") == ["Rent - July", "Rent - August"]
+    assert _descriptions(ledger, text="2025-08") == ["Salary", "Rent - August"]
+    assert _descriptions(ledger, text="3499") == ["Amazon Order #A12F3"]
+    # digits inside a description still match it
+    assert _descriptions(ledger, text="12") == ["Amazon Order #A12F3"]
+    assert _descriptions(ledger, text="-25000", kind="debit") == ["Rent - July", "Rent - August"]
+    assert _descriptions(ledger, text="2025-07", category="Rent") == ["Rent - July"]
+
+
+def _export_client(tmp_path):
+    from app import create_app
+
+    _ledger(tmp_path)  # writes transactions.json
+    path = tmp_path / "transactions.json"
+    rows = json.loads(path.read_text()) + [{"date": "2025-08-09", "description": "=HYPERLINK(\"x\")", "amount": -1}]
+    path.write_text(json.dumps(rows))
+    return create_app({"TESTING": True, "TRANSACTIONS_PATH": str(path)}).test_client()
+
+
+def test_csv_export_is_oldest_first_and_escapes_formulas(tmp_path):
+    response = _export_client(tmp_path).get("/statements/export?from=2025-07-10")
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == "text/csv"
+    assert 'filename="statement.csv"' in response.headers["Content-Disposition"]
+    header, *rows = csv.reader(io.StringIO(response.get_data(as_text=True)))
+    assert header == ["Date", "Description", "Category", "Amount", "Balance"]
+    assert [r[1] for r in rows] == ["Amazon Order #A12F3", "Salary", "Rent - August", "'=HYPERLINK(\"x\")"]
+
+
+def test_ndjson_export_applies_the_filters(tmp_path):
+    response = _export_client(tmp_path).get("/statements/export?format=ndjson&type=debit&q=rent")
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r["description"] for r in rows] == ["Rent - July", "Rent - August"]
+    assert rows[-1]["balance"] == 85000 - 25000 - 3499 - 25000
+
+
+def test_export_is_encoded_as_it_is_sent(monkeypatch):
+    import transactions_routes
+
+    monkeypatch.setattr(transactions_routes, "STATEMENT_CHUNK_BYTES", 100)
+    consumed = []
+
+    def rows():
+        for i in range(20):
+            consumed.append(i)
+            yield {"date": "2025-07-01", "description": f"row {i}", "category": "Other", "amount": -1, "balance": -i}
+
+    for fmt in ("csv", "ndjson"):
+        consumed.clear()
+        chunks = transactions_routes._statement_chunks(rows(), fmt)
+        next(chunks)
+        assert 0 < len(consumed) < 20  # the first chunk went out before the last row was read
+        assert len(list(chunks)) > 1
+
+
+def test_export_rejects_an_unknown_format(tmp_path):
+    assert _export_client(tmp_path).get("/statements/export?format=xlsx").status_code == 400
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+
+import pytest
+import requests
+
+from typingdna_client import AsyncTypingDNAClient, CircuitBreaker, CircuitOpenError, TypingDNAClient
+
+
+class _Interrupted(BaseException):
+    pass
+
+
+def _half_open_client() -> TypingDNAClient:
+    client = TypingDNAClient("key", "secret", base_url="http://typingdna.invalid",
+                             breaker=CircuitBreaker(threshold=1, reset_after=0))
+    client.breaker.record_failure()
+    assert client.breaker.state == "half-open"
+    return client
+
+
+class _Response:
+    def __init__(self, data: dict, status_code: int = 200):
+        self.status_code = status_code
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        raise requests.HTTPError(f"{self.status_code} Server Error")
+
+
+class _FakeUpstream:
+    """Records requests; answers with `responses` in order (an exception is raised)."""
+
+    def __init__(self, *responses):
+        self.calls = []
+        self.responses = list(responses)
+
+    def __call__(self, method, url, **kwargs):
+        self.calls.append((method, url.rsplit("/", 2)[-2]))
+        response = self.responses.pop(0) if self.responses else _Response({"count": 3})
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_enrollment_count_is_cached_until_a_save(monkeypatch):
+    client = TypingDNAClient("key", "secret", base_url="http://typingdna.invalid", count_ttl=60)
+    upstream = _FakeUpstream(_Response({"count": 1}), _Response({"success": 1}), _Response({"count": 2}))
+    monkeypatch.setattr(client.session, "request", upstream)
+    assert client.enrollment_count("u1") == 1
+    assert client.enrollment_count("u1") == 1
+    client.save("u1", {"tp": "x"})
+    assert client.enrollment_count("u1") == 2
+    assert [op for _, op in upstream.calls] == ["user", "save", "user"]
+
+
+def test_breaker_opens_after_repeated_failures_and_closes_on_a_good_trial(monkeypatch):
+    client = TypingDNAClient("key", "secret", base_url="http://typingdna.invalid",
+                             breaker=CircuitBreaker(threshold=2, reset_after=0.05))
+    upstream = _FakeUpstream(requests.ConnectionError("down"), _Response({}, status_code=502))
+    monkeypatch.setattr(client.session, "request", upstream)
+    for _ in range(2):
+        with pytest.raises(requests.RequestException):
+            client.verify("u1", {})
+    with pytest.raises(CircuitOpenError):
+        client.verify("u1", {})
+    assert len(upstream.calls) == 2  # failed fast, without a request
+
+    time.sleep(0.06)
+    assert client.breaker.state == "half-open"
+    assert client.verify("u1", {}) == {"count": 3}
+    assert client.breaker.state == "closed"
+
+
+def test_interrupted_trial_lets_the_next_call_through(monkeypatch):
+    client = _half_open_client()
+
+    def interrupted(*args, **kwargs):
+        raise _Interrupted
+
+    monkeypatch.setattr(client.session, "request", interrupted)
+    with pytest.raises(_Interrupted):
+        client.verify("u1", {})
+    client.breaker.before_call()  # not CircuitOpenError: the trial slot was released
+    with pytest.raises(CircuitOpenError):
+        client.breaker.before_call()  # ...and is taken again by that call
+
+
+def test_cancelled_async_trial_lets_the_next_call_through():
+    httpx = pytest.importorskip("httpx")
+    client = AsyncTypingDNAClient(_half_open_client())
+
+    async def hang(request):
+        await asyncio.sleep(60)
+
+    client.http = httpx.AsyncClient(transport=httpx.MockTransport(hang))
+
+    async def cancel_trial():
+        trial = asyncio.ensure_future(client.verify("u1", {}))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        await client.aclose()
+
+    asyncio.run(cancel_trial())
+    client.breaker.before_call()
@@ -0,0 +1,80 @@
+import time
+
+from webauthn_store import WebAuthnStore
+
+
+def test_credentials_are_shared_between_workers(tmp_path):
+    first, second = WebAuthnStore(tmp_path / "webauthn.db"), WebAuthnStore(tmp_path / "webauthn.db")
+    first.add_credential("cred-a", "simple", "handle-a", {"id": "cred-a"}, email="A@example.com")
+    first.add_credential("cred-b", "fido2", "handle-a", b"\x00attested")
+    assert second.get_credential("cred-a")["data"] == {"id": "cred-a"}
+    assert second.get_credential("cred-b")["data"] == b"\x00attested"
+    assert [c["credentialId"] for c in second.credentials_for_user("simple", "handle-a")] == ["cred-a"]
+    assert second.user_handle_for("simple", "a@example.com") == "handle-a"
+
+
+def test_replacing_a_credential_moves_it_to_its_new_user(tmp_path):
+    store = WebAuthnStore(tmp_path / "webauthn.db")
+    store.add_credential("cred-a", "simple", "handle-a", {}, email="a@example.com")
+    store.add_credential("cred-a", "simple", "handle-b", {}, email="b@example.com")
+    assert store.credentials_for_user("simple", "handle-a") == []
+    assert [c["credentialId"] for c in store.credentials_for_user("simple", "handle-b")] == ["cred-a"]
+    assert [c["credentialId"] for c in WebAuthnStore(tmp_path / "webauthn.db")
+            .credentials_for_user("simple", "handle-b")] == ["cred-a"]
+
+
+def test_challenge_is_consumed_once_by_any_worker(tmp_path):
+    first, second = WebAuthnStore(tmp_path / "webauthn.db"), WebAuthnStore(tmp_path / "webauthn.db")
+    challenge_id = first.put_challenge({"challenge": "abc"})
+    assert second.pop_challenge(challenge_id) == {"challenge": "abc"}
+    assert first.pop_challenge(challenge_id) is None
+    assert first.pop_challenge(None) is None
+
+
+def test_expired_challenge_is_refused(tmp_path):
+    store = WebAuthnStore(tmp_path / "webauthn.db", challenge_ttl=0)
+    challenge_id = store.put_challenge({"challenge": "abc"})
+    time.sleep(0.01)
+    assert store.pop_challenge(challenge_id) is None
+
+
+def test_passkey_registered_before_a_restart_still_verifies(tmp_path):
+    from app import create_app
+
+    config = {"TESTING": True, "WEBAUTHN_DB_PATH": str(tmp_path / "webauthn.db")}
+    client = create_app(config).test_client()
+    assert client.get("/webauthn/register-challenge?email=r@example.com").status_code == 200
+    assert client.post("/webauthn/register-credential", json={"id": "cred-r"}).status_code == 200
+
+    restarted = create_app(config).test_client()
+    restarted.get("/webauthn/authenticate-challenge?email=r@example.com")
+    assert restarted.post("/webauthn/verify-assertion", json={"id": "cred-r"}).status_code == 200
+    assert restarted.post("/webauthn/verify-assertion", json={"id": "unknown"}).status_code == 400
+
+
+def test_allow_credentials_lists_only_the_users_passkeys(tmp_path):
+    store = WebAuthnStore(tmp_path / "webauthn.db")
+    store.add_credential("YWFh", "simple", "handle-a", {}, email="a@example.com")
+    store.add_credential("YWFhYg==", "simple", "handle-a", {}, email="a@example.com")  # padded id
+    store.add_credential("YmJi", "simple", "handle-b", {}, email="b@example.com")
+    store.add_credential("fido-a", "fido2", "handle-a", b"data", email="a@example.com")
+
+    expected = [{"type": "public-key", "id": "YWFh"}, {"type": "public-key", "id": "YWFhYg"}]
+    assert store.allow_credentials("simple", email=" A@example.com ") == expected
+    assert store.allow_credentials("simple", user_handle="handle-a") == expected
+    assert store.allow_credentials("simple", email="nobody@example.com") == []
+
+
+def test_authenticate_challenge_is_scoped_to_the_email(tmp_path):
+    from app import create_app
+
+    client = create_app({"TESTING": True, "WEBAUTHN_DB_PATH": str(tmp_path / "webauthn.db")}).test_client()
+    for email, cred_id in (("a@example.com", "Y3JlZC1h"), ("b@example.com", "Y3JlZC1i")):
+        client.get(f"/webauthn/register-challenge?email={email}")
+        client.post("/webauthn/register-credential", json={"id": cred_id})
+
+    allowed = client.get("/webauthn/authenticate-challenge?email=a@example.com").get_json()["allowCredentials"]
+    assert [c["id"] for c in allowed] == ["Y3JlZC1h"]
+    # Unknown users, and requests naming nobody, leave the choice to the authenticator
+    assert client.get("/webauthn/authenticate-challenge?email=c@example.com").get_json()["allowCredentials"] is None
+    assert client.get("/webauthn/authenticate-challenge").get_json()["allowCredentials"] is None
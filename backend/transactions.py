@@ -0,0 +1,270 @@
+"""Account transactions for the dashboard and statements pages.
+
+The pages used to download public/transactions.json and filter and sum it in the
+browser, which does not hold up once an account has years of history. The ledger
+below loads the file once (and again whenever it changes on disk) into columns:
+
+- dates as day ordinals (array 'i'), kept sorted, so a date range is two bisects;
+- amounts (array 'd'), plus running totals of the balance, credits and debits, so
+  the sum over any date range is a couple of subtractions;
+- descriptions interned as indexes into a string table (array 'I'). A text search
+  matches each distinct description once, not every row. As on the statements page
+  before it moved here, a search made of digits, '-' and '.' also matches dates and
+  amounts; those are checked row by row.
+
+Monthly in/out totals are kept in a dict and updated row by row as the ledger is
+built or appended to, so a month's numbers cost one lookup. Amounts are in the
+account currency: credits positive, debits negative.
+"""
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from pathlib import Path
+
+from metrics import timed
+from persistence import app_store, file_version, read_json
+
+BASE_DIR = Path(__file__).resolve().parent
+PUBLIC_DIR = (BASE_DIR / ".." / "public").resolve()
+TRANSACTIONS_PATH = Path(os.getenv("TRANSACTIONS_PATH") or (PUBLIC_DIR / "transactions.json"))
+
+_CATEGORY_SPLIT = re.compile(r"\s+-\s+|:\s*|\s+#")
+_DATE_OR_AMOUNT = re.compile(r"[0-9.-]+")
+
+
+def parse_date(value: str | None) -> int | None:
+    """Day ordinal of an ISO date (YYYY-MM-DD); None if empty. Raises ValueError if malformed."""
+    if not value:
+        return None
+    return date.fromisoformat(value[:10]).toordinal()
+
+
+def category_of(description: str) -> str:
+    """Merchant category from the description: "Groceries - BigBazaar" -> "Groceries"."""
+    return _CATEGORY_SPLIT.split(description, 1)[0].strip() or description
+
+
+def _num(value: float):
+    """Whole amounts back as ints, as they appear in transactions.json."""
+    return int(value) if value.is_integer() else value
+
+
+def _month(ordinal: int) -> str:
+    return date.fromordinal(ordinal).isoformat()[:7]
+
+
+class Ledger:
+    def __init__(self, path: Path = TRANSACTIONS_PATH):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._version = object()  # never equal to a real file version, so the first call loads
+        self._reset()
+
+    def _reset(self) -> None:
+        self._dates = array("i")
+        self._amounts = array("d")
+        self._descs = array("I")
+        # cumulative totals; index i covers rows [0, i)
+        self._balance = array("d", [0.0])
+        self._credits = array("d", [0.0])
+        self._debits = array("d", [0.0])
+        self._strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+        self._categories: list[str] = []  # parallel to _strings
+        self._months: dict[str, list] = {}  # "YYYY-MM" -> [credits, debits, count]
+
+    # --- building ---
+    def _intern(self, description: str) -> int:
+        sid = self._string_ids.get(description)
+        if sid is None:
+            sid = self._string_ids[description] = len(self._strings)
+            self._strings.append(description)
+            self._categories.append(category_of(description))
+        return sid
+
+    def _append_row(self, ordinal: int, description: str, amount: float) -> None:
+        self._dates.append(ordinal)
+        self._amounts.append(amount)
+        self._descs.append(self._intern(description))
+        self._balance.append(self._balance[-1] + amount)
+        self._credits.append(self._credits[-1] + (amount if amount > 0 else 0.0))
+        self._debits.append(self._debits[-1] + (-amount if amount < 0 else 0.0))
+        month = self._months.setdefault(_month(ordinal), [0.0, 0.0, 0])
+        if amount > 0:
+            month[0] += amount
+        else:
+            month[1] -= amount
+        month[2] += 1
+
+    @staticmethod
+    def _parse_row(row) -> tuple[int, str, float] | None:
+        if not isinstance(row, dict):
+            return None
+        try:
+            return parse_date(row.get("date")), str(row.get("description") or ""), float(row["amount"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @timed("transactions", "load")
+    def _load(self) -> None:
+        data = read_json(self.path, [])
+        rows = [r for r in map(self._parse_row, data if isinstance(data, list) else []) if r and r[0]]
+        rows.sort(key=lambda r: r[0])  # stable: same-day rows keep file order
+        self._reset()
+        for row in rows:
+            self._append_row(*row)
+
+    def _refresh(self) -> None:
+        version = file_version(self.path)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._load()
+                self._version = version
+
+    def append(self, txn_date: str, description: str, amount: float) -> None:
+        """Record one transaction in memory. The rollups are updated in place when it
+        is the newest row; a back-dated one rebuilds the columns."""
+        ordinal = parse_date(txn_date)
+        if ordinal is None:
+            raise ValueError("date required")
+        self._refresh()
+        with self._lock:
+            if not self._dates or ordinal >= self._dates[-1]:
+                self._append_row(ordinal, description, float(amount))
+                return
+            rows = [(d, self._strings[s], a) for d, s, a in zip(self._dates, self._descs, self._amounts)]
+            rows.insert(bisect_right(self._dates, ordinal), (ordinal, description, float(amount)))
+            self._reset()
+            for row in rows:
+                self._append_row(*row)
+
+    # --- queries ---
+    def _range(self, start: int | None, end: int | None) -> tuple[int, int]:
+        lo = 0 if start is None else bisect_left(self._dates, start)
+        hi = len(self._dates) if end is None else bisect_right(self._dates, end)
+        return lo, max(lo, hi)
+
+    def _columns(self) -> tuple:
+        # _reset swaps in new objects and appends never touch existing rows, so this
+        # snapshot stays consistent after the lock is released
+        return self._dates, self._amounts, self._descs, self._balance, self._strings, self._categories
+
+    @staticmethod
+    def _row(columns: tuple, i: int) -> dict:
+        dates, amounts, descs, balance, strings, categories = columns
+        sid = descs[i]
+        return {
+            "date": date.fromordinal(dates[i]).isoformat(),
+            "description": strings[sid],
+            "category": categories[sid],
+            "amount": _num(amounts[i]),
+            "balance": _num(balance[i + 1]),
+        }
+
+    def _select(self, start, end, text, category, kind, newest_first) -> tuple:
+        """(columns, row indexes in order) for a filter; indexes are a lazy iterator."""
+        lo, hi = self._range(start, end)
+        columns = self._columns()
+        order = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+        if not (text or category or kind):
+            return columns, order
+        dates, amounts, descs = columns[0], columns[1], columns[2]
+        cat_sids = text_sids = None
+        if category:
+            cat = category.lower()
+            cat_sids = {sid for sid, c in enumerate(self._categories) if c.lower() == cat}
+        needle = (text or "").lower()
+        if needle:
+            text_sids = {sid for sid, s in enumerate(self._strings) if needle in s.lower()}
+        numeric = needle if _DATE_OR_AMOUNT.fullmatch(needle) else None
+
+        def text_match(i: int) -> bool:
+            if text_sids is None or descs[i] in text_sids:
+                return True
+            return numeric is not None and (numeric in date.fromordinal(dates[i]).isoformat()
+                                            or numeric in str(_num(amounts[i])))
+
+        return columns, (
+            i for i in order
+            if (cat_sids is None or descs[i] in cat_sids)
+            and (kind != "credit" or amounts[i] > 0)
+            and (kind != "debit" or amounts[i] < 0)
+            and text_match(i)
+        )
+
+    def query(self, start: int | None = None, end: int | None = None, text: str | None = None,
+              category: str | None = None, kind: str | None = None, newest_first: bool = True,
+              offset: int = 0, limit: int = 50) -> tuple[list, int]:
+        """(page of rows, total matching) for the date range [start, end] (day ordinals).
+
+        `text` matches description substrings (and, if numeric, dates and amounts),
+        `category` is exact (case-insensitive),
+        `kind` is "credit" or "debit". Each row carries the running balance after it.
+        """
+        self._refresh()
+        with self._lock:
+            columns, indexes = self._select(start, end, text, category, kind, newest_first)
+            if isinstance(indexes, range):
+                return [self._row(columns, i) for i in indexes[offset:offset + limit]], len(indexes)
+            matches = list(indexes)
+            return [self._row(columns, i) for i in matches[offset:offset + limit]], len(matches)
+
+    def iter_rows(self, start: int | None = None, end: int | None = None, text: str | None = None,
+                  category: str | None = None, kind: str | None = None, newest_first: bool = False):
+        """Yield every matching row (same filters as `query`) without building a list.
+
+        The lock is held only while the filter is set up, so a slow consumer
+        never blocks writers or other readers.
+        """
+        self._refresh()
+        with self._lock:
+            columns, indexes = self._select(start, end, text, category, kind, newest_first)
+        for i in indexes:
+            yield self._row(columns, i)
+
+    def totals(self, start: int | None = None, end: int | None = None) -> dict:
+        """In/out totals and closing balance for [start, end], from the running sums."""
+        self._refresh()
+        with self._lock:
+            lo, hi = self._range(start, end)
+            credits = self._credits[hi] - self._credits[lo]
+            debits = self._debits[hi] - self._debits[lo]
+            return {
+                "in": _num(credits),
+                "out": _num(debits),
+                "net": _num(credits - debits),
+                "count": hi - lo,
+                "openingBalance": _num(self._balance[lo]),
+                "closingBalance": _num(self._balance[hi]),
+            }
+
+    def monthly(self, start: int | None = None, end: int | None = None) -> list:
+        """Per-month in/out totals (oldest first) for the months touching [start, end]."""
+        self._refresh()
+        with self._lock:
+            first = _month(start) if start is not None else None
+            last = _month(end) if end is not None else None
+            return [
+                {"month": m, "in": _num(v[0]), "out": _num(v[1]), "net": _num(v[0] - v[1]), "count": v[2]}
+                for m, v in sorted(self._months.items())
+                if (first is None or m >= first) and (last is None or m <= last)
+            ]
+
+    def categories(self) -> list:
+        self._refresh()
+        with self._lock:
+            return sorted(set(self._categories))
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._dates)
+
+
+def get_ledger() -> Ledger:
+    return app_store("ledger", lambda config: Ledger(Path(config.get("TRANSACTIONS_PATH") or TRANSACTIONS_PATH)),
+                     "TRANSACTIONS_PATH")
@@ -0,0 +1,118 @@
+"""Transaction routes for the dashboard and statements pages, including the
+streamed statement export."""
+import csv
+import io
+
+from flask import Blueprint, Response, jsonify, request
+
+import serialization
+from transactions import get_ledger, parse_date
+
+bp = Blueprint("transactions", __name__)
+
+
+def _date_range_args():
+    """(start, end) day ordinals from ?from=&to= (YYYY-MM-DD); raises ValueError."""
+    return parse_date(request.args.get('from')), parse_date(request.args.get('to'))
+
+def _transaction_filters(default_order='desc') -> dict:
+    """Ledger filter kwargs from the query string; raises ValueError on bad input."""
+    start, end = _date_range_args()
+    kind = (request.args.get('type') or '').lower()
+    if kind not in ('', 'all', 'credit', 'debit'):
+        raise ValueError('type must be credit or debit')
+    return {
+        'start': start,
+        'end': end,
+        'text': (request.args.get('q') or '').strip() or None,
+        'category': (request.args.get('category') or '').strip() or None,
+        'kind': kind if kind in ('credit', 'debit') else None,
+        'newest_first': (request.args.get('order') or default_order).lower() != 'asc',
+    }
+
+@bp.route('/transactions', methods=['GET'])
+def list_transactions():
+    """Transactions with their running balance, newest first.
+
+    Query params: from / to (YYYY-MM-DD, inclusive), q (description search; a
+    numeric q also matches dates and amounts), category, type (credit | debit),
+    order (desc | asc), offset, and limit (default 50, max 500).
+    Response JSON: { transactions: [ { date, description, category, amount, balance } ], total, offset, limit }
+    """
+    try:
+        filters = _transaction_filters()
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD, type credit or debit, offset and limit integers'}), 400
+    rows, total = get_ledger().query(**filters, offset=offset, limit=limit)
+    return jsonify({'transactions': rows, 'total': total, 'offset': offset, 'limit': limit})
+
+@bp.route('/transactions/summary', methods=['GET'])
+def transactions_summary():
+    """In/out totals and closing balance for ?from=&to=, plus a per-month breakdown."""
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+    ledger = get_ledger()
+    return jsonify({
+        'totals': ledger.totals(start, end),
+        'months': ledger.monthly(start, end),
+        'categories': ledger.categories(),
+    })
+
+
+STATEMENT_CSV_COLUMNS = ('date', 'description', 'category', 'amount', 'balance')
+STATEMENT_CHUNK_BYTES = 64 * 1024
+
+def _csv_text(value):
+    # Keep spreadsheet apps from evaluating descriptions as formulas
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+def _statement_chunks(rows, fmt):
+    """Encode rows as CSV or NDJSON, yielding ~STATEMENT_CHUNK_BYTES at a time."""
+    buf = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buf)
+        writer.writerow([c.capitalize() for c in STATEMENT_CSV_COLUMNS])
+        for row in rows:
+            writer.writerow([_csv_text(row[c]) for c in STATEMENT_CSV_COLUMNS])
+            if buf.tell() >= STATEMENT_CHUNK_BYTES:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode('utf-8')
+        return
+    out, size = [], 0
+    for row in rows:
+        line = serialization.dumps(row, pretty=False) + b'\n'
+        out.append(line)
+        size += len(line)
+        if size >= STATEMENT_CHUNK_BYTES:
+            yield b''.join(out)
+            out, size = [], 0
+    yield b''.join(out)
+
+@bp.route('/statements/export', methods=['GET'])
+def export_statement():
+    """Download transactions as CSV (default) or NDJSON (?format=ndjson), oldest first.
+
+    Takes the same filters as GET /transactions, without pagination. Rows are
+    encoded as the response is sent, so memory use does not grow with the range.
+    """
+    fmt = (request.args.get('format') or 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        filters = _transaction_filters(default_order='asc')
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD, type credit or debit'}), 400
+    rows = get_ledger().iter_rows(**filters)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(_statement_chunks(rows, fmt), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="statement.{fmt}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks through as they come
+    return response
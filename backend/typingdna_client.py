@@ -0,0 +1,249 @@
+"""TypingDNA API client used by /typingdna/verify.
+
+All calls share one requests.Session, so HTTP keep-alive connections are reused.
+Every call has a connect/read timeout. The per-user enrollment count from
+GET /user/{id} is cached for a short TTL and dropped whenever we save a new
+pattern. A circuit breaker fails fast once the upstream keeps erroring, which
+stops a slow TypingDNA from tying up every worker.
+
+TYPINGDNA_BASE_URL can point the client at a local mock server.
+"""
+import os
+import threading
+from time import monotonic
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import add_bytes, timed
+
+DEFAULT_BASE_URL = "https://api.typingdna.com"
+ENROLL_PATTERNS = 3  # patterns saved before we start verifying
+CONFIDENCE_THRESHOLD = 70
+
+
+def apply_confidence_gate(verify_data: dict) -> dict:
+    """Custom confidence gating on top of TypingDNA's own result."""
+    verify_data["result"] = 1 if verify_data.get("score", 0) >= CONFIDENCE_THRESHOLD else 0
+    return verify_data
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `reset_after`."""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if monotonic() - self._opened_at < self.reset_after or self._trial_in_flight:
+                raise CircuitOpenError("TypingDNA temporarily unavailable")
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """The call ended without an answer from upstream (cancelled, or a bug on our
+        side): count nothing, but let the next caller make the half-open trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = monotonic()
+
+
+class _CountCache:
+    """Short-TTL cache of per-user enrollment counts."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._counts: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> int | None:
+        with self._lock:
+            hit = self._counts.get(user_id)
+            if hit and hit[0] > monotonic():
+                return hit[1]
+            self._counts.pop(user_id, None)
+            return None
+
+    def set(self, user_id: str, count: int) -> None:
+        with self._lock:
+            self._counts[user_id] = (monotonic() + self.ttl, count)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._counts.pop(user_id, None)
+
+
+class TypingDNAClient:
+    def __init__(self, api_key: str | None, api_secret: str | None,
+                 base_url: str = DEFAULT_BASE_URL,
+                 connect_timeout: float = 2.0, read_timeout: float = 5.0,
+                 count_ttl: float = 30.0, pool_size: int = 20,
+                 breaker: CircuitBreaker | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.auth = (api_key or "", api_secret or "")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.counts = _CountCache(count_ttl)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _request(self, method: str, path: str, **kwargs) -> dict:
+        self.breaker.before_call()
+        operation = path.split("/")[1]  # user / save / verify, without the user id
+        try:
+            with timed("typingdna", operation):
+                r = self.session.request(method, f"{self.base_url}{path}",
+                                         timeout=(self.connect_timeout, self.read_timeout), **kwargs)
+                if r.status_code >= 500:
+                    r.raise_for_status()
+                data = r.json()
+            add_bytes("typingdna", operation, len(r.content))
+        except (requests.RequestException, ValueError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return data
+
+    def invalidate(self, user_id: str) -> None:
+        self.counts.invalidate(user_id)
+
+    def enrollment_count(self, user_id: str) -> int:
+        cached = self.counts.get(user_id)
+        if cached is not None:
+            return cached
+        count = int(self._request("GET", f"/user/{user_id}").get("count", 0) or 0)
+        self.counts.set(user_id, count)
+        return count
+
+    # --- API calls ---
+    def save(self, user_id: str, payload: dict) -> dict:
+        try:
+            return self._request("POST", f"/save/{user_id}", data=payload)
+        finally:
+            self.invalidate(user_id)
+
+    def verify(self, user_id: str, payload: dict) -> dict:
+        return self._request("POST", f"/verify/{user_id}", data=payload)
+
+
+class AsyncTypingDNAClient:
+    """httpx-based twin of TypingDNAClient for the ASGI serving mode.
+
+    Shares the breaker and count cache with the synchronous client so both
+    serving paths see the same upstream health and enrollment state.
+    """
+
+    def __init__(self, sync_client: TypingDNAClient):
+        import httpx  # optional dependency, only needed for ASGI serving
+
+        self.base_url = sync_client.base_url
+        self.breaker = sync_client.breaker
+        self.counts = sync_client.counts
+        self._httpx = httpx
+        self.http = httpx.AsyncClient(
+            auth=sync_client.auth,
+            timeout=httpx.Timeout(sync_client.read_timeout, connect=sync_client.connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=sync_client.pool_size,
+                                max_connections=sync_client.pool_size * 5),
+        )
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        self.breaker.before_call()
+        operation = path.split("/")[1]
+        try:
+            with timed("typingdna", operation):
+                r = await self.http.request(method, f"{self.base_url}{path}", **kwargs)
+                if r.status_code >= 500:
+                    r.raise_for_status()
+                data = r.json()
+            add_bytes("typingdna", operation, len(r.content))
+        except (self._httpx.HTTPError, ValueError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:  # e.g. CancelledError when the client disconnects
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return data
+
+    async def enrollment_count(self, user_id: str) -> int:
+        cached = self.counts.get(user_id)
+        if cached is not None:
+            return cached
+        count = int((await self._request("GET", f"/user/{user_id}")).get("count", 0) or 0)
+        self.counts.set(user_id, count)
+        return count
+
+    async def save(self, user_id: str, payload: dict) -> dict:
+        try:
+            return await self._request("POST", f"/save/{user_id}", data=payload)
+        finally:
+            self.counts.invalidate(user_id)
+
+    async def verify(self, user_id: str, payload: dict) -> dict:
+        return await self._request("POST", f"/verify/{user_id}", data=payload)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+_client: TypingDNAClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_typingdna_client() -> TypingDNAClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TypingDNAClient(
+                    os.getenv("TYPINGDNA_API_KEY"),
+                    os.getenv("TYPINGDNA_API_SECRET"),
+                    base_url=os.getenv("TYPINGDNA_BASE_URL") or DEFAULT_BASE_URL,
+                    connect_timeout=float(os.getenv("TYPINGDNA_CONNECT_TIMEOUT", "2")),
+                    read_timeout=float(os.getenv("TYPINGDNA_READ_TIMEOUT", "5")),
+                    count_ttl=float(os.getenv("TYPINGDNA_COUNT_TTL", "30")),
+                    breaker=CircuitBreaker(
+                        threshold=int(os.getenv("TYPINGDNA_BREAKER_THRESHOLD", "5")),
+                        reset_after=float(os.getenv("TYPINGDNA_BREAKER_RESET", "30")),
+                    ),
+                )
+    return _client
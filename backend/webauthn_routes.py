@@ -0,0 +1,179 @@
+"""WebAuthn routes: the lightweight browser-JSON flow and the full FIDO2 ceremony.
+
+fido2 takes longer to import than the rest of the backend together, so it is
+imported, and the Fido2Server built, on the first FIDO2 request.
+"""
+import os
+import threading
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+
+from flask import Blueprint, Response, jsonify, request, session
+
+from webauthn_store import get_webauthn_store
+
+bp = Blueprint("webauthn", __name__)
+
+# Relying Party (your site) info for the FIDO2 flow
+RP_ID = "localhost"
+RP_NAME = "My App"
+
+# Full FIDO2 ceremony
+FIDO2_USER_ID = b"user123"  # Replace with your actual logged-in user mapping
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_fido2_server():
+    global _server
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                from fido2.server import Fido2Server
+                from fido2.webauthn import PublicKeyCredentialRpEntity
+
+                _server = Fido2Server(PublicKeyCredentialRpEntity(id=RP_ID, name=RP_NAME))
+    return _server
+
+
+# -----------------------------
+# WebAuthn helpers (tisha-branch feature)
+# -----------------------------
+def b64encode_bytes(data: bytes) -> str:
+    return urlsafe_b64encode(data).rstrip(b"=").decode("utf-8")
+
+def b64decode_bytes(data: str) -> bytes:
+    padding = '=' * (-len(data) % 4)
+    return urlsafe_b64decode(data + padding)
+
+# Lightweight challenge / registration (simple store)
+@bp.route("/webauthn/register-challenge")
+def webauthn_register_challenge():
+    store = get_webauthn_store()
+    email = (request.args.get("email") or "").strip().lower()
+    # Keep one user handle per email so all of a user's passkeys are listed together
+    user_handle = store.user_handle_for("simple", email) if email else None
+    user_id = b64decode_bytes(user_handle) if user_handle else os.urandom(16)
+    challenge = b64encode_bytes(os.urandom(32))
+    session["webauthn_challenge"] = store.put_challenge(
+        {"challenge": challenge, "userHandle": b64encode_bytes(user_id), "email": email or None})
+
+    publicKey = {
+        "challenge": challenge,
+        "rp": {"name": "MyApp", "id": request.host.split(":")[0]},
+        "user": {
+            "id": b64encode_bytes(user_id),
+            "name": email or "user@example.com",
+            "displayName": email or "Example User"
+        },
+        "pubKeyCredParams": [{"type": "public-key", "alg": -7}],
+        "timeout": 60000,
+        "attestation": "direct"
+    }
+    return jsonify(publicKey)
+
+@bp.route("/webauthn/register-credential", methods=["POST"])
+def webauthn_register_credential():
+    data = request.get_json() or {}
+    cred_id = data.get("id")
+    if not cred_id:
+        return jsonify({"error": "Missing credential id"}), 400
+    store = get_webauthn_store()
+    # Attestation is not verified in this flow; the challenge only ties the credential to its user
+    state = store.pop_challenge(session.pop("webauthn_challenge", None)) or {}
+    store.add_credential(cred_id, "simple", state.get("userHandle"), data, email=state.get("email"))
+    return jsonify({"success": True})
+
+@bp.route("/webauthn/authenticate-challenge")
+def webauthn_authenticate_challenge():
+    """Challenge for ?email= or ?userHandle=; without either the authenticator picks a discoverable passkey."""
+    store = get_webauthn_store()
+    email = request.args.get("email")
+    user_handle = request.args.get("userHandle")
+    challenge = b64encode_bytes(os.urandom(32))
+    session["webauthn_challenge"] = store.put_challenge({"challenge": challenge})
+    allow_credentials = None
+    if email or user_handle:
+        allow_credentials = store.allow_credentials("simple", user_handle=user_handle, email=email) or None
+
+    publicKey = {
+        "challenge": challenge,
+        "timeout": 60000,
+        "rpId": request.host.split(":")[0],
+        "allowCredentials": allow_credentials
+    }
+    return jsonify(publicKey)
+
+@bp.route("/webauthn/verify-assertion", methods=["POST"])
+def webauthn_verify_assertion():
+    data = request.get_json() or {}
+    store = get_webauthn_store()
+    store.pop_challenge(session.pop("webauthn_challenge", None))
+    # Placeholder: verify signature using stored public key in production
+    credential = store.get_credential(data.get("id") or "")
+    if credential is not None and credential["kind"] == "simple":
+        return jsonify({"success": True})
+    return jsonify({"error": "Verification failed"}), 400
+
+
+def _fido2_credentials(user_id: bytes) -> list:
+    from fido2.webauthn import AttestedCredentialData
+
+    records = get_webauthn_store().credentials_for_user("fido2", b64encode_bytes(user_id))
+    return [AttestedCredentialData(r["data"]) for r in records]
+
+
+def _cbor_response(data) -> Response:
+    from fido2 import cbor
+
+    return Response(cbor.encode(data), mimetype="application/cbor")
+
+
+def _cbor_request():
+    from fido2 import cbor
+
+    return cbor.decode(request.get_data())
+
+
+@bp.route("/webauthn/register", methods=["POST"])
+def webauthn_register():
+    user = {
+        "id": FIDO2_USER_ID,
+        "name": "user@example.com",
+        "displayName": "User Example"
+    }
+    registration_data, state = get_fido2_server().register_begin(
+        user,
+        _fido2_credentials(user["id"]),
+        user_verification="preferred"
+    )
+    session["webauthn_state"] = get_webauthn_store().put_challenge(state)
+    return _cbor_response(registration_data)
+
+@bp.route("/webauthn/register/complete", methods=["POST"])
+def webauthn_register_complete():
+    store = get_webauthn_store()
+    state = store.pop_challenge(session.pop("webauthn_state", None))
+    if state is None:
+        return jsonify({"error": "Registration expired or not started"}), 400
+    auth_data = get_fido2_server().register_complete(state, _cbor_request())
+    cred = auth_data.credential_data
+    store.add_credential(b64encode_bytes(cred.credential_id), "fido2", b64encode_bytes(FIDO2_USER_ID), cred)
+    return jsonify({"status": "ok"})
+
+@bp.route("/webauthn/authenticate", methods=["POST"])
+def webauthn_authenticate():
+    creds = _fido2_credentials(FIDO2_USER_ID)
+    if not creds:
+        return jsonify({"error": "No credentials registered"}), 400
+    auth_data, state = get_fido2_server().authenticate_begin(creds)
+    session["webauthn_state"] = get_webauthn_store().put_challenge(state)
+    return _cbor_response(auth_data)
+
+@bp.route("/webauthn/authenticate/complete", methods=["POST"])
+def webauthn_authenticate_complete():
+    state = get_webauthn_store().pop_challenge(session.pop("webauthn_state", None))
+    if state is None:
+        return jsonify({"error": "Authentication expired or not started"}), 400
+    get_fido2_server().authenticate_complete(state, _fido2_credentials(FIDO2_USER_ID), _cbor_request())
+    return jsonify({"status": "authenticated"})
@@ -0,0 +1,192 @@
+"""Passkey credentials and in-flight WebAuthn ceremonies, shared by all workers.
+
+Registered credentials used to be two process-local dicts, and the ceremony state
+lived in the Flask cookie session under a random per-start secret key. So a second
+worker, or a restart, lost every passkey and every half-finished ceremony. Here:
+
+- credentials are rows in SQLite (WAL), keyed by credential id with a user-handle
+  index, and mirrored in memory so lookups are dict hits. Another worker's
+  writes are picked up through PRAGMA data_version, as in account_store;
+- ceremony state (the challenge, and for the FIDO2 flow fido2's state dict) lives
+  in a challenges table with a TTL. The browser session carries only the
+  challenge id. Each challenge can be consumed once.
+
+`kind` separates the two flows in webauthn_routes.py: "simple" stores the browser's JSON
+registration payload; "fido2" stores AttestedCredentialData bytes.
+
+Authentication challenges list only the signing-in user's credentials. The
+memory mirror indexes credentials by user handle and by email, and keeps each
+allowCredentials descriptor already encoded. Building the list therefore costs
+O(that user's passkeys), however many other users have registered.
+"""
+import binascii
+import json
+import os
+import secrets
+import sqlite3
+import threading
+from pathlib import Path
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from time import time
+
+from metrics import timed
+from persistence import app_store
+
+BASE_DIR = Path(__file__).resolve().parent
+WEBAUTHN_DB_PATH = Path(os.getenv("WEBAUTHN_DB_PATH") or (BASE_DIR / "webauthn.db"))
+CHALLENGE_TTL_SECONDS = int(os.getenv("WEBAUTHN_CHALLENGE_TTL", "300"))
+
+
+def _email_key(email: str | None) -> str:
+    return (email or "").strip().lower()
+
+
+def _descriptor(credential_id: str) -> dict:
+    """allowCredentials entry; the id is re-encoded as unpadded base64url."""
+    try:
+        raw = urlsafe_b64decode(credential_id + "=" * (-len(credential_id) % 4))
+        credential_id = urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+    except (binascii.Error, ValueError):
+        pass
+    return {"type": "public-key", "id": credential_id}
+
+
+class WebAuthnStore:
+    def __init__(self, db_path: Path = WEBAUTHN_DB_PATH, challenge_ttl: int = CHALLENGE_TTL_SECONDS):
+        self.challenge_ttl = challenge_ttl
+        self._lock = threading.RLock()
+        self._by_id: dict[str, dict] = {}
+        self._by_user: dict[tuple[str, str], list[str]] = {}  # (kind, user handle) -> credential ids
+        self._by_email: dict[tuple[str, str], list[str]] = {}  # (kind, email) -> credential ids
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS credentials ("
+            " credential_id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_handle TEXT,"
+            " data BLOB NOT NULL, created REAL NOT NULL, email TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(credentials)")}
+        if "email" not in columns:
+            self._conn.execute("ALTER TABLE credentials ADD COLUMN email TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS credentials_user ON credentials (kind, user_handle)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS credentials_email ON credentials (kind, email)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS challenges (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._load()
+
+    # --- credentials ---
+    @timed("webauthn", "load")
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT credential_id, kind, user_handle, data, created, email FROM credentials ORDER BY created"
+        ).fetchall()
+        self._by_id, self._by_user, self._by_email = {}, {}, {}
+        for row in rows:
+            self._index(self._record(*row))
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self) -> None:
+        with self._lock:
+            if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self._load()
+
+    @staticmethod
+    def _record(credential_id: str, kind: str, user_handle: str | None, data: bytes, created: float,
+                email: str | None) -> dict:
+        return {
+            "credentialId": credential_id,
+            "kind": kind,
+            "userHandle": user_handle,
+            "email": email,
+            "data": json.loads(data) if kind == "simple" else bytes(data),
+            "created": created,
+            "descriptor": _descriptor(credential_id),
+        }
+
+    def _index(self, record: dict) -> None:
+        credential_id, kind = record["credentialId"], record["kind"]
+        previous = self._by_id.get(credential_id)
+        if previous is not None:
+            for index, key in ((self._by_user, previous["userHandle"]), (self._by_email, previous["email"])):
+                ids = index.get((previous["kind"], key), [])
+                if credential_id in ids:
+                    ids.remove(credential_id)
+        self._by_id[credential_id] = record
+        if record["userHandle"]:
+            self._by_user.setdefault((kind, record["userHandle"]), []).append(credential_id)
+        if record["email"]:
+            self._by_email.setdefault((kind, record["email"]), []).append(credential_id)
+
+    @timed("webauthn", "write")
+    def add_credential(self, credential_id: str, kind: str, user_handle: str | None, data,
+                       email: str | None = None) -> None:
+        """Store (or replace) a credential. `data` is JSON-able for "simple", bytes for "fido2"."""
+        raw = json.dumps(data, ensure_ascii=False).encode("utf-8") if kind == "simple" else bytes(data)
+        email = _email_key(email) or None
+        created = time()
+        with self._lock:
+            self._refresh()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO credentials (credential_id, kind, user_handle, data, created, email)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (credential_id, kind, user_handle, raw, created, email))
+            self._index(self._record(credential_id, kind, user_handle, raw, created, email))
+
+    def get_credential(self, credential_id: str) -> dict | None:
+        self._refresh()
+        return self._by_id.get(credential_id)
+
+    def credentials_for_user(self, kind: str, user_handle: str) -> list:
+        self._refresh()
+        with self._lock:
+            return [self._by_id[c] for c in self._by_user.get((kind, user_handle), ())]
+
+    def user_handle_for(self, kind: str, email: str) -> str | None:
+        """Handle of `email`'s existing credentials, so new passkeys join the same user."""
+        self._refresh()
+        with self._lock:
+            ids = self._by_email.get((kind, _email_key(email)))
+            return self._by_id[ids[-1]]["userHandle"] if ids else None
+
+    def allow_credentials(self, kind: str, user_handle: str | None = None, email: str | None = None) -> list:
+        """Pre-encoded allowCredentials descriptors for one user (by handle or email)."""
+        self._refresh()
+        with self._lock:
+            if user_handle:
+                ids = self._by_user.get((kind, user_handle), ())
+            else:
+                ids = self._by_email.get((kind, _email_key(email)), ())
+            return [self._by_id[c]["descriptor"] for c in ids]
+
+    # --- challenges ---
+    @timed("webauthn", "challenge_put")
+    def put_challenge(self, state: dict) -> str:
+        """Remember ceremony state for `challenge_ttl` seconds; returns its id."""
+        challenge_id = secrets.token_urlsafe(16)
+        now = time()
+        with self._lock:
+            self._conn.execute("DELETE FROM challenges WHERE expires < ?", (now,))
+            self._conn.execute("INSERT INTO challenges (id, data, expires) VALUES (?, ?, ?)",
+                               (challenge_id, json.dumps(state), now + self.challenge_ttl))
+        return challenge_id
+
+    @timed("webauthn", "challenge_pop")
+    def pop_challenge(self, challenge_id: str | None) -> dict | None:
+        """Consume a challenge; None if unknown, already used or expired."""
+        if not challenge_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "DELETE FROM challenges WHERE id = ? RETURNING data, expires", (challenge_id,)).fetchone()
+        if row is None or row[1] < time():
+            return None
+        return json.loads(row[0])
+
+
+def get_webauthn_store() -> WebAuthnStore:
+    return app_store("webauthn",
+                     lambda config: WebAuthnStore(Path(config.get("WEBAUTHN_DB_PATH") or WEBAUTHN_DB_PATH)),
+                     "WEBAUTHN_DB_PATH")
@@ -45,6 +45,16 @@ export const BiometricDialog: React.FC = () => {
     return bytes;
   };
 
+  // Scopes WebAuthn challenges to the signed-in user's passkeys
+  const userQuery = (): string => {
+    try {
+      const email = JSON.parse(sessionStorage.getItem("currentUser") || "null")?.email;
+      return email ? `?email=${encodeURIComponent(email)}` : "";
+    } catch {
+      return "";
+    }
+  };
+
   // Show immediately post-login
   useEffect(() => {
     const justLoggedIn = sessionStorage.getItem("justLoggedIn");
@@ -74,7 +84,7 @@ export const BiometricDialog: React.FC = () => {
         return;
       }
 
-      const challengeResp = await fetch("/webauthn/register-challenge");
+      const challengeResp = await fetch(`/webauthn/register-challenge${userQuery()}`);
       if (!challengeResp.ok) {
         throw new Error(`Challenge request failed: ${challengeResp.status}`);
       }
@@ -142,7 +152,7 @@ export const BiometricDialog: React.FC = () => {
         throw new Error("WebAuthn is not supported in this browser");
       }
 
-      const challengeResp = await fetch("/webauthn/authenticate-challenge");
+      const challengeResp = await fetch(`/webauthn/authenticate-challenge${userQuery()}`);
       if (!challengeResp.ok) {
         throw new Error(`Challenge request failed: ${challengeResp.status}`);
       }
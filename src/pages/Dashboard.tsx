@@ -35,11 +35,11 @@ const Dashboard: React.FC = () => {
   const [transactions, setTransactions] = useState<{ id: number; type: string; desc: string; amount: number; date: string }[]>([]);
   useEffect(() => {
     let active = true;
-    fetch("/transactions.json")
+    fetch("http://localhost:5000/transactions?limit=5")
       .then((r) => r.json())
-      .then((rows: { date: string; description: string; amount: number }[]) => {
+      .then((data: { transactions?: { date: string; description: string; amount: number }[] }) => {
         if (!active) return;
-        const mapped = (rows || []).slice(-5).map((r, idx) => ({
+        const mapped = (data.transactions || []).slice().reverse().map((r, idx) => ({
           id: idx + 1,
           type: r.amount >= 0 ? "Credit" : "Debit",
           desc: r.description,
@@ -12,7 +12,7 @@ import BotDetector from "@/components/BotDetector";
 // Replace direct JSON access with backend API endpoints
 const ACCOUNTS_API = "http://localhost:8000/accounts";
 
-type Account = { email: string; password: string; name: string; username: string };
+type Account = { email: string; password?: string; name: string; username: string; requiresCaptcha?: boolean };
 
 const passwordValid = (pwd: string) => {
   const hasLen = pwd.length >= 8;
@@ -50,8 +50,6 @@ const Login: React.FC = () => {
   // Captcha for new users
   const [captchaValue, setCaptchaValue] = useState("");
   const [captchaQuestion, setCaptchaQuestion] = useState<string>("");
-  // Force captcha for specific users (from public/new-accounts.json)
-  const [newAccountEmails, setNewAccountEmails] = useState<string[]>([]);
   const [captchaMode, setCaptchaMode] = useState<'signup' | 'login'>('signup');
 
   const generateCaptcha = () => {
@@ -111,29 +109,15 @@ const Login: React.FC = () => {
         toast({ title: "Error", description: "Could not load accounts from server.", variant: "destructive" });
       }
     };
-    const loadNewAccounts = async () => {
-      try {
-        const res = await fetch("/new-accounts.json", { cache: 'no-store' });
-        if (!res.ok) return; // non-fatal
-        const data = await res.json();
-        if (Array.isArray(data)) {
-          setNewAccountEmails(
-            data
-              .map((x: any) => (typeof x?.email === 'string' ? x.email.toLowerCase() : null))
-              .filter((x: string | null): x is string => !!x)
-          );
-        }
-      } catch (e) {
-        // Non-blocking if this fails
-        console.warn('Could not load new-accounts.json', e);
-      }
-    };
     loadAccounts();
-    loadNewAccounts();
     // init captcha question
     generateCaptcha();
   }, []);
 
+  // The accounts API flags accounts that must solve a captcha on every login
+  const requiresCaptcha = (addr: string) =>
+    !!accounts.find((a) => a.email.toLowerCase() === addr.toLowerCase())?.requiresCaptcha;
+
   const saveNewAccount = async (account: Account): Promise<boolean> => {
     try {
       const res = await fetch(ACCOUNTS_API, {
@@ -224,7 +208,7 @@ const Login: React.FC = () => {
     }
 
     // If this email is flagged as a new account, enforce captcha on every login
-    if (newAccountEmails.includes(email.toLowerCase())) {
+    if (requiresCaptcha(email)) {
       setCaptchaMode('login');
       generateCaptcha();
       setLoginStep('captcha');
@@ -372,7 +356,7 @@ const Login: React.FC = () => {
     }
 
     // Known email but flagged as "new account" must solve captcha on every login
-    if (newAccountEmails.includes(email.toLowerCase())) {
+    if (requiresCaptcha(email)) {
       setCaptchaMode('login');
       generateCaptcha();
       setLoginStep('captcha');
@@ -470,8 +454,7 @@ const Login: React.FC = () => {
           const getData = await getRes.json();
           setAccounts(Array.isArray(getData.accounts) ? getData.accounts : []);
         } catch {
-          // If refresh fails, at least update local state
-          setAccounts(prev => prev.map(a => a.email.toLowerCase() === email.toLowerCase() ? { ...a, password: newPassword } : a));
+          // Non-fatal: the account list carries no passwords
         }
         // Pre-fill password field with new password for convenience
         setPassword(newPassword);
@@ -489,6 +472,20 @@ const Login: React.FC = () => {
     }
   };
 
+  // Passwords are only stored hashed, so the server does the comparison
+  const checkPassword = async (): Promise<boolean> => {
+    try {
+      const res = await fetch(`${ACCOUNTS_API}/login`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ email, password }),
+      });
+      return res.ok;
+    } catch {
+      return false;
+    }
+  };
+
   const handlePasswordOrOtpVerification = async () => {
 
     setLoading(true);
@@ -502,7 +499,7 @@ const Login: React.FC = () => {
     }
 
     if (loginStep === 'password' && !forgotMode) {
-    if (password === found.password) {
+    if (await checkPassword()) {
         await logFingerprintForSecurity('login_success', email);
         // Store and check location drift (non-blocking)
         try {
@@ -553,7 +550,7 @@ const Login: React.FC = () => {
           body: JSON.stringify({ email, otp }),
         });
         const data = await res.json();
-    if (res.ok && data.valid && password === found.password) {
+    if (res.ok && data.valid && (await checkPassword())) {
           await logFingerprintForSecurity('login_success_via_otp', email);
           // Store and check location drift (non-blocking)
           try {
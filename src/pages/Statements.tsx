@@ -1,4 +1,4 @@
-import React, { useMemo, useState, useEffect } from "react";
+import React, { useMemo, useState, useEffect, useRef } from "react";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Label } from "@/components/ui/label";
@@ -11,11 +11,13 @@ import { useSearch } from "@/hooks/useSearch";
 import { useNavigate } from "react-router-dom";
 
 type Row = { date: string; description: string; amount: number };
+type Page = { transactions?: Row[]; total?: number };
 
-function toCSV(rows: Row[]) {
-	const header = ["Date", "Description", "Amount"].join(",");
-	const lines = rows.map((r) => [r.date, r.description, r.amount].join(","));
-	return [header, ...lines].join("\n");
+// The server's maximum page size; further pages are fetched on demand
+const PAGE_SIZE = 500;
+
+function isoDate(d: Date) {
+	return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
 }
 
 const Statements: React.FC = () => {
@@ -27,57 +29,80 @@ const Statements: React.FC = () => {
 	const { query } = useSearch();
 	const navigate = useNavigate();
 
+	// Date range, type and text filters run on the server (GET /transactions). The
+	// text filter matches descriptions and, for digit searches, dates and amounts.
+	const filterParams = useMemo(() => {
+		const params = new URLSearchParams();
+		if (fromDate) params.set("from", isoDate(fromDate));
+		if (toDate) params.set("to", isoDate(toDate));
+		if (type !== "all") params.set("type", type);
+		if (query.trim()) params.set("q", query.trim());
+		// Pages come newest first; an oldest-first date sort has to start from the other end
+		if (sortKey === "date" && asc) params.set("order", "asc");
+		return params;
+	}, [fromDate, toDate, type, query, sortKey, asc]);
+
 	const [all, setAll] = useState<Row[]>([]);
+	const [total, setTotal] = useState(0);
+	const [loading, setLoading] = useState(false);
+	// The filters the loaded rows belong to; a page that arrives after they change is dropped
+	const current = useRef(filterParams);
+
+	const fetchPage = (offset: number): Promise<Page> =>
+		fetch(`http://localhost:5000/transactions?${filterParams}&offset=${offset}&limit=${PAGE_SIZE}`).then((r) =>
+			r.json()
+		);
+
 	useEffect(() => {
-		let active = true;
-		fetch("/transactions.json")
-			.then((r) => r.json())
-			.then((data: Row[]) => {
-				if (!active) return;
-				const cleaned = (Array.isArray(data) ? data : []).filter(
-					(d): d is Row =>
-						!!d && typeof d.date === "string" && typeof d.description === "string" && typeof d.amount === "number"
-				);
-				setAll(cleaned);
+		current.current = filterParams;
+		setAll([]);
+		setTotal(0);
+		setLoading(true);
+		fetchPage(0)
+			.then((data) => {
+				if (current.current !== filterParams) return;
+				const page = Array.isArray(data.transactions) ? data.transactions : [];
+				setAll(page);
+				setTotal(data.total ?? page.length);
+			})
+			.catch(() => {})
+			.finally(() => {
+				if (current.current === filterParams) setLoading(false);
+			});
+	}, [filterParams]);
+
+	const loadMore = () => {
+		const params = filterParams;
+		setLoading(true);
+		fetchPage(all.length)
+			.then((data) => {
+				if (current.current !== params) return;
+				const page = Array.isArray(data.transactions) ? data.transactions : [];
+				setAll((prev) => [...prev, ...page]);
+				setTotal(data.total ?? total);
 			})
-			.catch(() => setAll([]));
-		return () => {
-			active = false;
-		};
-	}, []);
+			.catch(() => {})
+			.finally(() => {
+				if (current.current === params) setLoading(false);
+			});
+	};
 
 	const rows = useMemo(() => {
-		const filtered = all.filter((r) => {
-			const d = new Date(r.date + "T00:00:00");
-			if (fromDate && d < new Date(fromDate.toDateString())) return false;
-			if (toDate && d > new Date(toDate.toDateString())) return false;
-			if (type === "credit" && r.amount <= 0) return false;
-			if (type === "debit" && r.amount >= 0) return false;
-			const q = query.trim().toLowerCase();
-			if (
-				q &&
-				!(r.description.toLowerCase().includes(q) || r.date.includes(q) || String(r.amount).includes(q))
-			)
-				return false;
-			return true;
-		});
-		return filtered.sort((a, b) => {
+		return [...all].sort((a, b) => {
 			const x = a[sortKey];
 			const y = b[sortKey];
 			const dir = asc ? 1 : -1;
 			if (typeof x === "number" && typeof y === "number") return (x - y) * dir;
 			return ("" + x).localeCompare("" + y) * dir;
 		});
-	}, [all, sortKey, asc, fromDate, toDate, type, query]);
+	}, [all, sortKey, asc]);
 
+	// Streamed by the backend, so the whole filtered range downloads, not just this page
 	const downloadCSV = () => {
-		const blob = new Blob([toCSV(rows)], { type: "text/csv;charset=utf-8;" });
-		const url = URL.createObjectURL(blob);
 		const a = document.createElement("a");
-		a.href = url;
+		a.href = `http://localhost:5000/statements/export?${filterParams}&format=csv`;
 		a.download = "statements.csv";
 		a.click();
-		URL.revokeObjectURL(url);
 	};
 
 	return (
@@ -221,6 +246,17 @@ const Statements: React.FC = () => {
 							</tbody>
 						</table>
 					</div>
+					<div className="flex items-center justify-between mt-3 text-xs text-muted-foreground">
+						<span>
+							Showing {all.length} of {total} transactions
+							{all.length < total && sortKey !== "date" && " (sorted within the loaded rows)"}
+						</span>
+						{all.length < total && (
+							<Button variant="outline" size="sm" onClick={loadMore} disabled={loading}>
+								{loading ? "Loading…" : "Load more"}
+							</Button>
+						)}
+					</div>
 				</CardContent>
 			</Card>
 		</div>